@@ -0,0 +1,90 @@
+"""
+Copyright 2019 Alexander Meulemans
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Benchmark of the training throughput (steps/sec) of the networks in
+joao/bionets on MNIST batches, for the configurations of joao/etc and for
+a deeper network given by config['layers'].
+"""
+import sys
+sys.path.append('.')
+import joao.bionets as bionets
+import torch
+import numpy as np
+import pandas as pd
+import random
+import time
+
+seed = 47
+torch.manual_seed(seed)
+np.random.seed(seed)
+random.seed(seed)
+
+# ======== User variables ============
+batch_size = 64
+nb_steps = 50
+nb_warmup_steps = 2
+# use random images instead of MNIST, e.g. when MNIST can't be downloaded
+use_random_data = False
+device = torch.device('cpu')
+
+base_config = {'w-init': 0.1,
+               'b-init': 1,
+               'eta1': 0.05,
+               'eta2': 0.05,
+               'eta3': 0.05,
+               'eta-b1': 0.01,
+               'eta-b2': 0.01,
+               'diff-tp': True,
+               'lambda': 1,
+               'batch-size': batch_size,
+               'device': device}
+benchmarks = [('FA', bionets.FANet, {'n1': 1000, 'n2': 1000}, nb_steps),
+              ('TP', bionets.TPNet, {'n1': 1000, 'n2': 1000}, nb_steps),
+              ('TP (difference targets off)', bionets.TPNet,
+               {'n1': 1000, 'n2': 1000, 'diff-tp': False}, nb_steps),
+              ('FA 5 hidden layers', bionets.FANet,
+               {'layers': [1000] * 5, 'eta': [0.05] * 6}, nb_steps),
+              ('CAPSULE', bionets.CapsuleNetBP, {'n1': 784, 'n2': 784},
+               nb_steps)]
+
+# ======== Load data ============
+nb_batches = nb_warmup_steps + nb_steps
+if use_random_data:
+    images = torch.rand(nb_batches, batch_size, 1, 28, 28)
+    labels = torch.randint(0, 10, (nb_batches, batch_size))
+else:
+    from torchvision import datasets, transforms
+    train_loader = torch.utils.data.DataLoader(
+        datasets.MNIST('./data', train=True, download=True,
+                       transform=transforms.ToTensor()),
+        batch_size=batch_size, shuffle=True, drop_last=True)
+    images = torch.empty(nb_batches, batch_size, 1, 28, 28)
+    labels = torch.empty(nb_batches, batch_size, dtype=torch.long)
+    for i, (data, target) in zip(range(nb_batches), train_loader):
+        images[i] = data
+        labels[i] = target
+images, labels = images.to(device), labels.to(device)
+
+# ======== Benchmark ============
+results = pd.DataFrame(columns=['steps_per_sec', 'samples_per_sec'])
+for name, net_class, config_changes, steps in benchmarks:
+    config = dict(base_config, **config_changes)
+    torch.manual_seed(seed)
+    model = net_class(config)
+    for i in range(nb_warmup_steps):
+        model.forward(images[i])
+        model.learn(config, labels[i])
+    start = time.perf_counter()
+    for i in range(nb_warmup_steps, nb_warmup_steps + steps):
+        model.forward(images[i])
+        model.learn(config, labels[i])
+    elapsed = time.perf_counter() - start
+    results.loc[name] = [steps / elapsed, steps * batch_size / elapsed]
+print('bionets training throughput (batch size {})'.format(batch_size))
+print(results.to_string(float_format='{:.4g}'.format))
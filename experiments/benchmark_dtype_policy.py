@@ -0,0 +1,156 @@
+"""
+Copyright 2019 Alexander Meulemans
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Benchmark of the dtype policies of the networks (see
+Network.set_dtype_policy):
+- training throughput (samples/sec) and loss of a target propagation
+network, and the deviation of its test outputs from the float64 network
+after the same updates
+- drift of the inverses that InvertibleNetwork tracks with the
+Sherman-Morrison formula, measured as ||B*[W; W_tilde] - I||_F
+"""
+import sys
+sys.path.append('.')
+from layers.target_prop_layer import TargetPropInputLayer, \
+    TargetPropLinearOutputLayer, TargetPropLeakyReluLayer
+from networks.target_prop_network import TargetPropNetwork
+from layers.invertible_layer import InvertibleInputLayer, \
+    InvertibleLeakyReluLayer, InvertibleLinearOutputLayer
+from networks.invertible_network import InvertibleNetwork
+import torch
+import numpy as np
+import pandas as pd
+import random
+import time
+from tensorboardX import SummaryWriter
+
+seed = 47
+torch.manual_seed(seed)
+np.random.seed(seed)
+random.seed(seed)
+
+# ======== User variables ============
+policies = ['float64', 'mixed', 'float32', 'bfloat16']
+n = 64
+nb_hidden_layers = 4
+nb_batches = 50
+batch_size = 64
+learning_rate = 1e-4
+learning_rate_backward = 1e-4
+n_invertible = 16
+nb_inverse_updates = 2000
+inverse_log_interval = 500
+learning_rate_invertible = 0.001
+writer = SummaryWriter(log_dir='../logs/benchmark_dtype_policy/')
+
+
+def create_TP_network(dtype_policy):
+    torch.manual_seed(seed)
+    layers = [TargetPropInputLayer(layer_dim=n, out_dim=n, writer=writer,
+                                   name='input_layer')]
+    for i in range(nb_hidden_layers):
+        layers.append(TargetPropLeakyReluLayer(negative_slope=0.35,
+                                               in_dim=n, layer_dim=n,
+                                               out_dim=n, writer=writer,
+                                               name='hidden_layer{}'.format(i)))
+    layers.append(TargetPropLinearOutputLayer(in_dim=n, layer_dim=n,
+                                              writer=writer, step_size=0.01,
+                                              name='output_layer'))
+    # well-conditioned (orthogonal) random weights, such that the targets
+    # propagated through the inverses stay bounded
+    for layer in layers[1:]:
+        Q, R = torch.linalg.qr(layer.forward_weights)
+        layer.set_forward_parameters(Q, layer.forward_bias)
+    network = TargetPropNetwork(layers, log=False)
+    network.set_dtype_policy(dtype_policy)
+    return network
+
+
+def create_invertible_network(dtype_policy):
+    torch.manual_seed(seed)
+    layers = [InvertibleInputLayer(layer_dim=n_invertible,
+                                   out_dim=n_invertible, loss_function='mse',
+                                   name='input_layer', writer=writer),
+              InvertibleLeakyReluLayer(negative_slope=0.35,
+                                       in_dim=n_invertible,
+                                       layer_dim=n_invertible,
+                                       out_dim=n_invertible,
+                                       loss_function='mse',
+                                       name='hidden_layer', writer=writer),
+              InvertibleLinearOutputLayer(in_dim=n_invertible,
+                                          layer_dim=n_invertible,
+                                          step_size=0.01,
+                                          name='output_layer',
+                                          writer=writer)]
+    network = InvertibleNetwork(layers, log=False)
+    network.set_dtype_policy(dtype_policy)
+    return network
+
+
+# ======== Create datasets ============
+input_dataset = torch.randn(nb_batches, batch_size, n, 1)
+input_test = torch.randn(batch_size, n, 1)
+network = create_TP_network('float64')
+output_dataset = torch.empty(nb_batches, batch_size, n, 1)
+for i in range(nb_batches):
+    network.propagate_forward(input_dataset[i])
+    output_dataset[i] = network.layers[-1].forward_output.float() + \
+        0.1 * torch.randn(batch_size, n, 1)
+input_dataset_invertible = torch.randn(nb_inverse_updates, 1,
+                                       n_invertible, 1)
+network = create_invertible_network('float64')
+output_dataset_invertible = torch.empty(nb_inverse_updates, 1,
+                                        n_invertible, 1)
+for i in range(nb_inverse_updates):
+    network.propagate_forward(input_dataset_invertible[i])
+    output_dataset_invertible[i] = \
+        network.layers[-1].forward_output.float() + \
+        0.1 * torch.randn(1, n_invertible, 1)
+
+# ======== Throughput and accuracy ============
+results = pd.DataFrame(columns=['samples_per_sec', 'final_loss',
+                                'test_output_deviation'])
+reference_output = None
+for policy in policies:
+    network = create_TP_network(policy)
+    losses = []
+    start = time.perf_counter()
+    for i in range(nb_batches):
+        network.propagate_forward(input_dataset[i])
+        losses.append(float(network.loss(output_dataset[i])))
+        network.propagate_backward(output_dataset[i])
+        network.compute_gradients()
+        network.update_parameters(learning_rate, learning_rate_backward)
+    elapsed = time.perf_counter() - start
+    test_output = network.predict(input_test).double()
+    if reference_output is None:
+        reference_output = test_output
+    deviation = float(torch.max(torch.abs(test_output - reference_output)))
+    results.loc[policy] = [nb_batches * batch_size / elapsed,
+                           np.mean(losses[-10:]), deviation]
+print('Target propagation network ({} hidden layers of size {})'.format(
+    nb_hidden_layers, n))
+print(results.to_string(float_format='{:.4g}'.format))
+
+# ======== Inverse drift ============
+drift = pd.DataFrame(columns=policies)
+for policy in policies:
+    network = create_invertible_network(policy)
+    input_layer, hidden_layer = network.layers[0], network.layers[1]
+    for i in range(nb_inverse_updates):
+        network.propagate_forward(input_dataset_invertible[i])
+        network.propagate_backward(output_dataset_invertible[i])
+        network.compute_gradients()
+        network.update_parameters(learning_rate_invertible)
+        if (i + 1) % inverse_log_interval == 0:
+            drift.loc[i + 1, policy] = float(
+                input_layer.check_inverse(hidden_layer))
+print('Inverse drift ||B*[W; W_tilde] - I||_F of the input layer after '
+      'k Sherman-Morrison updates')
+print(drift.astype(float).to_string(float_format='{:.2e}'.format))
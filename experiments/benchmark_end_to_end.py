@@ -0,0 +1,308 @@
+"""
+Copyright 2019 Alexander Meulemans
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+End-to-end training throughput of the workloads of the thesis experiments:
+- the toy regression with 4 hidden layers (toyexample_DTP_4layers.py)
+- the combined toy example with TP, DTP, original TP, original DTP and BP
+(Combined_toy_example_final.py)
+- MNIST with an invertible TP network with a capsule output layer
+Each workload runs a fixed number of training steps with logging on and
+off, in a separate process such that its peak RSS can be measured. The
+samples/sec, peak RSS and the time per step spent in the forward pass, the
+backward propagation of the targets, the gradient computation, the
+parameter update and the logging (losses, network.save_state) are reported
+and saved as JSON in benchmark_dir. A run is only reported if its training
+loss is finite and decreasing (see check_training).
+"""
+import sys
+sys.path.append('.')
+from layers.layer import InputLayer, LeakyReluLayer, LinearOutputLayer
+from layers.target_prop_layer import TargetPropInputLayer, \
+    TargetPropLeakyReluLayer, TargetPropLinearOutputLayer
+from layers.DTP_layer import DTPInputLayer, DTPLeakyReluLayer, \
+    DTPLinearOutputLayer
+from layers.original_TP_layer import OriginalTPInputLayer, \
+    OriginalTPLeakyReluLayer, OriginalTPLinearOutputLayer
+from layers.original_DTP_layer import OriginalDTPInputLayer, \
+    OriginalDTPLeakyReluLayer, OriginalDTPLinearOutputLayer
+from layers.invertible_layer import InvertibleInputLayer, \
+    InvertibleLeakyReluLayer, InvertibleCapsuleOutputLayer
+from networks.network import Network
+from networks.target_prop_network import TargetPropNetwork
+from networks.invertible_network import InvertibleNetwork
+from optimizers.optimizers import SGD, SGDbidirectional, SGDInvertible
+from utils.create_datasets import GenerateDatasetFromModel
+from utils.mnist_store import convert_mnist, MNISTStore
+from utils import benchmark
+from utils.helper_classes import NetworkError
+import utils.helper_functions as hf
+import multiprocessing
+import torch
+import numpy as np
+import pandas as pd
+import random
+from tensorboardX import SummaryWriter
+
+seed = 32
+
+# ======== User variables ============
+nb_steps_toy = 200
+nb_steps_mnist = 200
+nb_warmup_steps = 5
+# like the experiment scripts, training is restarted from a new random
+# initialization (the next seed) when it fails, e.g. due to NaNs
+nb_retries = 5
+batch_size_toy = 32
+n = 6
+distance = 8.
+# the MNIST network has layers of size 784 (the GN diagnostics of
+# InvertibleNetwork need square layers) and is trained with batch size 1
+# scale of the initial forward weights of the MNIST network (random
+# invertible matrices with entries of unit variance), such that the capsules
+# of the output layer are not saturated and the capsule loss has a gradient
+init_weight_scale_mnist = 0.01
+learning_rate_mnist = 0.0003
+# use random images in [0, 1] instead of MNIST, e.g. when MNIST can't be
+# downloaded. The images are noisy copies of a random prototype per class,
+# such that the network can learn them.
+use_random_data = False
+benchmark_dir = '../logs/benchmarks/'
+log_dir = '../logs/benchmark_end_to_end/'
+phases = ['forward', 'backward_targets', 'gradients', 'update', 'logging']
+
+# toy example families: (input layer, hidden layer, output layer)
+toy_families = {
+    'TP': (TargetPropInputLayer, TargetPropLeakyReluLayer,
+           TargetPropLinearOutputLayer),
+    'DTP': (DTPInputLayer, DTPLeakyReluLayer, DTPLinearOutputLayer),
+    'originalTP': (OriginalTPInputLayer, OriginalTPLeakyReluLayer,
+                   OriginalTPLinearOutputLayer),
+    'originalDTP': (OriginalDTPInputLayer, OriginalDTPLeakyReluLayer,
+                    OriginalDTPLinearOutputLayer)}
+# toy workloads: (family, number of hidden layers, learning rate, backward
+# learning rate, randomize), with the settings of the experiment scripts
+toy_workloads = {
+    'toy_TP_4layers': ('TP', 4, 0.0001, 0.005, True),
+    'combined_toy_TP': ('TP', 1, 0.09, 0.08, False),
+    'combined_toy_DTP': ('DTP', 1, 0.1, 0.05, False),
+    'combined_toy_originalTP': ('originalTP', 1, 0.01, 0.01, False),
+    'combined_toy_originalDTP': ('originalDTP', 1, 0.1, 0.01, False),
+    'combined_toy_BP': ('BP', 1, 0.01, None, False)}
+workloads = list(toy_workloads) + ['mnist_capsule_invertible_TP']
+
+
+def create_true_network(nb_hidden_layers, writer):
+    layers = [InputLayer(layer_dim=n, writer=writer, debug_mode=False)]
+    for i in range(nb_hidden_layers):
+        layers.append(LeakyReluLayer(negative_slope=0.35, in_dim=n,
+                                     layer_dim=n, writer=writer,
+                                     debug_mode=False))
+    layers.append(LinearOutputLayer(in_dim=n, layer_dim=n,
+                                    loss_function='mse', writer=writer,
+                                    debug_mode=False))
+    return Network(layers, log=False)
+
+
+def create_toy_workload(family, nb_hidden_layers, learning_rate,
+                        learning_rate_backward, randomize, log, nb_steps):
+    """ Network, optimizer and training batches of a toy example, with the
+    forward weights initialized in a neighbourhood of the weights of the
+    true network."""
+    writer = SummaryWriter(log_dir=log_dir + '{}_{}layers'.format(
+        family, nb_hidden_layers))
+    true_network = create_true_network(nb_hidden_layers, writer)
+    generator = GenerateDatasetFromModel(true_network)
+    input_dataset, output_dataset = generator.generate(nb_steps,
+                                                       batch_size_toy)
+    if family == 'BP':
+        network = create_true_network(nb_hidden_layers, writer)
+        network.set_log(log)
+        optimizer = SGD(network=network, threshold=1e-7,
+                        init_learning_rate=learning_rate, tau=100,
+                        final_learning_rate=learning_rate / 5.)
+    else:
+        input_class, hidden_class, output_class = toy_families[family]
+        layers = [input_class(layer_dim=n, out_dim=n, writer=writer,
+                              debug_mode=False, name='input_layer')]
+        for i in range(nb_hidden_layers):
+            layers.append(hidden_class(negative_slope=0.35, in_dim=n,
+                                       layer_dim=n, out_dim=n, writer=writer,
+                                       debug_mode=False,
+                                       name='hidden_layer{}'.format(i)))
+        layers.append(output_class(in_dim=n, layer_dim=n, step_size=0.1,
+                                   writer=writer, debug_mode=False,
+                                   name='output_layer'))
+        network = TargetPropNetwork(layers, randomize=randomize, log=log)
+        optimizer = SGDbidirectional(
+            network=network, threshold=1e-7, init_learning_rate=learning_rate,
+            tau=100, final_learning_rate=learning_rate / 5.,
+            init_learning_rate_backward=learning_rate_backward,
+            final_learning_rate_backward=learning_rate_backward / 5.)
+    for layer, true_layer in zip(network.layers[1:], true_network.layers[1:]):
+        layer.set_forward_parameters(
+            hf.get_invertible_neighbourhood_matrix(
+                true_layer.forward_weights, distance), layer.forward_bias)
+    batches = [(input_dataset[i], output_dataset[i])
+               for i in range(nb_steps)]
+    return network, optimizer, batches
+
+
+def create_mnist_workload(log, nb_steps):
+    writer = SummaryWriter(log_dir=log_dir + 'mnist_capsule_invertible_TP')
+    n_mnist = 28 * 28
+    layers = [InvertibleInputLayer(layer_dim=n_mnist, out_dim=n_mnist,
+                                   writer=writer, name='input_layer',
+                                   debug_mode=False),
+              InvertibleLeakyReluLayer(negative_slope=0.1, in_dim=n_mnist,
+                                       layer_dim=n_mnist, out_dim=n_mnist,
+                                       writer=writer, name='hidden_layer',
+                                       debug_mode=False),
+              InvertibleCapsuleOutputLayer(in_dim=n_mnist, layer_dim=n_mnist,
+                                           nb_classes=10, writer=writer,
+                                           step_size=0.01,
+                                           name='output_layer',
+                                           debug_mode=False)]
+    for layer in layers[1:]:
+        layer.set_forward_parameters(
+            init_weight_scale_mnist * layer.forward_weights,
+            layer.forward_bias)
+    network = InvertibleNetwork(layers, log=log)
+    optimizer = SGDInvertible(network=network, threshold=1e-7,
+                              init_step_size=0.01, tau=100,
+                              final_step_size=0.001,
+                              learning_rate=learning_rate_mnist)
+    if use_random_data:
+        labels = torch.randint(0, 10, (nb_steps,))
+        prototypes = torch.rand(10, n_mnist, 1)
+        images = (0.5 * prototypes[labels] +
+                  0.5 * torch.rand(nb_steps, n_mnist, 1)).unsqueeze(1)
+        targets = torch.zeros(nb_steps, 1, 10, 1)
+        targets[torch.arange(nb_steps), 0, labels, 0] = 1.
+    else:
+        convert_mnist(root='./data', store_dir='./data/mnist_store')
+        loader = MNISTStore('./data/mnist_store', train=True, batch_size=1)
+        images = torch.empty(nb_steps, 1, n_mnist, 1)
+        targets = torch.empty(nb_steps, 1, 10, 1)
+        for i, (data, target) in zip(range(nb_steps), loader):
+            images[i] = data
+            targets[i] = target
+    batches = [(images[i], targets[i]) for i in range(nb_steps)]
+    return network, optimizer, batches
+
+
+def train_step(network, optimizer, input_batch, target, timer):
+    """ One step of SGD.step, with the time of each phase recorded in
+    timer."""
+    with timer.phase('forward'):
+        network.propagate_forward(input_batch)
+    with timer.phase('backward_targets'):
+        network.propagate_backward(target)
+    with timer.phase('gradients'):
+        network.compute_gradients()
+    with timer.phase('update'):
+        if isinstance(optimizer, SGDbidirectional):
+            network.update_parameters(optimizer.learning_rate,
+                                      optimizer.learning_rate_backward)
+        else:
+            network.update_parameters(optimizer.learning_rate)
+    with timer.phase('logging'):
+        optimizer.save_results(target)
+    optimizer.global_step += 1
+
+
+def check_training(losses):
+    """ Raise a NetworkError if the training losses are not finite or
+    did not decrease from the first to the last quarter of the steps, as the
+    timings of a network that does not train (e.g. with saturated outputs
+    and zero gradients) are not representative."""
+    if not bool(torch.all(torch.isfinite(losses))):
+        raise NetworkError('The training loss is not finite')
+    quarter = max(1, len(losses) // 4)
+    first_loss = float(torch.mean(losses[:quarter]))
+    last_loss = float(torch.mean(losses[-quarter:]))
+    if not last_loss < first_loss:
+        raise NetworkError('The training loss did not decrease ({:.4g} in '
+                           'the first quarter of the steps, {:.4g} in the '
+                           'last)'.format(first_loss, last_loss))
+    return first_loss, last_loss
+
+
+def run_workload(workload, log, seed):
+    torch.manual_seed(seed)
+    np.random.seed(seed)
+    random.seed(seed)
+    if workload == 'mnist_capsule_invertible_TP':
+        nb_steps = nb_steps_mnist
+        network, optimizer, batches = create_mnist_workload(
+            log, nb_warmup_steps + nb_steps)
+    else:
+        nb_steps = nb_steps_toy
+        network, optimizer, batches = create_toy_workload(
+            *toy_workloads[workload], log=log,
+            nb_steps=nb_warmup_steps + nb_steps)
+    timer = benchmark.PhaseTimer()
+    try:
+        for input_batch, target in batches[:nb_warmup_steps]:
+            train_step(network, optimizer, input_batch, target, timer)
+        timer.reset()
+        for input_batch, target in batches[nb_warmup_steps:]:
+            train_step(network, optimizer, input_batch, target, timer)
+    finally:
+        network.writer.close()
+    first_loss, last_loss = check_training(optimizer.batch_losses)
+    batch_size = batches[0][0].shape[0]
+    result = {'workload': workload, 'log': log, 'seed': seed,
+              'nb_steps': nb_steps, 'batch_size': batch_size,
+              'samples_per_sec': nb_steps * batch_size / timer.total_time(),
+              'peak_rss_MB': benchmark.get_peak_rss() / 2.**20,
+              'first_loss': first_loss, 'last_loss': last_loss}
+    for phase in phases:
+        result[phase + '_ms'] = 1e3 * timer.times[phase] / nb_steps
+    return result
+
+
+def run_workload_process(workload, log, queue):
+    for i in range(nb_retries + 1):
+        try:
+            queue.put(run_workload(workload, log, seed + i))
+            return
+        except Exception as e:
+            print('Training failed')
+            print('Occurred error:')
+            print(e)
+            error = '{}: {}'.format(type(e).__name__, e)
+    queue.put({'workload': workload, 'log': log, 'error': error})
+
+
+if __name__ == '__main__':
+    # each workload runs in a fresh process, such that the peak RSS is
+    # measured per workload
+    context = multiprocessing.get_context('fork')
+    results = []
+    for workload in workloads:
+        for log in [False, True]:
+            queue = context.Queue()
+            process = context.Process(target=run_workload_process,
+                                      args=(workload, log, queue))
+            process.start()
+            results.append(queue.get())
+            process.join()
+            print('{} (log={}) done'.format(workload, log))
+
+    commit = benchmark.get_git_commit()
+    path = benchmark_dir + 'end_to_end_{}.json'.format(
+        commit[:10] if commit is not None else 'unknown')
+    benchmark.save_benchmark(results, path, nb_steps_toy=nb_steps_toy,
+                             nb_steps_mnist=nb_steps_mnist,
+                             nb_warmup_steps=nb_warmup_steps,
+                             use_random_data=use_random_data)
+    print('Saved the results in {}'.format(path))
+    pd.set_option('display.width', 200)
+    print(pd.DataFrame(results).set_index(['workload', 'log']).to_string(
+        float_format='{:.3g}'.format))
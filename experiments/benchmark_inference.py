@@ -0,0 +1,96 @@
+"""
+Copyright 2019 Alexander Meulemans
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Inference throughput of a 784-1000-10 leaky ReLU network with Network.predict
+and with the frozen network (see Network.freeze), for a sweep of batch
+sizes, and of the frozen network called concurrently from several threads.
+The results are saved as JSON in benchmark_dir.
+"""
+import sys
+sys.path.append('.')
+from layers.layer import InputLayer, LeakyReluLayer, SoftmaxOutputLayer
+from networks.network import Network
+from utils import benchmark
+from concurrent.futures import ThreadPoolExecutor
+import torch
+import numpy as np
+import pandas as pd
+import random
+from tensorboardX import SummaryWriter
+
+seed = 47
+torch.manual_seed(seed)
+np.random.seed(seed)
+random.seed(seed)
+
+# ======== User variables ============
+batch_sizes = [1, 32, 256, 2048]
+nb_threads = [1, 2, 4]
+nb_repeats = 50
+max_time = 2.
+benchmark_dir = '../logs/benchmarks/'
+writer = SummaryWriter(log_dir='../logs/benchmark_inference/')
+
+# ======== Create network ============
+network = Network([InputLayer(layer_dim=784, writer=writer, debug_mode=False),
+                   LeakyReluLayer(negative_slope=0.1, in_dim=784,
+                                  layer_dim=1000, writer=writer,
+                                  debug_mode=False),
+                   SoftmaxOutputLayer(in_dim=1000, layer_dim=10,
+                                      loss_function='crossEntropy',
+                                      writer=writer, debug_mode=False)],
+                  log=False)
+network.eval()
+frozen_network = network.freeze()
+
+# ======== Benchmark ============
+results = []
+for batch_size in batch_sizes:
+    input_batch = torch.randn(batch_size, 784, 1)
+    difference = torch.max(torch.abs(network.predict(input_batch) -
+                                     frozen_network.predict(input_batch)))
+    for name, predict in [('Network.predict', network.predict),
+                          ('FrozenNetwork.predict', frozen_network.predict)]:
+        result = benchmark.time_call(lambda: predict(input_batch),
+                                     nb_repeats=nb_repeats, max_time=max_time)
+        result.update({'predictor': name, 'batch_size': batch_size,
+                       'nb_threads': 1,
+                       'samples_per_sec': batch_size /
+                       result['latency_median'],
+                       'max_difference': float(difference)})
+        results.append(result)
+    # concurrent callers of the frozen network, each predicting a batch
+    for threads in nb_threads[1:]:
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            def predict_concurrently():
+                futures = [executor.submit(frozen_network.predict,
+                                           input_batch)
+                           for i in range(threads)]
+                for future in futures:
+                    future.result()
+            result = benchmark.time_call(predict_concurrently,
+                                         nb_repeats=nb_repeats,
+                                         max_time=max_time)
+        result.update({'predictor': 'FrozenNetwork.predict',
+                       'batch_size': batch_size, 'nb_threads': threads,
+                       'samples_per_sec': threads * batch_size /
+                       result['latency_median']})
+        results.append(result)
+    print('batch size {} done'.format(batch_size))
+
+commit = benchmark.get_git_commit()
+path = benchmark_dir + 'inference_{}.json'.format(
+    commit[:10] if commit is not None else 'unknown')
+benchmark.save_benchmark(results, path, batch_sizes=batch_sizes,
+                         nb_threads=nb_threads)
+print('Saved the results in {}'.format(path))
+pd.set_option('display.width', 200)
+print(pd.DataFrame(results).pivot_table(
+    index='batch_size', columns=['predictor', 'nb_threads'],
+    values='samples_per_sec').to_string(float_format='{:.4g}'.format))
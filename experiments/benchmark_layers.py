@@ -0,0 +1,187 @@
+"""
+Copyright 2019 Alexander Meulemans
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Micro-benchmark of the layer methods of every layer family (BP, TP, DTP,
+MTP, original TP/DTP, invertible TP and modified TP). For each family, a
+network (input layer, leaky ReLU hidden layer, linear output layer) of the
+corresponding network type is created, and the propagate_forward,
+propagate_backward, compute_forward_gradients, update_forward_parameters
+and update_backward_parameters methods of its hidden layer are timed for
+a sweep of layer widths and batch sizes. The per-call latencies and tensor
+allocations are saved as JSON in benchmark_dir, named after the commit, and
+compared with the benchmark in baseline_path if given (see
+utils.benchmark.compare_benchmarks).
+"""
+import sys
+sys.path.append('.')
+from layers.layer import InputLayer, LeakyReluLayer, LinearOutputLayer
+from layers.target_prop_layer import TargetPropInputLayer, \
+    TargetPropLeakyReluLayer, TargetPropLinearOutputLayer
+from layers.DTP_layer import DTPInputLayer, DTPLeakyReluLayer, \
+    DTPLinearOutputLayer
+from layers.MTP_layer import MTPInputLayer, MTPLeakyReluLayer, \
+    MTPLinearOutputLayer
+from layers.original_TP_layer import OriginalTPInputLayer, \
+    OriginalTPLeakyReluLayer, OriginalTPLinearOutputLayer
+from layers.original_DTP_layer import OriginalDTPInputLayer, \
+    OriginalDTPLeakyReluLayer, OriginalDTPLinearOutputLayer
+from layers.invertible_layer import InvertibleInputLayer, \
+    InvertibleLeakyReluLayer, InvertibleLinearOutputLayer
+from layers.modified_TP_layer import MTPInvertibleInputLayer, \
+    MTPInvertibleLeakyReluLayer, MTPInvertibleLinearOutputLayer
+from networks.network import Network
+from networks.target_prop_network import TargetPropNetwork
+from networks.invertible_network import InvertibleNetwork
+from utils import benchmark
+import torch
+import numpy as np
+import pandas as pd
+import random
+from tensorboardX import SummaryWriter
+
+seed = 47
+torch.manual_seed(seed)
+np.random.seed(seed)
+random.seed(seed)
+
+# ======== User variables ============
+widths = [6, 100, 784, 1000]
+batch_sizes = [1, 32, 256]
+nb_repeats = 20
+max_time = 1.
+learning_rate = 1e-6
+benchmark_dir = '../logs/benchmarks/'
+# path of a previous benchmark to compare with, e.g.
+# '../logs/benchmarks/layers_<commit>.json'
+baseline_path = None
+writer = SummaryWriter(log_dir='../logs/benchmark_layers/')
+
+# family: (input layer, hidden layer, output layer, network)
+families = {
+    'BP': (InputLayer, LeakyReluLayer, LinearOutputLayer, Network),
+    'TP': (TargetPropInputLayer, TargetPropLeakyReluLayer,
+           TargetPropLinearOutputLayer, TargetPropNetwork),
+    'DTP': (DTPInputLayer, DTPLeakyReluLayer, DTPLinearOutputLayer,
+            TargetPropNetwork),
+    'MTP': (MTPInputLayer, MTPLeakyReluLayer, MTPLinearOutputLayer,
+            TargetPropNetwork),
+    'originalTP': (OriginalTPInputLayer, OriginalTPLeakyReluLayer,
+                   OriginalTPLinearOutputLayer, TargetPropNetwork),
+    'originalDTP': (OriginalDTPInputLayer, OriginalDTPLeakyReluLayer,
+                    OriginalDTPLinearOutputLayer, TargetPropNetwork),
+    'invertible': (InvertibleInputLayer, InvertibleLeakyReluLayer,
+                   InvertibleLinearOutputLayer, InvertibleNetwork),
+    'modifiedTP': (MTPInvertibleInputLayer, MTPInvertibleLeakyReluLayer,
+                   MTPInvertibleLinearOutputLayer, InvertibleNetwork)}
+methods = ['propagate_forward', 'propagate_backward',
+           'compute_forward_gradients', 'update_forward_parameters',
+           'update_backward_parameters']
+
+
+def create_network(family, n):
+    input_class, hidden_class, output_class, network_class = families[family]
+    torch.manual_seed(seed)
+    if network_class is Network:
+        layers = [input_class(layer_dim=n, writer=writer, debug_mode=False),
+                  hidden_class(negative_slope=0.35, in_dim=n, layer_dim=n,
+                               writer=writer, debug_mode=False),
+                  output_class(in_dim=n, layer_dim=n, loss_function='mse',
+                               writer=writer, debug_mode=False)]
+    else:
+        layers = [input_class(layer_dim=n, out_dim=n, writer=writer,
+                              debug_mode=False),
+                  hidden_class(negative_slope=0.35, in_dim=n, layer_dim=n,
+                               out_dim=n, writer=writer, debug_mode=False),
+                  output_class(in_dim=n, layer_dim=n, writer=writer,
+                               step_size=0.01, debug_mode=False)]
+    return network_class(layers, log=False)
+
+
+def get_layer_calls(network, input_batch, target):
+    """ Bring the network in the state after a training step on input_batch
+    and return the calls of the layer methods of its hidden layer."""
+    input_layer, hidden_layer, output_layer = network.layers
+    network.propagate_forward(input_batch)
+    output_layer.compute_backward_output(target)
+    hidden_layer.propagate_backward(output_layer)
+    hidden_layer.compute_forward_gradients(input_layer)
+    output_layer.compute_forward_gradients(hidden_layer)
+    calls = {
+        'propagate_forward':
+            lambda: hidden_layer.propagate_forward(input_layer),
+        'propagate_backward':
+            lambda: hidden_layer.propagate_backward(output_layer),
+        'compute_forward_gradients':
+            lambda: hidden_layer.compute_forward_gradients(input_layer),
+        'update_forward_parameters':
+            lambda: hidden_layer.update_forward_parameters(learning_rate)}
+    if hasattr(hidden_layer, 'update_backward_parameters'):
+        calls['update_backward_parameters'] = \
+            lambda: hidden_layer.update_backward_parameters(learning_rate,
+                                                            output_layer)
+    return calls
+
+
+# ======== Benchmark ============
+results = []
+for family in families:
+    for n in widths:
+        for batch_size in batch_sizes:
+            case = {'family': family,
+                    'network': families[family][3].__name__,
+                    'width': n, 'batch_size': batch_size}
+            input_batch = torch.randn(batch_size, n, 1)
+            target = torch.randn(batch_size, n, 1)
+            try:
+                network = create_network(family, n)
+                calls = get_layer_calls(network, input_batch, target)
+                error = None
+            except Exception as e:
+                # e.g. the invertible layers only support batch size 1
+                calls = {}
+                error = '{}: {}'.format(type(e).__name__, e)
+            for method in methods:
+                result = dict(case, method=method)
+                if method in calls:
+                    try:
+                        result.update(benchmark.benchmark_call(
+                            calls[method], nb_repeats=nb_repeats,
+                            max_time=max_time))
+                    except Exception as e:
+                        result['error'] = '{}: {}'.format(type(e).__name__, e)
+                else:
+                    result['error'] = error if error is not None else \
+                        'not implemented by {}'.format(
+                            type(network.layers[1]).__name__)
+                results.append(result)
+            print('{} width {} batch size {} done'.format(family, n,
+                                                          batch_size))
+
+commit = benchmark.get_git_commit()
+path = benchmark_dir + 'layers_{}.json'.format(
+    commit[:10] if commit is not None else 'unknown')
+benchmark.save_benchmark(results, path, widths=widths,
+                         batch_sizes=batch_sizes, nb_repeats=nb_repeats)
+print('Saved the results in {}'.format(path))
+
+frame = pd.DataFrame(results)
+frame['latency_us'] = frame['latency_median'] * 1e6
+pd.set_option('display.width', 200)
+print(frame.pivot_table(index=['family', 'width', 'batch_size'],
+                        columns='method', values='latency_us').to_string(
+    float_format='{:.1f}'.format))
+print(frame.pivot_table(index=['family', 'width', 'batch_size'],
+                        columns='method', values='nb_allocations').to_string(
+    float_format='{:.0f}'.format))
+
+if baseline_path is not None:
+    comparison = benchmark.compare_benchmarks(
+        baseline_path, path, keys=['family', 'method', 'width', 'batch_size'])
+    print('Regressions compared to {}:'.format(baseline_path))
+    print(comparison[comparison['regression']].to_string())
@@ -0,0 +1,123 @@
+"""
+Copyright 2019 Alexander Meulemans
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Benchmark of the training throughput (samples/sec) of the layer-pipelined
+target propagation optimizer SGDPipelined on a network with 4 hidden layers.
+The synchronous baseline (synchronous_step) does the same computations as
+the pipelined workers: the forward pass, the propagation of the targets
+and the forward and backward parameter updates, without the GN and BP
+diagnostics of TargetPropNetwork.propagate_backward, which SGDPipelined
+skips. The speedups therefore measure the pipelining itself.
+SGDPipelined with max_staleness=1 runs the same updates as the synchronous
+baseline without overlapping the layers, and measures the overhead of the
+worker processes and queues.
+"""
+import sys
+sys.path.append('.')
+from optimizers.pipelined_optimizer import SGDPipelined
+from layers.target_prop_layer import TargetPropInputLayer, \
+    TargetPropLinearOutputLayer, TargetPropLeakyReluLayer
+from networks.target_prop_network import TargetPropNetwork
+import torch
+import numpy as np
+import random
+import time
+from tensorboardX import SummaryWriter
+
+seed = 47
+torch.manual_seed(seed)
+np.random.seed(seed)
+random.seed(seed)
+
+# ======== User variables ============
+n = 64
+nb_hidden_layers = 4
+nb_batches = 50
+batch_size = 64
+learning_rate = 1e-4
+learning_rate_backward = 1e-4
+staleness_values = [1, 2, 4, 8]
+writer = SummaryWriter(log_dir='../logs/benchmark_pipelined_TP/')
+
+
+def create_network():
+    torch.manual_seed(seed)
+    layers = [TargetPropInputLayer(layer_dim=n, out_dim=n, writer=writer,
+                                   name='input_layer')]
+    for i in range(nb_hidden_layers):
+        layers.append(TargetPropLeakyReluLayer(negative_slope=0.35,
+                                               in_dim=n, layer_dim=n,
+                                               out_dim=n, writer=writer,
+                                               name='hidden_layer{}'.format(i)))
+    layers.append(TargetPropLinearOutputLayer(in_dim=n, layer_dim=n,
+                                              writer=writer, step_size=0.01,
+                                              name='output_layer'))
+    # well-conditioned (orthogonal) random weights, such that the targets
+    # propagated through the inverses stay bounded
+    for layer in layers[1:]:
+        Q, R = torch.linalg.qr(layer.forward_weights)
+        layer.set_forward_parameters(Q, layer.forward_bias)
+    return TargetPropNetwork(layers, log=False)
+
+
+# ======== Create dataset ============
+# The targets are a perturbation of the output of the initial network, such
+# that the training stays numerically stable for random weights
+input_dataset = torch.randn(nb_batches, batch_size, n, 1)
+network = create_network()
+output_dataset = torch.empty(nb_batches, batch_size, n, 1)
+for i in range(nb_batches):
+    network.propagate_forward(input_dataset[i])
+    output_dataset[i] = network.layers[-1].forward_output + \
+        0.1 * torch.randn(batch_size, n, 1)
+
+
+
+def synchronous_step(network, input_batch, targets):
+    """ One training step with the computations of the pipelined workers,
+    layer after layer, and return the loss."""
+    layers = network.layers
+    network.propagate_forward(input_batch)
+    layers[-1].compute_backward_output(targets)
+    loss = float(layers[-1].loss(targets))
+    for i in range(len(layers) - 2, 0, -1):
+        layers[i].propagate_backward(layers[i + 1])
+    network.compute_forward_gradients()
+    network.update_parameters(learning_rate, learning_rate_backward)
+    return loss
+
+
+# ======== Synchronous baseline ============
+network = create_network()
+losses = []
+start = time.time()
+for i in range(nb_batches):
+    losses.append(synchronous_step(network, input_dataset[i],
+                                   output_dataset[i]))
+duration = time.time() - start
+synchronous_throughput = nb_batches * batch_size / duration
+print('Synchronous: {:.1f} samples/sec, mean loss {:.4f}'.format(
+    synchronous_throughput, sum(losses) / len(losses)))
+
+# ======== Pipelined ============
+for max_staleness in staleness_values:
+    network = create_network()
+    optimizer = SGDPipelined(network=network, learning_rate=learning_rate,
+                             learning_rate_backward=learning_rate_backward,
+                             max_staleness=max_staleness)
+    optimizer.start()
+    start = time.time()
+    loss = optimizer.run_dataset(input_dataset, output_dataset)
+    duration = time.time() - start
+    optimizer.stop()
+    throughput = nb_batches * batch_size / duration
+    print('SGDPipelined (max_staleness={}): {:.1f} samples/sec '
+          '(speedup {:.2f}), mean loss {:.4f}'.format(
+              max_staleness, throughput, throughput / synchronous_throughput,
+              loss))
@@ -0,0 +1,90 @@
+"""
+Copyright 2019 Alexander Meulemans
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Serves a frozen network (see Network.freeze and FrozenNetwork.save) with a
+local micro-batching prediction server (utils.prediction_server) and
+measures its throughput and latency percentiles with a local load generator,
+for an increasing number of concurrent clients. Without frozen_network_path,
+a 784-1000-10 leaky ReLU network with random weights is served.
+"""
+import sys
+sys.path.append('.')
+from layers.layer import InputLayer, LeakyReluLayer, SoftmaxOutputLayer
+from networks.network import Network
+from networks.frozen_network import FrozenNetwork
+from utils import benchmark
+from utils import prediction_server
+import torch
+import numpy as np
+import pandas as pd
+import random
+from tensorboardX import SummaryWriter
+
+seed = 47
+torch.manual_seed(seed)
+np.random.seed(seed)
+random.seed(seed)
+
+# ======== User variables ============
+# e.g. '../logs/mnist_TP/frozen_network.npz'
+frozen_network_path = None
+nb_clients = [1, 4, 16, 64]
+nb_requests = 2000
+max_batch_size = 64
+max_latency = 0.005
+benchmark_dir = '../logs/benchmarks/'
+
+# ======== Create predictor ============
+if frozen_network_path is None:
+    writer = SummaryWriter(log_dir='../logs/benchmark_prediction_server/')
+    network = Network(
+        [InputLayer(layer_dim=784, writer=writer, debug_mode=False),
+         LeakyReluLayer(negative_slope=0.1, in_dim=784, layer_dim=1000,
+                        writer=writer, debug_mode=False),
+         SoftmaxOutputLayer(in_dim=1000, layer_dim=10,
+                            loss_function='crossEntropy', writer=writer,
+                            debug_mode=False)], log=False)
+    frozen_network = network.freeze()
+else:
+    frozen_network = FrozenNetwork.load(frozen_network_path)
+samples = torch.rand(nb_requests, frozen_network.in_dim).numpy()
+
+# ======== Benchmark ============
+results = []
+server = prediction_server.PredictionServer(
+    frozen_network.predict, frozen_network.in_dim,
+    max_batch_size=max_batch_size, max_latency=max_latency).start()
+print('Serving on {}'.format(server.url))
+for clients in nb_clients:
+    server.batcher.reset_statistics()
+    responses, client_statistics = prediction_server.generate_load(
+        server.url, samples, nb_clients=clients)
+    server_statistics = prediction_server.get_server_statistics(server.url)
+    result = {'nb_clients': clients}
+    result.update({'client_' + key: value
+                   for key, value in client_statistics.items()})
+    result.update({'server_' + key: value
+                   for key, value in server_statistics.items()})
+    results.append(result)
+    print('{} clients done'.format(clients))
+server.stop()
+
+commit = benchmark.get_git_commit()
+path = benchmark_dir + 'prediction_server_{}.json'.format(
+    commit[:10] if commit is not None else 'unknown')
+benchmark.save_benchmark(results, path, nb_requests=nb_requests,
+                         max_batch_size=max_batch_size,
+                         max_latency=max_latency)
+print('Saved the results in {}'.format(path))
+pd.set_option('display.width', 200)
+print(pd.DataFrame(results).set_index('nb_clients')[
+    ['client_requests_per_sec', 'client_latency_p50_ms',
+     'client_latency_p99_ms', 'server_latency_p50_ms',
+     'server_latency_p99_ms', 'server_batch_size_mean']].to_string(
+    float_format='{:.3g}'.format))
@@ -0,0 +1,147 @@
+"""
+Copyright 2019 Alexander Meulemans
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Post-training quantization of a trained 784-1000-10 leaky ReLU network (see
+FrozenNetwork.quantize): test accuracy of the float32, float16 and int8
+frozen networks, with the accuracy delta vs float32, and their inference
+throughput and speedup vs float32 for a sweep of batch sizes. The network is
+trained with BP on MNIST for a few steps, or a trained frozen network (e.g.
+of a capsule network) is loaded from frozen_network_path. The calibration
+batch is taken from the training split. The results are saved as JSON in
+benchmark_dir.
+"""
+import sys
+sys.path.append('.')
+from layers.layer import InputLayer, LeakyReluLayer, SoftmaxOutputLayer
+from networks.network import Network
+from networks.frozen_network import FrozenNetwork, get_int8_kernel
+from optimizers.optimizers import SGD
+from utils.mnist_store import convert_mnist, MNISTStore
+from utils import benchmark
+import utils.helper_functions as hf
+import torch
+import numpy as np
+import pandas as pd
+import random
+from tensorboardX import SummaryWriter
+
+seed = 47
+torch.manual_seed(seed)
+np.random.seed(seed)
+random.seed(seed)
+
+# ======== User variables ============
+# e.g. '../logs/mnist_capsules/frozen_network.npz'
+frozen_network_path = None
+nb_train_steps = 500
+batch_size_train = 64
+calibration_size = 512
+batch_sizes = [1, 32, 256, 2048]
+nb_repeats = 50
+max_time = 2.
+# use random images labeled by a random teacher network instead of MNIST,
+# e.g. when MNIST can't be downloaded
+use_random_data = False
+benchmark_dir = '../logs/benchmarks/'
+
+# ======== Load data ============
+if use_random_data:
+    teacher = torch.randn(10, 784)
+    train_images = torch.rand(nb_train_steps * batch_size_train +
+                              calibration_size, 784, 1)
+    test_images = torch.rand(10000, 784, 1)
+    train_labels = hf.prob2class(torch.matmul(teacher, train_images))
+    test_labels = hf.prob2class(torch.matmul(teacher, test_images))
+    train_targets = torch.zeros(len(train_labels), 10, 1)
+    train_targets[torch.arange(len(train_labels)), train_labels, 0] = 1.
+    train_batches = [(train_images[i:i + batch_size_train],
+                      train_targets[i:i + batch_size_train])
+                     for i in range(calibration_size, len(train_images),
+                                    batch_size_train)]
+    calibration_batch = train_images[:calibration_size]
+else:
+    convert_mnist(root='./data', store_dir='./data/mnist_store')
+    train_loader = MNISTStore('./data/mnist_store', train=True,
+                              batch_size=batch_size_train)
+    train_batches = [batch for i, batch in zip(range(nb_train_steps),
+                                               train_loader)]
+    calibration_batch = next(iter(MNISTStore(
+        './data/mnist_store', train=True, batch_size=calibration_size)))[0]
+    test_images, test_targets = next(iter(MNISTStore(
+        './data/mnist_store', train=False, batch_size=10000)))
+    test_labels = hf.prob2class(test_targets)
+
+# ======== Train network ============
+if frozen_network_path is None:
+    writer = SummaryWriter(log_dir='../logs/benchmark_quantization/')
+    network = Network(
+        [InputLayer(layer_dim=784, writer=writer, debug_mode=False),
+         LeakyReluLayer(negative_slope=0.1, in_dim=784, layer_dim=1000,
+                        writer=writer, debug_mode=False),
+         SoftmaxOutputLayer(in_dim=1000, layer_dim=10,
+                            loss_function='crossEntropy', writer=writer,
+                            debug_mode=False)], log=False)
+    optimizer = SGD(network=network, threshold=0.0001,
+                    init_learning_rate=0.01, tau=100,
+                    final_learning_rate=0.005)
+    for input_batch, target in train_batches:
+        optimizer.step(input_batch, target)
+    writer.close()
+    frozen_network = network.freeze()
+else:
+    frozen_network = FrozenNetwork.load(frozen_network_path)
+predictors = {'float32': frozen_network,
+              'float16': frozen_network.quantize(calibration_batch,
+                                                 torch.float16),
+              'int8': frozen_network.quantize(calibration_batch,
+                                              torch.qint8)}
+
+# ======== Benchmark ============
+results = []
+predictions = {name: hf.prob2class(predictor.predict(test_images))
+               for name, predictor in predictors.items()}
+for name, predictor in predictors.items():
+    accuracy = float(hf.accuracy(predictions[name], test_labels))
+    for batch_size in batch_sizes:
+        input_batch = test_images[:batch_size]
+        result = benchmark.time_call(lambda: predictor.predict(input_batch),
+                                     nb_repeats=nb_repeats, max_time=max_time)
+        result.update({'predictor': name, 'batch_size': batch_size,
+                       'samples_per_sec': batch_size /
+                       result['latency_median'],
+                       'accuracy': accuracy,
+                       'agreement_float32': float(hf.accuracy(
+                           predictions[name], predictions['float32']))})
+        results.append(result)
+    print('{} done'.format(name))
+results = pd.DataFrame(results)
+float32_results = results[results['predictor'] == 'float32'].set_index(
+    'batch_size')
+results['accuracy_delta'] = results['accuracy'] - \
+    float32_results['accuracy'].iloc[0]
+results['speedup'] = results['samples_per_sec'] / \
+    results['batch_size'].map(float32_results['samples_per_sec'])
+
+commit = benchmark.get_git_commit()
+path = benchmark_dir + 'quantization_{}.json'.format(
+    commit[:10] if commit is not None else 'unknown')
+benchmark.save_benchmark(results.to_dict('records'), path,
+                         batch_sizes=batch_sizes,
+                         nb_train_steps=nb_train_steps,
+                         calibration_size=calibration_size,
+                         int8_kernel=get_int8_kernel())
+print('Saved the results in {}'.format(path))
+pd.set_option('display.width', 200)
+print(results.groupby('predictor', sort=False)[
+    ['accuracy', 'accuracy_delta', 'agreement_float32']].first().to_string(
+    float_format='{:.4f}'.format))
+print(results.pivot_table(index='batch_size', columns='predictor',
+                          values=['samples_per_sec', 'speedup'],
+                          sort=False).to_string(
+    float_format='{:.3g}'.format))
@@ -47,6 +47,8 @@ learning_rate = 0.001
 output_step_size = 0.1
 randomize = True
 max_epoch = 120
+pretrain_inverses = False # fit the inverses in closed form before training
+refresh_inverses_interval = None # refit the inverses every x batches
 # ======== set log directory ==========
 log_dir = '../logs/debug_TP'
 writer = SummaryWriter(log_dir=log_dir)
@@ -138,7 +140,10 @@ hiddenlayer.set_forward_parameters(hidden_weights, hiddenlayer.forward_bias)
 outputlayer.set_forward_parameters(output_weights, outputlayer.forward_bias)
 
 network = TargetPropNetwork([inputlayer, hiddenlayer, outputlayer],
-                            randomize=randomize, find_inverses=True)
+                            randomize=randomize, find_inverses=True,
+                            refresh_inverses_interval=refresh_inverses_interval)
+if pretrain_inverses:
+    network.fit_inverses()
 
 # Initializing optimizer
 optimizer1 = SGD(network=network, threshold=0.0001,
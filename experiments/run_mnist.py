@@ -10,6 +10,7 @@ You may obtain a copy of the License at
 from layers.layer import ReluLayer, InputLayer, SoftmaxOutputLayer
 from networks.network import Network
 from optimizers.optimizers import SGD, SGDMomentum
+from utils.mnist_store import convert_mnist, MNISTStore
 import torch
 import torchvision
 from tensorboardX import SummaryWriter
@@ -18,6 +19,9 @@ import os
 # User variables
 batch_size = 64
 n = 100
+# read MNIST from a preprocessed memory-mapped store instead of decoding the
+# images with torchvision every epoch
+use_mnist_store = True
 
 # Initializing network
 
@@ -54,30 +58,37 @@ network = Network([inputlayer, hiddenlayer, outputlayer])
 #     network.cuda(device)
 
 # Loading dataset
-train_set = torchvision.datasets.MNIST(root='./data', train=True, download=True,
-                                       transform=torchvision.transforms.Compose(
-                                           [
-                                               torchvision.transforms.ToTensor(),
-                                               torchvision.transforms.Normalize(
-                                                   (0.1307,), (0.3081,))
-                                           ]))
-test_set = torchvision.datasets.MNIST(root='./data', train=False, download=True,
-                                      transform=torchvision.transforms.Compose([
-                                          torchvision.transforms.ToTensor(),
-                                          torchvision.transforms.Normalize(
-                                              (0.1307,), (0.3081,))
-                                      ]))
-
-
-
-train_loader = torch.utils.data.DataLoader(
-    dataset=train_set,
-    batch_size=batch_size,
-    shuffle=True)
-test_loader = torch.utils.data.DataLoader(
-    dataset=test_set,
-    batch_size=1000,
-    shuffle=False)
+if use_mnist_store:
+    convert_mnist(root='./data', store_dir='./data/mnist_store')
+    train_loader = MNISTStore('./data/mnist_store', train=True,
+                              batch_size=batch_size)
+    test_loader = MNISTStore('./data/mnist_store', train=False,
+                             batch_size=1000)
+else:
+    train_set = torchvision.datasets.MNIST(root='./data', train=True, download=True,
+                                           transform=torchvision.transforms.Compose(
+                                               [
+                                                   torchvision.transforms.ToTensor(),
+                                                   torchvision.transforms.Normalize(
+                                                       (0.1307,), (0.3081,))
+                                               ]))
+    test_set = torchvision.datasets.MNIST(root='./data', train=False, download=True,
+                                          transform=torchvision.transforms.Compose([
+                                              torchvision.transforms.ToTensor(),
+                                              torchvision.transforms.Normalize(
+                                                  (0.1307,), (0.3081,))
+                                          ]))
+
+
+
+    train_loader = torch.utils.data.DataLoader(
+        dataset=train_set,
+        batch_size=batch_size,
+        shuffle=True)
+    test_loader = torch.utils.data.DataLoader(
+        dataset=test_set,
+        batch_size=1000,
+        shuffle=False)
 
 # Initializing optimizer
 optimizer1 = SGD(network=network, threshold=1.2, init_learning_rate=0.1,
@@ -8,7 +8,7 @@ You may obtain a copy of the License at
    http://www.apache.org/licenses/LICENSE-2.0
 """
 
-from utils.create_datasets import GenerateDatasetFromModel
+from utils.dataset_cache import DatasetCache
 from optimizers.optimizers import SGD, SGDInvertible
 from layers.invertible_layer import InvertibleInputLayer, \
     InvertibleLeakyReluLayer, InvertibleLinearOutputLayer
@@ -20,7 +20,6 @@ import torch
 import numpy as np
 import time
 from tensorboardX import SummaryWriter
-from utils.LLS import linear_least_squares
 import os
 import random
 
@@ -75,19 +74,10 @@ output_layer_true = LinearOutputLayer(in_dim=n, layer_dim=n,
 true_network = Network([input_layer_true, hidden_layer_true,
                         output_layer_true])
 
-generator = GenerateDatasetFromModel(true_network)
+input_dataset, output_dataset, input_dataset_test, output_dataset_test, \
+    (weights, train_loss, test_loss) = DatasetCache().load_or_generate(
+        true_network, nb_training_batches, batch_size, testing_size)
 
-input_dataset, output_dataset = generator.generate(nb_training_batches,
-                                                   batch_size)
-input_dataset_test, output_dataset_test = generator.generate(
-    testing_size, 1)
-
-# compute least squares solution as control
-print('computing LS solution ...')
-weights, train_loss, test_loss = linear_least_squares(input_dataset,
-                                                      output_dataset,
-                                                      input_dataset_test,
-                                                      output_dataset_test)
 print('LS train loss: ' + str(train_loss))
 print('LS test loss: ' + str(test_loss))
 
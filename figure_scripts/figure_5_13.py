@@ -24,6 +24,7 @@ import numpy as np
 import time
 from tensorboardX import SummaryWriter
 from utils.LLS import linear_least_squares
+from utils.result_store import ResultStore
 import os
 import random
 import utils.helper_functions as hf
@@ -59,11 +60,30 @@ max_epoch = 600
 logs = False
 threshold = 0.00001
 
+# rerun the experiment even if results of this configuration are stored
+retrain = False
 random_iterations = 1
 random_iteration = 0
+# configuration of the results in the result store, results of another
+# configuration are not reused
+config = {'seed': seed, 'nb_training_batches': nb_training_batches,
+          'batch_size': batch_size, 'testing_size': testing_size,
+          'layer_dims': [n] * 6, 'distance': distance,
+          'learning_rate': learning_rate,
+          'backward_learning_rate': backward_learning_rate,
+          'backward_weight_decay': backward_weight_decay,
+          'learning_rate_BP': learning_rate_BP,
+          'output_step_size': output_step_size, 'weight_decay': weight_decay,
+          'max_epoch': max_epoch, 'logs': logs, 'threshold': threshold,
+          'random_iterations': random_iterations}
 
 # ======== set log directory ==========
 log_dir = '../logs/toy_example_normal_DTP_4layers/'
+store = ResultStore(log_dir + 'result_store')
+# the experiment is only run if retrain is set or if the store holds no
+# results of this configuration, otherwise the figures are made from the
+# stored results
+retrain = retrain or not store.matches_config(config)
 writer = SummaryWriter(log_dir=log_dir)
 
 # ======== Create result files ========
@@ -95,7 +115,7 @@ else:
     print('using CPU')
 
 # ======== Create toy model dataset =============
-while random_iteration < random_iterations:
+while retrain and random_iteration < random_iterations:
     try:
 
         input_layer_true = InputLayer(layer_dim=n, writer=writer,
@@ -512,15 +532,26 @@ while random_iteration < random_iterations:
         print('Occurred error:')
         print(e)
 
-# ===== Save results =======
-np.save(log_dir + 'train_losses_true.npy', train_losses_true)
-np.save(log_dir + 'test_losses_true.npy', test_losses_true)
-np.save(log_dir + 'train_losses_false.npy', train_losses_false)
-np.save(log_dir + 'test_losses_false.npy', test_losses_false)
-np.save(log_dir + 'train_losses_BP.npy', train_losses_BP)
-np.save(log_dir + 'test_losses_BP.npy', test_losses_BP)
-np.save(log_dir + 'train_losses_BPfixed.npy', train_losses_BPfixed)
-np.save(log_dir + 'test_losses_BPfixed.npy', test_losses_BPfixed)
+# ===== Save or load results =======
+if retrain:
+    store.set_config(config)
+    store.save('true', 'train_losses', train_losses_true)
+    store.save('true', 'test_losses', test_losses_true)
+    store.save('false', 'train_losses', train_losses_false)
+    store.save('false', 'test_losses', test_losses_false)
+    store.save('BP', 'train_losses', train_losses_BP)
+    store.save('BP', 'test_losses', test_losses_BP)
+    store.save('BPfixed', 'train_losses', train_losses_BPfixed)
+    store.save('BPfixed', 'test_losses', test_losses_BPfixed)
+else:
+    train_losses_true = store.load('true', 'train_losses')
+    test_losses_true = store.load('true', 'test_losses')
+    train_losses_false = store.load('false', 'train_losses')
+    test_losses_false = store.load('false', 'test_losses')
+    train_losses_BP = store.load('BP', 'train_losses')
+    test_losses_BP = store.load('BP', 'test_losses')
+    train_losses_BPfixed = store.load('BPfixed', 'train_losses')
+    test_losses_BPfixed = store.load('BPfixed', 'test_losses')
 
 # ====== Average results =======
 train_loss_true_mean = np.mean(train_losses_true, axis=0)
@@ -27,6 +27,7 @@ import numpy as np
 import time
 from tensorboardX import SummaryWriter
 from utils.LLS import linear_least_squares
+from utils.result_store import ResultStore
 import os
 import random
 import utils.helper_functions as hf
@@ -73,10 +74,39 @@ max_epoch = 60
 logs=True
 threshold = 0.0000001
 
+# rerun the experiment even if results of this configuration are stored
+retrain = False
 random_iterations = 15
 random_iteration = 0
+# configuration of the results in the result store, results of another
+# configuration are not reused
+config = {'seed': seed, 'nb_training_batches': nb_training_batches,
+          'batch_size': batch_size, 'testing_size': testing_size,
+          'layer_dims': [n, n, n_out], 'distance': distance,
+          'weight_decay': weight_decay,
+          'learning_rates': {'TP': learning_rate_TP, 'BP': learning_rate_BP,
+                             'DTP': learning_rate_DTP,
+                             'fixed': learning_rate_fixed,
+                             'originalTP': learning_rate_originalTP,
+                             'originalDTP': learning_rate_originalDTP},
+          'weight_decays': {'TP': weight_decay_TP, 'DTP': weight_decay_DTP,
+                            'originalTP': weight_decay_originalTP,
+                            'originalDTP': weight_decay_originalDTP},
+          'backward_learning_rates': {
+              'TP': backward_learning_rate_TP,
+              'DTP': backward_learning_rate_DTP,
+              'originalTP': backward_learning_rate_originalTP,
+              'originalDTP': backward_learning_rate_originalDTP},
+          'output_step_size': output_step_size, 'randomize': randomize,
+          'max_epoch': max_epoch, 'logs': logs, 'threshold': threshold,
+          'random_iterations': random_iterations}
 # ======== set log directory ==========
 log_dir_main = '../logs/final_combined_toy_example_unequal_layers/'
+store = ResultStore(log_dir_main + 'result_store')
+# the experiment is only run if retrain is set or if the store holds no
+# results of this configuration, otherwise the figures are made from the
+# stored results
+retrain = retrain or not store.matches_config(config)
 
 # ======== set device ============
 if not CPU:
@@ -138,7 +168,7 @@ test_losses_BP = np.empty((random_iterations, max_epoch+1))
 train_losses_BP_fixed = np.empty((random_iterations, max_epoch+1))
 test_losses_BP_fixed = np.empty((random_iterations, max_epoch+1))
 
-while random_iteration < random_iterations:
+while retrain and random_iteration < random_iterations:
     try:
         # ======== Create toy model dataset =============
         log_dir = log_dir_main + 'dataset'
@@ -557,48 +587,103 @@ while random_iteration < random_iterations:
         print(e)
 
 
-# ====== Save results =======
-np.save(log_dir_main + 'train_losses_TP.npy', train_losses_TP)
-np.save(log_dir_main + 'test_losses_TP.npy', test_losses_TP)
-np.save(log_dir_main + 'approx_error_angles_array_TP.npy', approx_error_angles_array_TP)
-np.save(log_dir_main + 'approx_errors_array_TP.npy', approx_errors_array_TP)
-np.save(log_dir_main + 'GN_errors_array_TP.npy', GN_errors_array_TP)
-np.save(log_dir_main + 'TP_errors_array_TP.npy', TP_errors_array_TP)
-np.save(log_dir_main + 'GN_angles_array_TP.npy', GN_angles_array_TP)
-np.save(log_dir_main + 'BP_angles_array_TP.npy', BP_angles_array_TP)
-
-np.save(log_dir_main + 'train_losses_DTP.npy', train_losses_DTP)
-np.save(log_dir_main + 'test_losses_DTP.npy', test_losses_DTP)
-np.save(log_dir_main + 'approx_error_angles_array_DTP.npy', approx_error_angles_array_DTP)
-np.save(log_dir_main + 'approx_errors_array_DTP.npy', approx_errors_array_DTP)
-np.save(log_dir_main + 'GN_errors_array_DTP.npy', GN_errors_array_DTP)
-np.save(log_dir_main + 'TP_errors_array_DTP.npy', TP_errors_array_DTP)
-np.save(log_dir_main + 'GN_angles_array_DTP.npy', GN_angles_array_DTP)
-np.save(log_dir_main + 'BP_angles_array_DTP.npy', BP_angles_array_DTP)
-
-np.save(log_dir_main + 'train_losses_originalTP.npy', train_losses_originalTP)
-np.save(log_dir_main + 'test_losses_originalTP.npy', test_losses_originalTP)
-np.save(log_dir_main + 'approx_error_angles_array_originalTP.npy', approx_error_angles_array_originalTP)
-np.save(log_dir_main + 'approx_errors_array_originalTP.npy', approx_errors_array_originalTP)
-np.save(log_dir_main + 'GN_errors_array_originalTP.npy', GN_errors_array_originalTP)
-np.save(log_dir_main + 'TP_errors_array_originalTP.npy', TP_errors_array_originalTP)
-np.save(log_dir_main + 'GN_angles_array_originalTP.npy', GN_angles_array_originalTP)
-np.save(log_dir_main + 'BP_angles_array_originalTP.npy', BP_angles_array_originalTP)
-
-np.save(log_dir_main + 'train_losses_originalDTP.npy', train_losses_originalDTP)
-np.save(log_dir_main + 'test_losses_originalDTP.npy', test_losses_originalDTP)
-np.save(log_dir_main + 'approx_error_angles_array_originalDTP.npy', approx_error_angles_array_originalDTP)
-np.save(log_dir_main + 'approx_errors_array_originalDTP.npy', approx_errors_array_originalDTP)
-np.save(log_dir_main + 'GN_errors_array_originalDTP.npy', GN_errors_array_originalDTP)
-np.save(log_dir_main + 'TP_errors_array_originalDTP.npy', TP_errors_array_originalDTP)
-np.save(log_dir_main + 'GN_angles_array_originalDTP.npy', GN_angles_array_originalDTP)
-np.save(log_dir_main + 'BP_angles_array_originalDTP.npy', BP_angles_array_originalDTP)
-
-np.save(log_dir_main + 'train_losses_BP.npy', train_losses_BP)
-np.save(log_dir_main + 'test_losses_BP.npy', test_losses_BP)
-
-np.save(log_dir_main + 'train_losses_BP_fixed.npy', train_losses_BP_fixed)
-np.save(log_dir_main + 'test_losses_BP_fixed.npy', test_losses_BP_fixed)
+# ====== Save or load results =======
+if retrain:
+    store.set_config(config)
+    store.save('TP', 'train_losses', train_losses_TP)
+    store.save('TP', 'test_losses', test_losses_TP)
+    store.save('TP', 'approx_error_angles_array', approx_error_angles_array_TP)
+    store.save('TP', 'approx_errors_array', approx_errors_array_TP)
+    store.save('TP', 'GN_errors_array', GN_errors_array_TP)
+    store.save('TP', 'TP_errors_array', TP_errors_array_TP)
+    store.save('TP', 'GN_angles_array', GN_angles_array_TP)
+    store.save('TP', 'BP_angles_array', BP_angles_array_TP)
+
+    store.save('DTP', 'train_losses', train_losses_DTP)
+    store.save('DTP', 'test_losses', test_losses_DTP)
+    store.save('DTP', 'approx_error_angles_array',
+               approx_error_angles_array_DTP)
+    store.save('DTP', 'approx_errors_array', approx_errors_array_DTP)
+    store.save('DTP', 'GN_errors_array', GN_errors_array_DTP)
+    store.save('DTP', 'TP_errors_array', TP_errors_array_DTP)
+    store.save('DTP', 'GN_angles_array', GN_angles_array_DTP)
+    store.save('DTP', 'BP_angles_array', BP_angles_array_DTP)
+
+    store.save('originalTP', 'train_losses', train_losses_originalTP)
+    store.save('originalTP', 'test_losses', test_losses_originalTP)
+    store.save('originalTP', 'approx_error_angles_array',
+               approx_error_angles_array_originalTP)
+    store.save('originalTP', 'approx_errors_array',
+               approx_errors_array_originalTP)
+    store.save('originalTP', 'GN_errors_array', GN_errors_array_originalTP)
+    store.save('originalTP', 'TP_errors_array', TP_errors_array_originalTP)
+    store.save('originalTP', 'GN_angles_array', GN_angles_array_originalTP)
+    store.save('originalTP', 'BP_angles_array', BP_angles_array_originalTP)
+
+    store.save('originalDTP', 'train_losses', train_losses_originalDTP)
+    store.save('originalDTP', 'test_losses', test_losses_originalDTP)
+    store.save('originalDTP', 'approx_error_angles_array',
+               approx_error_angles_array_originalDTP)
+    store.save('originalDTP', 'approx_errors_array',
+               approx_errors_array_originalDTP)
+    store.save('originalDTP', 'GN_errors_array', GN_errors_array_originalDTP)
+    store.save('originalDTP', 'TP_errors_array', TP_errors_array_originalDTP)
+    store.save('originalDTP', 'GN_angles_array', GN_angles_array_originalDTP)
+    store.save('originalDTP', 'BP_angles_array', BP_angles_array_originalDTP)
+
+    store.save('BP', 'train_losses', train_losses_BP)
+    store.save('BP', 'test_losses', test_losses_BP)
+
+    store.save('BP_fixed', 'train_losses', train_losses_BP_fixed)
+    store.save('BP_fixed', 'test_losses', test_losses_BP_fixed)
+else:
+    train_losses_TP = store.load('TP', 'train_losses')
+    test_losses_TP = store.load('TP', 'test_losses')
+    approx_error_angles_array_TP = store.load('TP',
+                                              'approx_error_angles_array')
+    approx_errors_array_TP = store.load('TP', 'approx_errors_array')
+    GN_errors_array_TP = store.load('TP', 'GN_errors_array')
+    TP_errors_array_TP = store.load('TP', 'TP_errors_array')
+    GN_angles_array_TP = store.load('TP', 'GN_angles_array')
+    BP_angles_array_TP = store.load('TP', 'BP_angles_array')
+
+    train_losses_DTP = store.load('DTP', 'train_losses')
+    test_losses_DTP = store.load('DTP', 'test_losses')
+    approx_error_angles_array_DTP = store.load('DTP',
+                                               'approx_error_angles_array')
+    approx_errors_array_DTP = store.load('DTP', 'approx_errors_array')
+    GN_errors_array_DTP = store.load('DTP', 'GN_errors_array')
+    TP_errors_array_DTP = store.load('DTP', 'TP_errors_array')
+    GN_angles_array_DTP = store.load('DTP', 'GN_angles_array')
+    BP_angles_array_DTP = store.load('DTP', 'BP_angles_array')
+
+    train_losses_originalTP = store.load('originalTP', 'train_losses')
+    test_losses_originalTP = store.load('originalTP', 'test_losses')
+    approx_error_angles_array_originalTP = store.load('originalTP',
+                                                      'approx_error_angles_array')
+    approx_errors_array_originalTP = store.load('originalTP',
+                                                'approx_errors_array')
+    GN_errors_array_originalTP = store.load('originalTP', 'GN_errors_array')
+    TP_errors_array_originalTP = store.load('originalTP', 'TP_errors_array')
+    GN_angles_array_originalTP = store.load('originalTP', 'GN_angles_array')
+    BP_angles_array_originalTP = store.load('originalTP', 'BP_angles_array')
+
+    train_losses_originalDTP = store.load('originalDTP', 'train_losses')
+    test_losses_originalDTP = store.load('originalDTP', 'test_losses')
+    approx_error_angles_array_originalDTP = store.load('originalDTP',
+                                                       'approx_error_angles_array')
+    approx_errors_array_originalDTP = store.load('originalDTP',
+                                                 'approx_errors_array')
+    GN_errors_array_originalDTP = store.load('originalDTP', 'GN_errors_array')
+    TP_errors_array_originalDTP = store.load('originalDTP', 'TP_errors_array')
+    GN_angles_array_originalDTP = store.load('originalDTP', 'GN_angles_array')
+    BP_angles_array_originalDTP = store.load('originalDTP', 'BP_angles_array')
+
+    train_losses_BP = store.load('BP', 'train_losses')
+    test_losses_BP = store.load('BP', 'test_losses')
+
+    train_losses_BP_fixed = store.load('BP_fixed', 'train_losses')
+    test_losses_BP_fixed = store.load('BP_fixed', 'test_losses')
 
 # ========= Average results ==========
 train_loss_TP_mean = np.mean(train_losses_TP, axis=0)
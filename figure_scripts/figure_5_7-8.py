@@ -23,6 +23,7 @@ import numpy as np
 import time
 from tensorboardX import SummaryWriter
 from utils.LLS import linear_least_squares
+from utils.result_store import ResultStore
 import os
 import random
 import utils.helper_functions as hf
@@ -59,10 +60,30 @@ max_epoch = 60
 logs=True
 threshold = 1e-10
 
+# rerun the experiment even if results of this configuration are stored
+retrain = False
 random_iterations = 10
 random_iteration = 0
+# configuration of the results in the result store, results of another
+# configuration are not reused
+config = {'seed': seed, 'nb_training_batches': nb_training_batches,
+          'batch_size': batch_size, 'testing_size': testing_size,
+          'layer_dims': [n, n, n_out], 'distance': distance,
+          'weight_decay': weight_decay,
+          'learning_rates': {'TP': learning_rate_TP,
+                             'TPrandom': learning_rate_TPrandom,
+                             'MTP': learning_rate_MTP, 'BP': learning_rate_BP,
+                             'fixed': learning_rate_fixed},
+          'output_step_size': output_step_size, 'randomize': randomize,
+          'max_epoch': max_epoch, 'logs': logs, 'threshold': threshold,
+          'random_iterations': random_iterations}
 # ======== set log directory ==========
 log_dir_main = '../logs/final_combined_toy_example_unequal/'
+store = ResultStore(log_dir_main + 'result_store')
+# the experiment is only run if retrain is set or if the store holds no
+# results of this configuration, otherwise the figures are made from the
+# stored results
+retrain = retrain or not store.matches_config(config)
 
 # ======== set device ============
 if not CPU:
@@ -103,7 +124,7 @@ test_losses_BP = np.empty((random_iterations, max_epoch+1))
 train_losses_BP_fixed = np.empty((random_iterations, max_epoch+1))
 test_losses_BP_fixed = np.empty((random_iterations, max_epoch+1))
 
-while random_iteration < random_iterations:
+while retrain and random_iteration < random_iterations:
     try:
         # ======== Create toy model dataset =============
         log_dir = log_dir_main + 'dataset'
@@ -426,27 +447,56 @@ while random_iteration < random_iterations:
         print(e)
 
 
-# ====== Save results =======
-np.save(log_dir_main + 'train_losses_TP.npy', train_losses_TP)
-np.save(log_dir_main + 'test_losses_TP.npy', test_losses_TP)
-np.save(log_dir_main + 'approx_error_angles_array_TP.npy', approx_error_angles_array_TP)
-np.save(log_dir_main + 'approx_errors_array_TP.npy', approx_errors_array_TP)
+# ====== Save or load results =======
+if retrain:
+    store.set_config(config)
+    store.save('TP', 'train_losses', train_losses_TP)
+    store.save('TP', 'test_losses', test_losses_TP)
+    store.save('TP', 'approx_error_angles_array', approx_error_angles_array_TP)
+    store.save('TP', 'approx_errors_array', approx_errors_array_TP)
 
-np.save(log_dir_main + 'train_losses_TPrandom.npy', train_losses_TPrandom)
-np.save(log_dir_main + 'test_losses_TPrandom.npy', test_losses_TPrandom)
-np.save(log_dir_main + 'approx_error_angles_array_TPrandom.npy', approx_error_angles_array_TPrandom)
-np.save(log_dir_main + 'approx_errors_array_TPrandom.npy', approx_errors_array_TPrandom)
+    store.save('TPrandom', 'train_losses', train_losses_TPrandom)
+    store.save('TPrandom', 'test_losses', test_losses_TPrandom)
+    store.save('TPrandom', 'approx_error_angles_array',
+               approx_error_angles_array_TPrandom)
+    store.save('TPrandom', 'approx_errors_array', approx_errors_array_TPrandom)
 
-np.save(log_dir_main + 'train_losses_MTP.npy', train_losses_MTP)
-np.save(log_dir_main + 'test_losses_MTP.npy', test_losses_MTP)
-np.save(log_dir_main + 'approx_error_angles_array_MTP.npy', approx_error_angles_array_MTP)
-np.save(log_dir_main + 'approx_errors_array_MTP.npy', approx_errors_array_MTP)
+    store.save('MTP', 'train_losses', train_losses_MTP)
+    store.save('MTP', 'test_losses', test_losses_MTP)
+    store.save('MTP', 'approx_error_angles_array',
+               approx_error_angles_array_MTP)
+    store.save('MTP', 'approx_errors_array', approx_errors_array_MTP)
 
-np.save(log_dir_main + 'train_losses_BP.npy', train_losses_BP)
-np.save(log_dir_main + 'test_losses_BP.npy', test_losses_BP)
+    store.save('BP', 'train_losses', train_losses_BP)
+    store.save('BP', 'test_losses', test_losses_BP)
 
-np.save(log_dir_main + 'train_losses_BP_fixed.npy', train_losses_BP_fixed)
-np.save(log_dir_main + 'test_losses_BP_fixed.npy', test_losses_BP_fixed)
+    store.save('BP_fixed', 'train_losses', train_losses_BP_fixed)
+    store.save('BP_fixed', 'test_losses', test_losses_BP_fixed)
+else:
+    train_losses_TP = store.load('TP', 'train_losses')
+    test_losses_TP = store.load('TP', 'test_losses')
+    approx_error_angles_array_TP = store.load('TP',
+                                              'approx_error_angles_array')
+    approx_errors_array_TP = store.load('TP', 'approx_errors_array')
+
+    train_losses_TPrandom = store.load('TPrandom', 'train_losses')
+    test_losses_TPrandom = store.load('TPrandom', 'test_losses')
+    approx_error_angles_array_TPrandom = store.load('TPrandom',
+                                                    'approx_error_angles_array')
+    approx_errors_array_TPrandom = store.load('TPrandom',
+                                              'approx_errors_array')
+
+    train_losses_MTP = store.load('MTP', 'train_losses')
+    test_losses_MTP = store.load('MTP', 'test_losses')
+    approx_error_angles_array_MTP = store.load('MTP',
+                                               'approx_error_angles_array')
+    approx_errors_array_MTP = store.load('MTP', 'approx_errors_array')
+
+    train_losses_BP = store.load('BP', 'train_losses')
+    test_losses_BP = store.load('BP', 'test_losses')
+
+    train_losses_BP_fixed = store.load('BP_fixed', 'train_losses')
+    test_losses_BP_fixed = store.load('BP_fixed', 'test_losses')
 
 # ========= Average results ==========
 train_loss_TP_mean = np.mean(train_losses_TP, axis=0)
@@ -7,40 +7,52 @@ from abc import ABC, abstractmethod
 class StatelessNetError(Exception):
     pass
 
-class Net(ABC):
+def get_layer_sizes(config):
+    """ Sizes of the layers after the 28*28 input layer, given as a list by
+    config['layers'], or by config['n1'], config['n2'], ... otherwise."""
+    if 'layers' in config:
+        return list(config['layers'])
+    sizes = []
+    while 'n{}'.format(len(sizes) + 1) in config:
+        sizes.append(config['n{}'.format(len(sizes) + 1)])
+    return sizes
+
+def get_learning_rate(config, name, layer):
+    """ Learning rate of a layer: config[name][layer - 1] if config[name] is
+    a list (e.g. config['eta'] = [0.05, 0.05, 0.05]), config[name + layer]
+    otherwise (e.g. config['eta1'])."""
+    if isinstance(config.get(name), (list, tuple)):
+        return config[name][layer - 1]
+    return config[name + str(layer)]
+
+class LayeredNet(ABC):
+    """ Network with an arbitrary number of layers, the layer sizes are given
+    by self.get_layer_sizes(config). Layer l has forward weights W<l> and bias
+    b<l>, and there are backward weights B<l> from layer l+1 to layer l.
+    The activations of the last forward pass are stored as r0, r1, ... in
+    self.vars."""
     def __init__(self, config):
+        self.config = config
+        self.layer_sizes = self.get_layer_sizes(config)
+        self.nb_layers = len(self.layer_sizes) - 1
+        sizes = self.layer_sizes
         self.parameters = {}
-        self.parameters['W1'] = config['w-init'] * torch.randn(config['n1'], 28*28, device=config['device'])
-        self.parameters['b1'] = config['w-init'] * torch.randn(config['n1'], device=config['device'])
-        self.parameters['W2'] = config['w-init'] * torch.randn(config['n2'], config['n1'], device=config['device'])
-        self.parameters['b2'] = config['w-init'] * torch.randn(config['n2'], device=config['device'])
-        self.parameters['W3'] = config['w-init'] * torch.randn(10, config['n2'], device=config['device'])
-        self.parameters['b3'] = config['w-init'] * torch.randn(10, device=config['device'])
-
-        self.parameters['B2'] = config['b-init'] * (torch.rand(config['n2'], 10, device=config['device']) - 0.5)
-        self.parameters['B1'] = config['b-init'] * (torch.rand(config['n1'], config['n2'], device=config['device']) - 0.5)
+        for layer in range(1, self.nb_layers + 1):
+            self.parameters['W{}'.format(layer)] = config['w-init'] * torch.randn(sizes[layer], sizes[layer - 1], device=config['device'])
+            self.parameters['b{}'.format(layer)] = config['w-init'] * torch.randn(sizes[layer], device=config['device'])
+        for layer in reversed(range(1, self.nb_layers)):
+            self.parameters['B{}'.format(layer)] = config['b-init'] * (torch.rand(sizes[layer], sizes[layer + 1], device=config['device']) - 0.5)
 
         self.vars = {}
         self.reset_state()
 
-    def reset_state(self):
-        self.vars['r0'] = None
-        self.vars['r1'] = None
-        self.vars['r2'] = None
-        self.vars['r3'] = None
+    @abstractmethod
+    def get_layer_sizes(self, config):
+        pass
 
-    def forward(self, x):
-        self.vars['r0'] = x.view(-1, 28*28)
-        self.vars['r1'] = torch.sigmoid(self.vars['r0'].mm(self.parameters['W1'].t()) + self.parameters['b1'])
-        self.vars['r2'] = torch.sigmoid(self.vars['r1'].mm(self.parameters['W2'].t()) + self.parameters['b2'])
-        self.vars['r3'] = torch.sigmoid(self.vars['r2'].mm(self.parameters['W3'].t()) + self.parameters['b3'])
-
-        return self.vars['r3']
-
-    def loss_function(self, target):
-        loss_function = nn.CrossEntropyLoss()
-        output = self.vars['r3']
-        return loss_function(output, target).item()
+    def reset_state(self):
+        for layer in range(self.nb_layers + 1):
+            self.vars['r{}'.format(layer)] = None
 
     def learn(self, config, target_categorical):
         if self.vars['r0'] is None:
@@ -52,177 +64,144 @@ class Net(ABC):
             parameters[param_name] = self.parameters[param_name].cpu().numpy().copy()
         return parameters
 
+    def get_one_hot_target(self, target_categorical):
+        # Convert target_categorical to a one-hot encoded pattern of activity.
+        target = torch.zeros(target_categorical.shape[0], 10, device=self.config['device'])
+        target.scatter_(1, target_categorical.unsqueeze(1), 1)
+        return target
+
+    def update_layer(self, config, layer, error):
+        """ W<l> += eta<l>/batch-size * error^T r<l-1> and
+        b<l> += eta<l>/batch-size * sum(error), in place. The sum of the
+        outer products over the batch is computed as a single matrix
+        product, without materializing the batch of outer products."""
+        alpha = get_learning_rate(config, 'eta', layer)/config['batch-size']
+        self.parameters['W{}'.format(layer)].addmm_(error.t(), self.vars['r{}'.format(layer - 1)], alpha=alpha)
+        self.parameters['b{}'.format(layer)].add_(torch.sum(error, dim=0), alpha=alpha)
+
+    def update_backward_weights(self, config, layer, error):
+        """ B<l> += eta-b<l>/batch-size * error^T r<l+1>, in place."""
+        alpha = get_learning_rate(config, 'eta-b', layer)/config['batch-size']
+        self.parameters['B{}'.format(layer)].addmm_(error.t(), self.vars['r{}'.format(layer + 1)], alpha=alpha)
+
+class Net(LayeredNet):
+    """ Sigmoid network from the 28*28 input to 10 output units, with the
+    hidden layers given by config['layers'] or config['n1'], config['n2'],
+    ..."""
+    def get_layer_sizes(self, config):
+        return [28*28] + get_layer_sizes(config) + [10]
+
+    def forward(self, x):
+        r = x.view(-1, 28*28)
+        self.vars['r0'] = r
+        for layer in range(1, self.nb_layers + 1):
+            r = torch.sigmoid(torch.addmm(self.parameters['b{}'.format(layer)], r, self.parameters['W{}'.format(layer)].t()))
+            self.vars['r{}'.format(layer)] = r
+
+        return r
+
+    def loss_function(self, target):
+        loss_function = nn.CrossEntropyLoss()
+        output = self.vars['r{}'.format(self.nb_layers)]
+        return loss_function(output, target).item()
+
 class FANet(Net):
+    @torch.no_grad()
     def learn(self, config, target_categorical):
         super().learn(config, target_categorical)
 
-        # Convert target_categorical to a one-hot encoded pattern of activity.
-        target = torch.empty(target_categorical.shape[0], 10, device=config['device'])
-        target.zero_()
-        target.scatter_(1, target_categorical.unsqueeze(1), 1)
+        target = self.get_one_hot_target(target_categorical)
 
         # Derivative of neuron-by-neuron cross-entropy loss wrt to output activations.
-        e3 = target - self.vars['r3']
-        # Efficiently compute average of outer products.
-        dW3 = torch.sum(torch.bmm(e3.unsqueeze(2), self.vars['r2'].unsqueeze(1)), dim=0)
-        db3 = torch.sum(e3, dim=0)
-
-        dr2 = self.vars['r2'] * (1 - self.vars['r2'])
-        # 'Backpropagate' errors.
-        e2 = dr2 * e3.mm(self.parameters['B2'].t())
-        dW2 = torch.sum(torch.bmm(e2.unsqueeze(2), self.vars['r1'].unsqueeze(1)), dim=0)
-        db2 = torch.sum(e2, dim=0)
-
-        dr1 = self.vars['r1'] * (1 - self.vars['r1'])
-        e1 = dr1 * e2.mm(self.parameters['B1'].t())
-        dW1 = torch.sum(torch.bmm(e1.unsqueeze(2), self.vars['r0'].unsqueeze(1)), dim=0)
-        db1 = torch.sum(e1, dim=0)
-
-        # In FA only forward weights are learned.
-        self.parameters['W3'] += config['eta3']/config['batch-size'] * dW3
-        self.parameters['b3'] += config['eta3']/config['batch-size'] * db3
-        self.parameters['W2'] += config['eta2']/config['batch-size'] * dW2
-        self.parameters['b2'] += config['eta2']/config['batch-size'] * db2
-        self.parameters['W1'] += config['eta1']/config['batch-size'] * dW1
-        self.parameters['b1'] += config['eta1']/config['batch-size'] * db1
-        
+        error = target - self.vars['r{}'.format(self.nb_layers)]
+        for layer in range(self.nb_layers, 1, -1):
+            r = self.vars['r{}'.format(layer - 1)]
+            # 'Backpropagate' errors.
+            next_error = r * (1 - r) * error.mm(self.parameters['B{}'.format(layer - 1)].t())
+            # In FA only forward weights are learned.
+            self.update_layer(config, layer, error)
+            error = next_error
+        self.update_layer(config, 1, error)
+
 class TPNet(Net):
+    @torch.no_grad()
     def learn(self, config, target_categorical):
         super().learn(config, target_categorical)
 
-        # Convert target_categorical to a one-hot encoded pattern of activity.
-        target = torch.empty(target_categorical.shape[0], 10, device=config['device'])
-        target.zero_()
-        target.scatter_(1, target_categorical.unsqueeze(1), 1)
-
-        target = (1 - config['lambda'])*self.vars['r3'] + config['lambda']*target
+        output = self.vars['r{}'.format(self.nb_layers)]
+        target = (1 - config['lambda'])*output + config['lambda']*self.get_one_hot_target(target_categorical)
         # Derivative of neuron-by-neuron cross-entropy loss wrt to output activations.
-        e3 = target - self.vars['r3']
-        # Efficiently compute average of outer products.
-        dW3 = torch.sum(torch.bmm(e3.unsqueeze(2), self.vars['r2'].unsqueeze(1)), dim=0)
-        db3 = torch.sum(e3, dim=0)
-
-        dr2 = self.vars['r2'] * (1 - self.vars['r2'])
-        if config['diff-tp']:
-            e2 = dr2 * e3.mm(self.parameters['B2'].t())
-        else:
-            target2 = (1 - config['lambda'])*self.vars['r2'] + config['lambda']*target.mm(self.parameters['B2'].t())
-            e2 = dr2 * (target2 - self.vars['r2'])
-            
-        dW2 = torch.sum(torch.bmm(e2.unsqueeze(2), self.vars['r1'].unsqueeze(1)), dim=0)
-        db2 = torch.sum(e2, dim=0)
-
-        dr1 = self.vars['r1'] * (1 - self.vars['r1'])
-        if config['diff-tp']:
-            e1 = dr1 * e2.mm(self.parameters['B1'].t())
-        else:
-            target1 = (1 - config['lambda'])*self.vars['r1'] + config['lambda']*target2.mm(self.parameters['B1'].t())
-            e1 = dr1 * (target1 - self.vars['r1'])
-        dW1 = torch.sum(torch.bmm(e1.unsqueeze(2), self.vars['r0'].unsqueeze(1)), dim=0)
-        db1 = torch.sum(e1, dim=0)
-
-        # Learn backward weights with a reverse delta rule (without using information from the labels)
-        r2_b = torch.sigmoid(self.vars['r3'].mm(self.parameters['B2'].t()))
-        e2_b = self.vars['r2'] - r2_b
-        dB2 = torch.sum(torch.bmm(e2_b.unsqueeze(2), self.vars['r3'].unsqueeze(1)), dim=0)
-
-        r1_b = torch.sigmoid(self.vars['r2'].mm(self.parameters['B1'].t()))
-        e1_b = self.vars['r1'] - r1_b
-        dB1 = torch.sum(torch.bmm(e1_b.unsqueeze(2), self.vars['r2'].unsqueeze(1)), dim=0)
-
-        self.parameters['W3'] += config['eta3']/config['batch-size'] * dW3
-        self.parameters['b3'] += config['eta3']/config['batch-size'] * db3
-        self.parameters['W2'] += config['eta2']/config['batch-size'] * dW2
-        self.parameters['b2'] += config['eta2']/config['batch-size'] * db2
-        self.parameters['W1'] += config['eta1']/config['batch-size'] * dW1
-        self.parameters['b1'] += config['eta1']/config['batch-size'] * db1
-        self.parameters['B2'] += config['eta-b2']/config['batch-size'] * dB2
-        self.parameters['B1'] += config['eta-b1']/config['batch-size'] * dB1
-
-class Net1(ABC):
-    def __init__(self, config):
-        self.parameters = {}
-        self.parameters['W1'] = config['w-init'] * torch.randn(config['n1'], 28*28, device=config['device'])
-        self.parameters['b1'] = config['w-init'] * torch.randn(config['n1'], device=config['device'])
-        self.parameters['W2'] = config['w-init'] * torch.randn(config['n2'], config['n1'], device=config['device'])
-        self.parameters['b2'] = config['w-init'] * torch.randn(config['n2'], device=config['device'])
+        error = target - output
+        for layer in range(self.nb_layers, 1, -1):
+            r = self.vars['r{}'.format(layer - 1)]
+            B = self.parameters['B{}'.format(layer - 1)]
+            if config['diff-tp']:
+                next_error = r * (1 - r) * error.mm(B.t())
+            else:
+                target = (1 - config['lambda'])*r + config['lambda']*target.mm(B.t())
+                next_error = r * (1 - r) * (target - r)
 
+            # Learn backward weights with a reverse delta rule (without using information from the labels)
+            error_b = r - torch.sigmoid(self.vars['r{}'.format(layer)].mm(B.t()))
 
-        self.parameters['B1'] = config['b-init'] * (torch.rand(config['n1'], config['n2'], device=config['device']) - 0.5)
+            self.update_layer(config, layer, error)
+            self.update_backward_weights(config, layer - 1, error_b)
+            error = next_error
+        self.update_layer(config, 1, error)
 
-        self.vars = {}
-        self.reset_state()
+class Net1(LayeredNet):
+    """ Leaky ReLU network from the 28*28 input to the layers given by
+    config['layers'] or config['n1'], config['n2'], ..., the last of which
+    is the output layer."""
+    def __init__(self, config):
+        super().__init__(config)
         self.slope = 0.01
-        self.config = config
+
+    def get_layer_sizes(self, config):
+        return [28*28] + get_layer_sizes(config)
 
     def reset_state(self):
-        self.vars['r0'] = None
-        self.vars['r1'] = None
-        self.vars['r2'] = None
+        super().reset_state()
+        for layer in range(1, self.nb_layers + 1):
+            self.vars['dr{}'.format(layer)] = None
 
     def forward(self, x):
-        leaky_relu = nn.LeakyReLU(self.slope)
-        self.vars['r0'] = x.view(-1, 28*28)
-        self.vars['r1'] = leaky_relu(self.vars['r0'].mm(self.parameters['W1'].t()) + self.parameters['b1'])
-        self.vars['r2'] = leaky_relu(self.vars['r1'].mm(self.parameters['W2'].t()) + self.parameters['b2'])
-        return self.vars['r2']
-
-    def learn(self, config, target_categorical):
-        if self.vars['r0'] is None:
-            raise StatelessNetError('Uninitialized network.')
-
-    def get_numpy_parameters(self):
-        parameters = {}
-        for param_name, param in self.parameters.items():
-            parameters[param_name] = self.parameters[param_name].cpu().numpy().copy()
-        return parameters
-
-    def jac(self,activation):
-        jac = torch.empty(activation.shape,
-                             device=self.config['device'])
-        for b in range(activation.shape[0]):
-            for i in range(activation.shape[1]):
-                if activation[b,i] < 0:
-                    jac[b,i] = self.slope
-                else:
-                    jac[b,i] = 1.
-
+        r = x.view(-1, 28*28)
+        self.vars['r0'] = r
+        for layer in range(1, self.nb_layers + 1):
+            a = torch.addmm(self.parameters['b{}'.format(layer)], r, self.parameters['W{}'.format(layer)].t())
+            r = F.leaky_relu(a, self.slope)
+            self.vars['r{}'.format(layer)] = r
+            # Derivative of the leaky ReLU, cached for learn
+            self.vars['dr{}'.format(layer)] = self.jac(a)
+        return r
+
+    def jac(self, activation):
+        jac = torch.ones_like(activation)
+        jac.masked_fill_(activation < 0, self.slope)
         return jac
 
 class CapsuleNetBP(Net1):
+    @torch.no_grad()
     def learn(self, config, target_categorical):
         super().learn(config, target_categorical)
 
-        # Convert target_categorical to a one-hot encoded pattern of activity.
-        target = torch.empty(target_categorical.shape[0], 10,
-                             device=config['device'])
-        target.zero_()
-        target.scatter_(1, target_categorical.unsqueeze(1), 1)
+        target = self.get_one_hot_target(target_categorical)
 
         # Derivative of neuron-by-neuron cross-entropy loss wrt to output activations.
-        e2 = self.compute_capsule_error(target)
-
-        # Efficiently compute average of outer products.
-        dW2 = torch.sum(
-            torch.bmm(e2.unsqueeze(2), self.vars['r1'].unsqueeze(1)), dim=0)
-        db2 = torch.sum(e2, dim=0)
-
-        dr1 = self.jac(self.vars['r1'])
-        e1 = dr1 * e2.mm(self.parameters['W2'])
-        dW1 = torch.sum(
-            torch.bmm(e1.unsqueeze(2), self.vars['r0'].unsqueeze(1)), dim=0)
-        db1 = torch.sum(e1, dim=0)
-
-        # In BP only forward weights are learned.
-        self.parameters['W2'] += config['eta2'] / config['batch-size'] * dW2
-        self.parameters['b2'] += config['eta2'] / config['batch-size'] * db2
-        self.parameters['W1'] += config['eta1'] / config['batch-size'] * dW1
-        self.parameters['b1'] += config['eta1'] / config['batch-size'] * db1
+        error = self.compute_capsule_error(target)
+        for layer in range(self.nb_layers, 1, -1):
+            dr = self.vars['dr{}'.format(layer - 1)]
+            next_error = dr * error.mm(self.parameters['W{}'.format(layer)])
+            # In BP only forward weights are learned.
+            self.update_layer(config, layer, error)
+            error = next_error
+        self.update_layer(config, 1, error)
 
     def compute_capsules(self):
-        config = self.config
-        excess = config['n2'] % 10
-        capsule_base_size = int(config['n2'] / 10)
+        nb_capsule_units = self.layer_sizes[-1]
+        excess = nb_capsule_units % 10
+        capsule_base_size = int(nb_capsule_units / 10)
         capsule_indices = {}
         capsule_magnitudes = torch.zeros(self.vars['r0'].shape[0], 10,
                              device=self.config['device'])
@@ -236,7 +215,7 @@ class CapsuleNetBP(Net1):
 
             # compute magnitude capsules
             capsule_magnitudes[:, capsule] = torch.norm(
-                self.vars['r2'][:, start:stop], dim=1
+                self.vars['r{}'.format(self.nb_layers)][:, start:stop], dim=1
             )
             # initialize start for next iteration
             start = stop
@@ -249,10 +228,7 @@ class CapsuleNetBP(Net1):
         self.vars['capsule_squashed'] = capsule_squashed
 
     def forward(self, x):
-        leaky_relu = nn.LeakyReLU(self.slope)
-        self.vars['r0'] = x.view(-1, 28*28)
-        self.vars['r1'] = leaky_relu(self.vars['r0'].mm(self.parameters['W1'].t()) + self.parameters['b1'])
-        self.vars['r2'] = leaky_relu(self.vars['r1'].mm(self.parameters['W2'].t()) + self.parameters['b2'])
+        super().forward(x)
         self.compute_capsules()
         return self.vars['capsule_squashed']
 
@@ -265,7 +241,7 @@ class CapsuleNetBP(Net1):
         capsule_magnitudes = self.vars['capsule_magnitudes']
 
         # compute loss gradient
-        gradient = torch.empty(self.vars['r2'].shape,
+        gradient = torch.empty(self.vars['r{}'.format(self.nb_layers)].shape,
                              device=self.config['device'])
         Lk_vk = -2 * target * \
                 torch.max(torch.stack([m_plus - capsule_squashed,
@@ -285,7 +261,7 @@ class CapsuleNetBP(Net1):
             start = capsule_indices[capsule][0]
             stop = capsule_indices[capsule][1]
             vk_sk = 1/((1+capsule_magnitudes[:,capsule].unsqueeze(1)**2)**2)\
-                    * 2*self.vars['r2'][:, start:stop]
+                    * 2*self.vars['r{}'.format(self.nb_layers)][:, start:stop]
 
             gradient[:, start:stop] = Lk_vk[:, capsule].unsqueeze(1) * vk_sk
 
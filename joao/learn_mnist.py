@@ -9,6 +9,7 @@ import numpy as np
 import matplotlib.pyplot as plt
 import json
 import joao.bionets as bionets
+from utils.prefetch import BatchPrefetcher
 
 # MODEL = 'FA'
 # CONFIG_FILENAME = 'etc/mnist_feedback_alignment_config.json'
@@ -26,9 +27,11 @@ loss_function = nn.CrossEntropyLoss()
 
 def train(config, log_file, model, device, train_loader, epoch):
     print('start training')
-    for batch_idx, (data, target) in enumerate(train_loader):
+    train_batches = BatchPrefetcher(
+        train_loader, lambda data, target: (data.to(device),
+                                            target.to(device)))
+    for batch_idx, (data, target) in enumerate(train_batches):
 
-        data, target = data.to(device), target.to(device)
         output = model.forward(data)
         model.learn(config, target)
         if batch_idx % config['log-interval'] == 0:
@@ -40,6 +43,10 @@ def train(config, log_file, model, device, train_loader, epoch):
                 epoch, batch_idx * len(data), len(train_loader.dataset),
                        100. * batch_idx / len(train_loader), loss))
             log_file.flush()
+    if config.get('print-data-wait-time', False):
+        print('Data wait time: {:.3f}s'.format(train_batches.wait_time),
+              file=log_file)
+        print('Data wait time: {:.3f}s'.format(train_batches.wait_time))
 
 def test(config, log_file, model, device, test_loader):
     test_loss = 0
@@ -37,10 +37,10 @@ class DTPLayer(TargetPropLayer):
         activation_inverse = self.backward_nonlinearity(
             upper_layer.forward_output, upper_layer)
 
-        target_linear = torch.matmul(self.backward_weights,
+        target_linear = hf.batch_matmul(self.backward_weights,
                                        target_inverse)  + self.backward_bias
 
-        activation_linear = torch.matmul(self.backward_weights,
+        activation_linear = hf.batch_matmul(self.backward_weights,
                                        activation_inverse) + self.backward_bias
 
         backward_output = self.forward_output + target_linear - \
@@ -87,38 +87,22 @@ class DTPLeakyReluLayer(DTPLayer):
     def inverse_nonlinearity(self, input):
         """ perform the inverse of the forward nonlinearity on the given
         input. """
-        output = torch.empty(input.shape)
-        for i in range(input.size(0)):
-            for j in range(input.size(1)):
-                for k in range(input.size(2)):
-                    if input[i, j, k] >= 0:
-                        output[i, j, k] = input[i, j, k]
-                    else:
-                        output[i, j, k] = input[i, j, k] / self.negative_slope
-        return output
+        return torch.where(input >= 0, input, input / self.negative_slope)
 
     def compute_vectorized_jacobian(self):
         """ Compute the vectorized jacobian. The jacobian is a diagonal
         matrix, so can be represented by a vector instead of a matrix. """
 
-        output = torch.empty(self.forward_output.shape)
-        for i in range(self.forward_linear_activation.size(0)):
-            for j in range(self.forward_linear_activation.size(1)):
-                if self.forward_linear_activation[i, j, 0] >= 0:
-                    output[i, j, 0] = 1
-                else:
-                    output[i, j, 0] = self.negative_slope
-        return output
+        return torch.where(self.forward_linear_activation >= 0,
+                           torch.ones_like(self.forward_output),
+                           torch.full_like(self.forward_output,
+                                           self.negative_slope))
 
     def compute_inverse_vectorized_jacobian(self, linear_activation):
-        output = torch.empty(linear_activation.shape)
-        for i in range(linear_activation.size(0)):
-            for j in range(self.forward_output.size(1)):
-                if linear_activation[i, j, 0] >= 0:
-                    output[i, j, 0] = 1
-                else:
-                    output[i, j, 0] = self.negative_slope ** (-1)
-        return output
+        return torch.where(linear_activation >= 0,
+                           torch.ones_like(linear_activation),
+                           torch.full_like(linear_activation,
+                                           self.negative_slope ** (-1)))
 
 
 class TargetPropLinearLayer(DTPLayer):
@@ -131,7 +115,7 @@ class TargetPropLinearLayer(DTPLayer):
         return input
 
     def compute_vectorized_jacobian(self):
-        return torch.ones(self.forward_output.shape)
+        return torch.ones_like(self.forward_output)
 
 
 class DTPOutputLayer(DTPLayer):
@@ -258,10 +242,10 @@ class DTPLinearOutputLayer(DTPOutputLayer):
         return input
 
     def compute_vectorized_jacobian(self):
-        return torch.ones(self.forward_output.shape)
+        return torch.ones_like(self.forward_output)
 
     def compute_inverse_vectorized_jacobian(self, linear_activation):
-        return torch.ones(linear_activation.shape)
+        return torch.ones_like(linear_activation)
 
     def compute_backward_output(self, target):
         """ Compute the backward output based on a small move from the
@@ -17,7 +17,94 @@ from layers.bidirectional_layer import BidirectionalLayer
 from layers.target_prop_layer import TargetPropLayer
 
 class MTPLayer(TargetPropLayer):
-    """ Modified target propagation layer"""
+    """ Modified target propagation layer. The forward output is batch
+    normalized before it is passed to the next layer. Running statistics of
+    the normalization are kept, which are used in evaluation mode."""
+    # the running statistics are accumulated over the whole training
+    accumulation_state = TargetPropLayer.accumulation_state + \
+        ('running_mu', 'running_var')
+
+    def __init__(self, in_dim, layer_dim, out_dim, writer, loss_function='mse',
+                 name='MTP_layer', debug_mode=True,
+                 weight_decay=0.0, weight_decay_backward=0.0,
+                 fixed=False, momentum=0.1):
+        """
+        :param momentum: momentum of the exponential moving average of the
+        running statistics. If None, the cumulative mean and variance
+        over all training samples are kept instead.
+        """
+        super().__init__(in_dim, layer_dim, out_dim,
+                         writer=writer,
+                         loss_function=loss_function,
+                         name=name,
+                         debug_mode=debug_mode,
+                         weight_decay=weight_decay,
+                         weight_decay_backward=weight_decay_backward,
+                         fixed=fixed)
+        self.set_momentum(momentum)
+        self.reset_running_statistics()
+
+    def set_momentum(self, momentum):
+        if momentum is not None:
+            if not isinstance(momentum, float):
+                raise TypeError("Expecting a float or None for momentum, "
+                                "got {}".format(type(momentum)))
+            if not (momentum > 0. and momentum <= 1.):
+                raise ValueError("Expecting momentum in (0;1], got {}".format(
+                    momentum))
+        self.momentum = momentum
+
+    def reset_running_statistics(self):
+        self.running_mu = None
+        self.running_var = None
+        self.running_count = 0
+
+    def update_running_statistics(self, mu, var, batch_size):
+        """ Merge the mean and (unbiased) variance of a training batch into
+        the running statistics. Batches of size 1 are skipped, as their
+        variance is not defined."""
+        if batch_size < 2:
+            return
+        mu = mu.to(self.dtype_policy.accumulation_dtype)
+        var = var.to(self.dtype_policy.accumulation_dtype)
+        if self.running_mu is None:
+            self.running_mu = mu
+            self.running_var = var
+        elif self.momentum is None:
+            # Chan et al.'s parallel variant of Welford's algorithm
+            count = self.running_count + batch_size
+            delta = mu - self.running_mu
+            m2 = self.running_var*(self.running_count - 1) + \
+                 var*(batch_size - 1) + \
+                 delta**2*self.running_count*batch_size/count
+            self.running_mu = self.running_mu + delta*batch_size/count
+            self.running_var = m2/(count - 1)
+        else:
+            self.running_mu = (1. - self.momentum)*self.running_mu + \
+                              self.momentum*mu
+            self.running_var = (1. - self.momentum)*self.running_var + \
+                               self.momentum*var
+        self.running_count += batch_size
+
+    def set_normalization_statistics(self, forward_output):
+        """ Set the mu and sigma used for the batch normalization: the batch
+        statistics in training mode and the running statistics in
+        evaluation mode."""
+        if self.training:
+            self.mu = torch.mean(forward_output, dim=0)
+            var = torch.var(forward_output, dim=0)
+            self.sigma = torch.sqrt(var)
+            self.update_running_statistics(self.mu, var,
+                                           forward_output.shape[0])
+        else:
+            if self.running_mu is None:
+                raise NetworkError("No running statistics available for {} "
+                                   "in evaluation mode, propagate training "
+                                   "batches of size > 1 first".format(
+                    self.name))
+            compute_dtype = self.dtype_policy.compute_dtype
+            self.mu = self.running_mu.to(compute_dtype)
+            self.sigma = torch.sqrt(self.running_var).to(compute_dtype)
 
     def propagate_forward(self, lower_layer):
         """
@@ -38,15 +125,18 @@ class MTPLayer(TargetPropLayer):
             forward_input = lower_layer.forward_output
         else:
             forward_input = lower_layer.forward_output_batchnorm
-        self.forward_linear_activation = torch.matmul(self.forward_weights,
+        self.forward_linear_activation = hf.batch_matmul(self.forward_weights,
                                                  forward_input) + \
                                     self.forward_bias
         forward_output = self.forward_nonlinearity(
             self.forward_linear_activation)
-        self.mu = torch.mean(forward_output, dim=0)
-        self.sigma = torch.std(forward_output, dim=0)
+        self.set_normalization_statistics(forward_output)
         self.set_forward_output(forward_output)
-        self.forward_output_batchnorm = 1./self.sigma*(forward_output-self.mu)
+        # (forward_output - mu)/sigma in one fused pass over the batch
+        inv_sigma = 1./self.sigma
+        self.forward_output_batchnorm = torch.addcmul(-self.mu*inv_sigma,
+                                                      forward_output,
+                                                      inv_sigma)
 
 
     def propagate_backward(self, upper_layer):
@@ -66,10 +156,11 @@ class MTPLayer(TargetPropLayer):
             backward_input, upper_layer)
 
 
-        backward_output_batchnorm = torch.matmul(self.backward_weights,
+        backward_output_batchnorm = hf.batch_matmul(self.backward_weights,
                                       target_inverse) + self.backward_bias
         self.backward_output_batchnorm = backward_output_batchnorm
-        backward_output = self.sigma*backward_output_batchnorm + self.mu
+        backward_output = torch.addcmul(self.mu, self.sigma,
+                                        backward_output_batchnorm)
         self.set_backward_output(backward_output)
 
     def compute_forward_gradients(self, lower_layer):
@@ -93,12 +184,11 @@ class MTPLayer(TargetPropLayer):
         else:
             v = lower_layer.forward_output_batchnorm
 
-        weight_gradients = torch.matmul(u, torch.transpose(v, -1, -2))
+        weight_gradients = hf.batch_outer_product_mean(u, v)
 
         # bias_gradients = u
-        bias_gradients = torch.zeros(u.shape)
-        self.set_forward_gradients(torch.mean(weight_gradients, 0), torch.mean(
-            bias_gradients, 0))
+        bias_gradients = u.new_zeros(u.shape[1:])
+        self.set_forward_gradients(weight_gradients, bias_gradients)
 
 class MTPLeakyReluLayer(MTPLayer):
     """ Layer of an invertible neural network with a leaky RELU activation
@@ -111,7 +201,8 @@ class MTPLeakyReluLayer(MTPLayer):
                  debug_mode=True,
                  weight_decay=0.0,
                  weight_decay_backward = 0.0,
-                 fixed=False):
+                 fixed=False,
+                 momentum=0.1):
         super().__init__(in_dim, layer_dim, out_dim,
                          writer=writer,
                          loss_function=loss_function,
@@ -119,7 +210,8 @@ class MTPLeakyReluLayer(MTPLayer):
                          debug_mode=debug_mode,
                          weight_decay=weight_decay,
                          weight_decay_backward=weight_decay_backward,
-                         fixed=fixed)
+                         fixed=fixed,
+                         momentum=momentum)
         self.set_negative_slope(negative_slope)
 
     def set_negative_slope(self, negative_slope):
@@ -140,38 +232,21 @@ class MTPLeakyReluLayer(MTPLayer):
     def inverse_nonlinearity(self, input):
         """ perform the inverse of the forward nonlinearity on the given
         input. """
-        output = torch.empty(input.shape)
-        for i in range(input.size(0)):
-            for j in range(input.size(1)):
-                for k in range(input.size(2)):
-                    if input[i, j, k] >= 0:
-                        output[i, j, k] = input[i, j, k]
-                    else:
-                        output[i, j, k] = input[i, j, k] / self.negative_slope
-        return output
+        return torch.where(input >= 0, input, input / self.negative_slope)
 
     def compute_vectorized_jacobian(self):
         """ Compute the vectorized jacobian. The jacobian is a diagonal
         matrix, so can be represented by a vector instead of a matrix. """
-
-        output = torch.empty(self.forward_output.shape)
-        for i in range(self.forward_linear_activation.size(0)):
-            for j in range(self.forward_linear_activation.size(1)):
-                if self.forward_linear_activation[i, j, 0] >= 0:
-                    output[i, j, 0] = 1
-                else:
-                    output[i, j, 0] = self.negative_slope
-        return output
+        return torch.where(self.forward_linear_activation >= 0,
+                           torch.ones_like(self.forward_output),
+                           torch.full_like(self.forward_output,
+                                           self.negative_slope))
 
     def compute_inverse_vectorized_jacobian(self, linear_activation):
-        output = torch.empty(linear_activation.shape)
-        for i in range(linear_activation.size(0)):
-            for j in range(self.forward_output.size(1)):
-                if linear_activation[i, j, 0] >= 0:
-                    output[i, j, 0] = 1
-                else:
-                    output[i, j, 0] = self.negative_slope**(-1)
-        return output
+        return torch.where(linear_activation >= 0,
+                           torch.ones_like(linear_activation),
+                           torch.full_like(linear_activation,
+                                           self.negative_slope**(-1)))
 
 
 class MTPLinearLayer(MTPLayer):
@@ -184,7 +259,7 @@ class MTPLinearLayer(MTPLayer):
         return input
 
     def compute_vectorized_jacobian(self):
-        return torch.ones(self.forward_output.shape)
+        return torch.ones_like(self.forward_output)
 
 
 class MTPOutputLayer(MTPLayer):
@@ -225,13 +300,13 @@ class MTPOutputLayer(MTPLayer):
                              "propagating forward")
 
         forward_input = lower_layer.forward_output
-        self.forward_linear_activation = torch.matmul(self.forward_weights,
+        self.forward_linear_activation = hf.batch_matmul(self.forward_weights,
                                                  forward_input) + \
                                     self.forward_bias
         forward_output = self.forward_nonlinearity(
             self.forward_linear_activation)
-        self.mu = torch.ones((forward_output.shape[1], forward_output.shape[2]))
-        self.sigma = torch.ones((forward_output.shape[1], forward_output.shape[2]))
+        self.mu = forward_output.new_ones(forward_output.shape[1:])
+        self.sigma = forward_output.new_ones(forward_output.shape[1:])
         self.set_forward_output(forward_output)
 
     def set_output_loss_function(self, output_loss_function):
@@ -337,10 +412,10 @@ class MTPLinearOutputLayer(MTPOutputLayer):
         return input
 
     def compute_vectorized_jacobian(self):
-        return torch.ones(self.forward_output.shape)
+        return torch.ones_like(self.forward_output)
 
     def compute_inverse_vectorized_jacobian(self, linear_activation):
-        return torch.ones(linear_activation.shape)
+        return torch.ones_like(linear_activation)
 
     def compute_backward_output(self, target):
         """ Compute the backward output based on a small move from the
@@ -429,8 +504,7 @@ class MTPInputLayer(MTPLayer):
 
 
     def propagate_backward(self, upper_layer):
-        self.mu = torch.ones((self.forward_output.shape[1],
-                              self.forward_output.shape[2]))
-        self.sigma = torch.ones(
-            (self.forward_output.shape[1], self.forward_output.shape[2]))
+        self.mu = self.forward_output.new_ones(self.forward_output.shape[1:])
+        self.sigma = self.forward_output.new_ones(
+            self.forward_output.shape[1:])
         super().propagate_backward(upper_layer)
@@ -17,6 +17,10 @@ from layers.layer import Layer
 class BidirectionalLayer(Layer):
     """ Layer in a neural network with feedforward weights as well as
     feedbackward weights."""
+    compute_state = Layer.compute_state + ('backward_weights',
+                                           'backward_bias',
+                                           'backward_weights_grad',
+                                           'backward_bias_grad')
 
     def __init__(self, in_dim, layer_dim, out_dim, writer, loss_function='mse',
                  name='bidirectional_layer', debug_mode=True,
@@ -18,6 +18,14 @@ from layers.bidirectional_layer import BidirectionalLayer
 
 class InvertibleLayer(BidirectionalLayer):
     """ Layer that is invertible to make it able to propagate exact targets."""
+    # the backward weights are the inverse tracked with the sherman-morrison
+    # formula, so they are kept in the accumulation dtype
+    compute_state = tuple(name for name in BidirectionalLayer.compute_state
+                          if name != 'backward_weights') + \
+        ('forward_weights_tilde', 'forward_bias_tilde')
+    accumulation_state = BidirectionalLayer.accumulation_state + \
+        ('backward_weights',)
+    history_state = ('approx_errors', 'approx_error_angles')
 
     def __init__(self, in_dim, layer_dim, out_dim, writer, loss_function='mse',
                  name='invertible_layer', epsilon=0.5, debug_mode=True,
@@ -41,8 +49,7 @@ class InvertibleLayer(BidirectionalLayer):
                          fixed=fixed)
         self.init_forward_parameters_tilde()
         self.set_epsilon(epsilon)
-        self.approx_errors = torch.Tensor([])
-        self.approx_error_angles = torch.Tensor([])
+        self.set_history_policy()
 
     def init_forward_parameters_tilde(self):
         """ Initializes the layer parameters that connect the current layer
@@ -70,7 +77,8 @@ class InvertibleLayer(BidirectionalLayer):
         inverses later in training"""
         self.backward_weights = torch.inverse(
             torch.cat((upper_layer.forward_weights,
-                       upper_layer.forward_weights_tilde), 0))
+                       upper_layer.forward_weights_tilde), 0).to(
+                self.dtype_policy.accumulation_dtype))
         self.backward_bias = - torch.cat((upper_layer.forward_bias,
                                           upper_layer.forward_bias_tilde), 0)
 
@@ -137,15 +145,15 @@ class InvertibleLayer(BidirectionalLayer):
 
         forward_input = lower_layer.forward_output
         if self.forward_weights_tilde.size(0) > 0:
-            linear_activation_tilde = torch.matmul(self.forward_weights_tilde,
-                                                 forward_input) + \
-                                    self.forward_bias_tilde
+            linear_activation_tilde = hf.batch_matmul(
+                self.forward_weights_tilde, forward_input) + \
+                self.forward_bias_tilde
             forward_output_tilde = linear_activation_tilde
             # no need to put through
             # nonlinearity, as in the backward pass, the inverse non-linearity
             # would be applied. Now we skip both to save computation
         else:
-            forward_output_tilde = torch.empty(0)
+            forward_output_tilde = forward_input.new_empty(0)
         self.set_forward_output_tilde(forward_output_tilde)
 
     def propagate_forward(self, lower_layer):
@@ -170,10 +178,11 @@ class InvertibleLayer(BidirectionalLayer):
         formula
         """
         # take learning rate into u to apply Sherman-morrison formula later on
-        u = torch.mul(upper_layer.u, -learning_rate)
-        v = upper_layer.v
+        accumulation_dtype = self.dtype_policy.accumulation_dtype
+        u = torch.mul(upper_layer.u.to(accumulation_dtype), -learning_rate)
+        v = upper_layer.v.to(accumulation_dtype)
         if u.shape[0] < v.shape[0]:
-            u = torch.cat((u, torch.zeros((v.shape[0] - u.shape[0],
+            u = torch.cat((u, u.new_zeros((v.shape[0] - u.shape[0],
                                            u.shape[1]))), 0)
         # apply Sherman-morrison formula to compute inverse
 
@@ -192,7 +201,7 @@ class InvertibleLayer(BidirectionalLayer):
         epsilon = self.epsilon # threshold
 
         if torch.abs(denominator) < epsilon:
-            self.beta = 1/(epsilon-d)
+            self.beta = float(1/(epsilon-d))
             backward_weights = self.backward_weights - torch.div(numerator,
                                                                  epsilon)
             # forward weights were already updated, so new update with (beta-1)
@@ -211,6 +220,11 @@ class InvertibleLayer(BidirectionalLayer):
                                     upper_layer.forward_bias_tilde), 0)
         self.set_backward_parameters(backward_weights, backward_bias)
 
+    def get_compute_backward_weights(self):
+        """ Return the backward weights in the compute dtype, as they are
+        stored in the accumulation dtype of the dtype policy."""
+        return self.backward_weights.to(self.dtype_policy.compute_dtype)
+
     def propagate_backward(self, upper_layer):
         """Propagate the target signal from the upper layer to the current
         layer (self)
@@ -230,7 +244,7 @@ class InvertibleLayer(BidirectionalLayer):
         target_bar_inverse = torch.cat((target_inverse,
                                        upper_layer.forward_output_tilde), -2)
 
-        backward_output = torch.matmul(self.backward_weights,
+        backward_output = hf.batch_matmul(self.get_compute_backward_weights(),
                                       target_bar_inverse + self.backward_bias)
         self.set_backward_output(backward_output)
 
@@ -260,7 +274,7 @@ class InvertibleLayer(BidirectionalLayer):
         weight_gradients = torch.matmul(u, torch.transpose(v, -1, -2))
 
         # bias_gradients = u
-        bias_gradients = torch.zeros(u.shape)
+        bias_gradients = torch.zeros_like(u)
         self.set_weight_update_u(torch.reshape(u, (u.shape[-2], u.shape[-1])))
         self.set_weight_update_v(torch.reshape(v, (v.shape[-2], v.shape[-1])))
         self.set_forward_gradients(torch.mean(weight_gradients, 0), torch.mean(
@@ -282,17 +296,20 @@ class InvertibleLayer(BidirectionalLayer):
         """
         forward_weights_bar = torch.cat((upper_layer.forward_weights,
                                        upper_layer.forward_weights_tilde), 0)
-        error = torch.matmul(self.backward_weights, forward_weights_bar) \
-                - torch.eye(self.backward_weights.shape[0])
+        dtype = self.backward_weights.dtype
+        error = torch.matmul(self.backward_weights,
+                             forward_weights_bar.to(dtype)) \
+                - torch.eye(self.backward_weights.shape[0], dtype=dtype)
         return torch.norm(error)
 
     def check_inverse2(self, upper_layer):
         forward_propagated = upper_layer.forward_nonlinearity(
-            torch.matmul(upper_layer.forward_weights, self.forward_output) + \
-            upper_layer.forward_bias)
-        backward_propagated = torch.matmul(self.backward_weights,
-                         upper_layer.inverse_nonlinearity(forward_propagated)\
-                                           + self.backward_bias)
+            hf.batch_matmul(upper_layer.forward_weights,
+                            self.forward_output) + upper_layer.forward_bias)
+        backward_propagated = hf.batch_matmul(
+            self.get_compute_backward_weights(),
+            upper_layer.inverse_nonlinearity(forward_propagated) +
+            self.backward_bias)
         return self.forward_output - backward_propagated
 
     def save_inverse_error(self, upper_layer):
@@ -311,8 +328,8 @@ class InvertibleLayer(BidirectionalLayer):
 
     def propagate_GN_error(self, upper_layer):
         D_inv = upper_layer.compute_inverse_vectorized_jacobian()
-        self.GN_error = torch.matmul(self.backward_weights,
-                                     D_inv*upper_layer.GN_error)
+        self.GN_error = hf.batch_matmul(self.get_compute_backward_weights(),
+                                        D_inv*upper_layer.GN_error)
 
     def compute_inverse_vectorized_jacobian(self):
         """ Should be implemented by child class"""
@@ -336,15 +353,14 @@ class InvertibleLayer(BidirectionalLayer):
         self.writer.add_scalar(tag='{}/approx_angle_error'.format(self.name),
                                scalar_value=angle,
                                global_step=self.global_step)
-        self.approx_error_angles = torch.cat((self.approx_error_angles,
-                                              angle))
+        self.approx_error_angles.append(angle)
 
     def save_approx_error(self):
         error = torch.mean(torch.norm(self.compute_approx_error(), dim=1))
         self.writer.add_scalar(tag='{}/approx_error'.format(self.name),
                                scalar_value=error,
                                global_step=self.global_step)
-        self.approx_errors = torch.cat((self.approx_errors, torch.Tensor([error])))
+        self.approx_errors.append(error)
 
     def save_state(self):
         super().save_state()
@@ -393,38 +409,22 @@ class InvertibleLeakyReluLayer(InvertibleLayer):
     def inverse_nonlinearity(self, input):
         """ perform the inverse of the forward nonlinearity on the given
         input. """
-        output = torch.empty(input.shape)
-        for i in range(input.size(0)):
-            for j in range(input.size(1)):
-                for k in range(input.size(2)):
-                    if input[i, j, k] >= 0:
-                        output[i, j, k] = input[i, j, k]
-                    else:
-                        output[i, j, k] = input[i, j, k] / self.negative_slope
-        return output
+        return torch.where(input >= 0, input, input / self.negative_slope)
 
     def compute_vectorized_jacobian(self):
         """ Compute the vectorized jacobian. The jacobian is a diagonal
         matrix, so can be represented by a vector instead of a matrix. """
 
-        output = torch.empty(self.forward_output.shape)
-        for i in range(self.forward_linear_activation.size(0)):
-            for j in range(self.forward_linear_activation.size(1)):
-                if self.forward_linear_activation[i, j, 0] >= 0:
-                    output[i, j, 0] = 1
-                else:
-                    output[i, j, 0] = self.negative_slope
-        return output
+        return torch.where(self.forward_linear_activation >= 0,
+                           torch.ones_like(self.forward_output),
+                           torch.full_like(self.forward_output,
+                                           self.negative_slope))
 
     def compute_inverse_vectorized_jacobian(self):
-        output = torch.empty(self.forward_output.shape)
-        for i in range(self.forward_output.size(0)):
-            for j in range(self.forward_output.size(1)):
-                if self.forward_output[i, j, 0] >= 0:
-                    output[i, j, 0] = 1
-                else:
-                    output[i, j, 0] = self.negative_slope**(-1)
-        return output
+        return torch.where(self.forward_output >= 0,
+                           torch.ones_like(self.forward_output),
+                           torch.full_like(self.forward_output,
+                                           self.negative_slope**(-1)))
 
 
 class InvertibleLinearLayer(InvertibleLayer):
@@ -437,7 +437,7 @@ class InvertibleLinearLayer(InvertibleLayer):
         return input
 
     def compute_vectorized_jacobian(self):
-        return torch.ones(self.forward_output.shape)
+        return torch.ones_like(self.forward_output)
 
 
 class InvertibleOutputLayer(InvertibleLayer):
@@ -564,10 +564,10 @@ class InvertibleLinearOutputLayer(InvertibleOutputLayer):
         return input
 
     def compute_vectorized_jacobian(self):
-        return torch.ones(self.forward_output.shape)
+        return torch.ones_like(self.forward_output)
 
     def compute_inverse_vectorized_jacobian(self):
-        return torch.ones(self.forward_output.shape)
+        return torch.ones_like(self.forward_output)
 
     def compute_backward_output(self, target):
         """ Compute the backward output based on a small move from the
@@ -691,7 +691,7 @@ class InvertibleSoftmaxOutputLayer(InvertibleOutputLayer):
         weight_gradients = torch.matmul(u, torch.transpose(v, -1, -2))
 
         # bias_gradients = u
-        bias_gradients = torch.zeros(u.shape)
+        bias_gradients = torch.zeros_like(u)
         self.set_weight_update_u(torch.reshape(u, (u.shape[-2], u.shape[-1])))
         self.set_weight_update_v(torch.reshape(v, (v.shape[-2], v.shape[-1])))
         self.set_forward_gradients(torch.mean(weight_gradients, 0), torch.mean(
@@ -852,15 +852,17 @@ class InvertibleCapsuleOutputLayer(InvertibleClassificationOutputLayer):
         return input
 
     def compute_vectorized_jacobian(self):
-        return torch.ones(self.forward_output.shape)
+        return torch.ones_like(self.forward_output)
+
+    def compute_inverse_vectorized_jacobian(self):
+        return torch.ones_like(self.forward_output)
 
     def compute_capsules(self):
         linear_activation = self.forward_linear_activation
-        self.capsule_magnitudes = torch.empty((linear_activation.shape[0],
-                                               self.nb_classes, 1))
-        self.capsules = torch.zeros((linear_activation.shape[0],
-                                     self.nb_classes,
-                                     self.capsule_size))
+        self.capsule_magnitudes = linear_activation.new_empty(
+            (linear_activation.shape[0], self.nb_classes, 1))
+        self.capsules = linear_activation.new_zeros(
+            (linear_activation.shape[0], self.nb_classes, self.capsule_size))
         for k in range(self.nb_classes):
             if k < self.excess:
                 self.capsules[:, k, 0:self.capsule_size] = linear_activation[:,
@@ -884,13 +886,13 @@ class InvertibleCapsuleOutputLayer(InvertibleClassificationOutputLayer):
             m_min = self.m_min
             L_k = target * \
                   torch.max(torch.stack([m_plus - self.capsule_squashed,
-                                         torch.zeros(
-                                             self.capsule_squashed.shape)]),
+                                         torch.zeros_like(
+                                             self.capsule_squashed)]),
                             dim=0)[0] ** 2 + \
                   l * (1 - target) * \
                   torch.max(torch.stack([self.capsule_squashed - m_min,
-                                         torch.zeros(
-                                             self.capsule_squashed.shape)]),
+                                         torch.zeros_like(
+                                             self.capsule_squashed)]),
                             dim=0)[0] ** 2
             loss = torch.sum(L_k, dim=1)
             loss = torch.Tensor([torch.mean(loss)])
@@ -919,19 +921,19 @@ class InvertibleCapsuleOutputLayer(InvertibleClassificationOutputLayer):
         l = self.l
         Lk_vk = -2 * target * \
                 torch.max(torch.stack([m_plus - self.capsule_squashed,
-                                       torch.zeros(
-                                           self.capsule_squashed.shape)]),
+                                       torch.zeros_like(
+                                           self.capsule_squashed)]),
                           dim=0)[0] + \
                 2 * l * (1 - target) * \
                 torch.max(torch.stack([self.capsule_squashed \
                                        - m_min,
-                                       torch.zeros(
-                                           self.capsule_squashed.shape)]),
+                                       torch.zeros_like(
+                                           self.capsule_squashed)]),
                           dim=0)[0]
         vk_sk = 1 / ((
                                  1 + self.capsule_magnitudes ** 2) ** 2) * \
                 2 * self.capsules
-        backward_output = torch.empty(self.forward_linear_activation.shape)
+        backward_output = torch.empty_like(self.forward_linear_activation)
         for k in range(self.nb_classes):
             start = self.capsule_indices[k][0]
             stop = self.capsule_indices[k][1]
@@ -947,6 +949,11 @@ class InvertibleCapsuleOutputLayer(InvertibleClassificationOutputLayer):
                                                                self.step_size)
         self.set_backward_output(backward_output)
 
+    def compute_GN_error(self, target):
+        """ The backward output is a gradient step on the capsule loss, so the
+        GN error of the output layer is this step."""
+        self.GN_error = self.forward_output - self.backward_output
+
     def init_forward_parameters(self):
         """ Initializes the layer parameters when the layer is created.
                 This method should only be used when creating
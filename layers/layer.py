@@ -12,7 +12,8 @@ import torch
 import torch.nn as nn
 import torch.nn.functional as F
 from utils import helper_functions as hf
-from utils.helper_classes import NetworkError
+from utils.helper_classes import NetworkError, DTypePolicy, Float32Writer
+from utils.history import History
 from tensorboardX import SummaryWriter
 
 
@@ -22,6 +23,15 @@ class Layer(object):
     only via its children"""
     # create class variable of existing layer names
     all_layer_names = []
+    # tensors of the layer that are cast to the compute dtype resp.
+    # accumulation dtype of the dtype policy (see set_dtype_policy)
+    compute_state = ('forward_weights', 'forward_bias', 'forward_weights_grad',
+                     'forward_bias_grad', 'forward_weights_vel',
+                     'forward_bias_vel')
+    accumulation_state = ()
+    # diagnostic histories that grow with the number of training steps (see
+    # utils.memory.MemoryMonitor)
+    history_state = ()
 
     def __init__(self, in_dim, layer_dim, writer, name='layer',
                  debug_mode=True, weight_decay=0.0, fixed=False):
@@ -39,11 +49,12 @@ class Layer(object):
             self.set_in_dim(in_dim)
         self.set_name(name)
         self.set_writer(writer=writer)
+        self.dtype_policy = DTypePolicy()
         self.init_forward_parameters()
         self.global_step = 0  # needed for making plots with tensorboard
         self.weight_decay = weight_decay
         self.fixed = fixed
-
+        self.training = True
 
     def set_writer(self, writer):
         if not isinstance(writer, SummaryWriter):
@@ -66,6 +77,50 @@ class Layer(object):
             raise ValueError("Expecting strictly positive layer dimension")
         self.in_dim = in_dim
 
+    def set_training(self, training):
+        """ Switch the layer between training mode and evaluation mode.
+        Only layers that keep running statistics (e.g. MTPLayer) behave
+        differently in evaluation mode."""
+        if not isinstance(training, bool):
+            raise TypeError("Expecting a bool for training, got {}".format(
+                type(training)))
+        self.training = training
+
+    def set_dtype_policy(self, dtype_policy):
+        """ Cast the state of the layer to the dtypes of dtype_policy. All
+        tensors the layer computes afterwards inherit these dtypes.
+        :param dtype_policy: DTypePolicy object or name of a predefined
+        policy (see DTypePolicy.from_name)
+        """
+        if isinstance(dtype_policy, str):
+            dtype_policy = DTypePolicy.from_name(dtype_policy)
+        if not isinstance(dtype_policy, DTypePolicy):
+            raise TypeError("Expecting a DTypePolicy object or a string for "
+                            "dtype_policy, got {}".format(type(dtype_policy)))
+        self.dtype_policy = dtype_policy
+        for name in self.compute_state:
+            self.cast_state(name, dtype_policy.compute_dtype)
+        for name in self.accumulation_state:
+            self.cast_state(name, dtype_policy.accumulation_dtype)
+        # tensorboardX can't log bfloat16 tensors
+        if isinstance(self.writer, Float32Writer):
+            self.writer = self.writer.writer
+        if dtype_policy.compute_dtype == torch.bfloat16:
+            self.writer = Float32Writer(self.writer)
+
+    def cast_state(self, name, dtype):
+        """ Cast the tensor attribute name to dtype, if the layer has it."""
+        tensor = getattr(self, name, None)
+        if isinstance(tensor, torch.Tensor) and tensor.is_floating_point():
+            setattr(self, name, tensor.to(dtype))
+
+    def set_history_policy(self, policy='all', capacity=None):
+        """ Store the diagnostic histories (see history_state) as History
+        objects with the given policy and capacity (see utils.history). The
+        values saved so far are discarded."""
+        for name in self.history_state:
+            setattr(self, name, History(policy, capacity))
+
     def set_name(self, name):
         if not isinstance(name, str):
             raise TypeError("Expecting a string as name for the layer")
@@ -180,8 +235,8 @@ class Layer(object):
         """ Initializes the velocities of the gradients. This should only be
         called when an optimizer with momentum
         is used, otherwise these attributes will not be used"""
-        self.forward_weights_vel = torch.zeros(self.layer_dim, self.in_dim)
-        self.forward_bias_vel = torch.zeros(self.layer_dim, 1)
+        self.forward_weights_vel = torch.zeros_like(self.forward_weights)
+        self.forward_bias_vel = torch.zeros_like(self.forward_bias)
 
     def set_forward_velocities(self, forward_weights_vel, forward_bias_vel):
         if not isinstance(forward_weights_vel, torch.Tensor):
@@ -204,8 +259,8 @@ class Layer(object):
 
     def zero_grad(self):
         """ Set the gradients of the layer parameters to zero """
-        self.forward_weights_grad = torch.zeros(self.layer_dim, self.in_dim)
-        self.forward_bias_grad = torch.zeros(self.layer_dim, 1)
+        self.forward_weights_grad = torch.zeros_like(self.forward_weights)
+        self.forward_bias_grad = torch.zeros_like(self.forward_bias)
 
     def update_forward_parameters(self, learning_rate):
         """
@@ -243,8 +298,8 @@ class Layer(object):
                              "propagating forward")
 
         self.forward_input = lower_layer.forward_output
-        forward_linear_activation = torch.matmul(self.forward_weights,
-                                                 self.forward_input) + \
+        forward_linear_activation = hf.batch_matmul(self.forward_weights,
+                                                    self.forward_input) + \
                                     self.forward_bias
         self.set_forward_linear_activation(forward_linear_activation)
         forward_output = self.forward_nonlinearity(
@@ -269,10 +324,10 @@ class Layer(object):
 
         """
 
-        weight_gradients = torch.matmul(self.backward_output, torch.transpose(
-            lower_layer.forward_output, -1, -2))
+        weight_gradients = hf.batch_outer_product_mean(
+            self.backward_output, lower_layer.forward_output)
         bias_gradients = self.backward_output
-        self.set_forward_gradients(torch.mean(weight_gradients, 0), torch.mean(
+        self.set_forward_gradients(weight_gradients, torch.mean(
             bias_gradients, 0))
 
     def compute_forward_gradient_velocities(self, lower_layer, momentum,
@@ -437,12 +492,11 @@ class ReluLayer(Layer):
 
         self.backward_input = upper_layer.backward_output
         # Construct vectorized Jacobian for all batch samples.
-        activation_der = torch.tensor(
-            [[[1.] if self.forward_linear_activation[i, j, 0] > 0
-              else [0.]
-              for j in range(self.forward_linear_activation.size(1))]
-             for i in range(self.forward_linear_activation.size(0))])
-        backward_output = torch.mul(torch.matmul(torch.transpose(
+        activation_der = torch.where(
+            self.forward_linear_activation > 0,
+            torch.ones_like(self.forward_linear_activation),
+            torch.zeros_like(self.forward_linear_activation))
+        backward_output = torch.mul(hf.batch_matmul(torch.transpose(
             upper_layer.forward_weights, -1, -2), self.backward_input),
             activation_der)
         self.set_backward_output(backward_output)
@@ -501,12 +555,12 @@ class LeakyReluLayer(Layer):
 
         self.backward_input = upper_layer.backward_output
         # Construct vectorized Jacobian for all batch samples.
-        activation_der = torch.tensor(
-            [[[1.] if self.forward_linear_activation[i, j, 0] > 0
-              else [self.negative_slope]
-              for j in range(self.forward_linear_activation.size(1))]
-             for i in range(self.forward_linear_activation.size(0))])
-        backward_output = torch.mul(torch.matmul(torch.transpose(
+        activation_der = torch.where(
+            self.forward_linear_activation > 0,
+            torch.ones_like(self.forward_linear_activation),
+            torch.full_like(self.forward_linear_activation,
+                            self.negative_slope))
+        backward_output = torch.mul(hf.batch_matmul(torch.transpose(
             upper_layer.forward_weights, -1, -2), self.backward_input),
             activation_der)
         self.set_backward_output(backward_output)
@@ -537,14 +591,11 @@ class SoftmaxLayer(Layer):
         self.backward_input = upper_layer.backward_output
         # Construct Jacobian for all batch samples.
         softmax_activations = self.forward_output
-        jacobian = torch.tensor([[[softmax_activations[i, j, 0] *
-                                   (hf.kronecker(j, k) - softmax_activations[
-                                       i, k, 0])
-                                   for k in range(softmax_activations.size(1))]
-                                  for j in range(softmax_activations.size(1))]
-                                 for i in range(softmax_activations.size(0))])
+        jacobian = torch.diag_embed(softmax_activations.squeeze(2)) - \
+            torch.matmul(softmax_activations,
+                         torch.transpose(softmax_activations, -1, -2))
         backward_output = torch.matmul(torch.transpose(jacobian, -1, -2),
-                                      torch.matmul(torch.transpose(
+                                      hf.batch_matmul(torch.transpose(
                                           upper_layer.forward_weights, -1, -2)
                                           , self.backward_input))
         self.set_backward_output(backward_output)
@@ -572,7 +623,7 @@ class LinearLayer(Layer):
                              "for propagating backwards")
 
         self.backward_input = upper_layer.backward_output
-        backward_output = torch.matmul(torch.transpose(
+        backward_output = hf.batch_matmul(torch.transpose(
             upper_layer.forward_weights, -1, -2), self.backward_input)
         self.set_backward_output(backward_output)
 
@@ -876,11 +927,10 @@ class CapsuleOutputLayer(ClassificationOutputLayer):
 
     def compute_capsules(self):
         linear_activation = self.forward_linear_activation
-        self.capsule_magnitudes = torch.empty((linear_activation.shape[0],
-                                               self.nb_classes, 1))
-        self.capsules = torch.zeros((linear_activation.shape[0],
-                                     self.nb_classes,
-                                     self.capsule_size))
+        self.capsule_magnitudes = linear_activation.new_empty(
+            (linear_activation.shape[0], self.nb_classes, 1))
+        self.capsules = linear_activation.new_zeros(
+            (linear_activation.shape[0], self.nb_classes, self.capsule_size))
         for k in range(self.nb_classes):
             if k < self.excess:
                 self.capsules[:, k, 0:self.capsule_size] = linear_activation[:,
@@ -906,13 +956,13 @@ class CapsuleOutputLayer(ClassificationOutputLayer):
             m_min = self.m_min
             L_k = target * \
                   torch.max(torch.stack([m_plus - self.capsule_squashed,
-                                         torch.zeros(
-                                             self.capsule_squashed.shape)]),
+                                         torch.zeros_like(
+                                             self.capsule_squashed)]),
                             dim=0)[0] ** 2 + \
                   l * (1 - target) * \
                   torch.max(torch.stack([self.capsule_squashed - m_min,
-                                         torch.zeros(
-                                             self.capsule_squashed.shape)]),
+                                         torch.zeros_like(
+                                             self.capsule_squashed)]),
                             dim=0)[0] ** 2
             loss = torch.sum(L_k, dim=1)
             loss = torch.Tensor([torch.mean(loss)])
@@ -941,19 +991,19 @@ class CapsuleOutputLayer(ClassificationOutputLayer):
         l = self.l
         Lk_vk = -2 * target * \
                 torch.max(torch.stack([m_plus - self.capsule_squashed,
-                                       torch.zeros(
-                                           self.capsule_squashed.shape)]),
+                                       torch.zeros_like(
+                                           self.capsule_squashed)]),
                           dim=0)[0] + \
                 2 * l * (1 - target) * \
                 torch.max(torch.stack([self.capsule_squashed \
                                        - m_min,
-                                       torch.zeros(
-                                           self.capsule_squashed.shape)]),
+                                       torch.zeros_like(
+                                           self.capsule_squashed)]),
                           dim=0)[0]
         vk_sk = 1 / ((
                              1 + self.capsule_magnitudes ** 2) ** 2) * \
                 2 * self.capsules
-        backward_output = torch.empty(self.forward_linear_activation.shape)
+        backward_output = torch.empty_like(self.forward_linear_activation)
         for k in range(self.nb_classes):
             start = self.capsule_indices[k][0]
             stop = self.capsule_indices[k][1]
@@ -41,7 +41,7 @@ class MTPInvertibleLayer(InvertibleLayer):
         weight_gradients = torch.matmul(u, torch.transpose(v, -1, -2))
 
         # bias_gradients = u
-        bias_gradients = torch.zeros(u.shape)
+        bias_gradients = torch.zeros_like(u)
         self.set_weight_update_u(torch.reshape(u, (u.shape[-2], u.shape[-1])))
         self.set_weight_update_v(torch.reshape(v, (v.shape[-2], v.shape[-1])))
         self.set_forward_gradients(torch.mean(weight_gradients, 0), torch.mean(
@@ -85,38 +85,22 @@ class MTPInvertibleLeakyReluLayer(MTPInvertibleLayer):
     def inverse_nonlinearity(self, input):
         """ perform the inverse of the forward nonlinearity on the given
         input. """
-        output = torch.empty(input.shape)
-        for i in range(input.size(0)):
-            for j in range(input.size(1)):
-                for k in range(input.size(2)):
-                    if input[i, j, k] >= 0:
-                        output[i, j, k] = input[i, j, k]
-                    else:
-                        output[i, j, k] = input[i, j, k] / self.negative_slope
-        return output
+        return torch.where(input >= 0, input, input / self.negative_slope)
 
     def compute_vectorized_jacobian(self):
         """ Compute the vectorized jacobian. The jacobian is a diagonal
         matrix, so can be represented by a vector instead of a matrix. """
 
-        output = torch.empty(self.forward_output.shape)
-        for i in range(self.forward_linear_activation.size(0)):
-            for j in range(self.forward_linear_activation.size(1)):
-                if self.forward_linear_activation[i, j, 0] >= 0:
-                    output[i, j, 0] = 1
-                else:
-                    output[i, j, 0] = self.negative_slope
-        return output
+        return torch.where(self.forward_linear_activation >= 0,
+                           torch.ones_like(self.forward_output),
+                           torch.full_like(self.forward_output,
+                                           self.negative_slope))
 
     def compute_inverse_vectorized_jacobian(self):
-        output = torch.empty(self.forward_output.shape)
-        for i in range(self.forward_output.size(0)):
-            for j in range(self.forward_output.size(1)):
-                if self.forward_output[i, j, 0] >= 0:
-                    output[i, j, 0] = 1
-                else:
-                    output[i, j, 0] = self.negative_slope**(-1)
-        return output
+        return torch.where(self.forward_output >= 0,
+                           torch.ones_like(self.forward_output),
+                           torch.full_like(self.forward_output,
+                                           self.negative_slope**(-1)))
 
 
 class MTPInvertibleLinearLayer(MTPInvertibleLayer):
@@ -129,7 +113,7 @@ class MTPInvertibleLinearLayer(MTPInvertibleLayer):
         return input
 
     def compute_vectorized_jacobian(self):
-        return torch.ones(self.forward_output.shape)
+        return torch.ones_like(self.forward_output)
 
 
 class MTPInvertibleOutputLayer(MTPInvertibleLayer):
@@ -256,10 +240,10 @@ class MTPInvertibleLinearOutputLayer(MTPInvertibleOutputLayer):
         return input
 
     def compute_vectorized_jacobian(self):
-        return torch.ones(self.forward_output.shape)
+        return torch.ones_like(self.forward_output)
 
     def compute_inverse_vectorized_jacobian(self):
-        return torch.ones(self.forward_output.shape)
+        return torch.ones_like(self.forward_output)
 
     def compute_backward_output(self, target):
         """ Compute the backward output based on a small move from the
@@ -28,10 +28,10 @@ class OriginalDTPLayer(OriginalTPLayer):
         if not upper_layer.in_dim == self.layer_dim:
             raise ValueError("Layer sizes are not compatible for propagating "
                              "backwards")
-        target_linear = torch.matmul(self.backward_weights,
-                                     upper_layer.backward_output) \
+        target_linear = hf.batch_matmul(self.backward_weights,
+                                        upper_layer.backward_output) \
                         + self.backward_bias
-        activation_linear = torch.matmul(self.backward_weights,
+        activation_linear = hf.batch_matmul(self.backward_weights,
                                      upper_layer.forward_output) \
                         + self.backward_bias
 
@@ -86,44 +86,28 @@ class OriginalDTPLeakyReluLayer(OriginalDTPLayer):
         """ Compute the vectorized jacobian. The jacobian is a diagonal
         matrix, so can be represented by a vector instead of a matrix. """
 
-        output = torch.empty(self.forward_output.shape)
-        for i in range(self.forward_linear_activation.size(0)):
-            for j in range(self.forward_linear_activation.size(1)):
-                if self.forward_linear_activation[i, j, 0] >= 0:
-                    output[i, j, 0] = 1
-                else:
-                    output[i, j, 0] = self.negative_slope
-        return output
+        return torch.where(self.forward_linear_activation >= 0,
+                           torch.ones_like(self.forward_output),
+                           torch.full_like(self.forward_output,
+                                           self.negative_slope))
 
     def compute_inverse_vectorized_jacobian(self, linear_activation):
-        output = torch.empty(linear_activation.shape)
-        for i in range(linear_activation.size(0)):
-            for j in range(linear_activation.size(1)):
-                if linear_activation[i, j, 0] >= 0:
-                    output[i, j, 0] = 1
-                else:
-                    output[i, j, 0] = self.negative_slope**(-1)
-        return output
+        return torch.where(linear_activation >= 0,
+                           torch.ones_like(linear_activation),
+                           torch.full_like(linear_activation,
+                                           self.negative_slope**(-1)))
 
     def compute_backward_vectorized_jacobian(self, linear_activation, upper_layer=None):
-        output = torch.empty(linear_activation.shape)
-        for i in range(linear_activation.size(0)):
-            for j in range(linear_activation.size(1)):
-                if linear_activation[i, j, 0] >= 0:
-                    output[i, j, 0] = 1
-                else:
-                    output[i, j, 0] = self.negative_slope
-        return output
+        return torch.where(linear_activation >= 0,
+                           torch.ones_like(linear_activation),
+                           torch.full_like(linear_activation,
+                                           self.negative_slope))
 
     def compute_inverse_vectorized_jacobian(self, linear_activation):
-        output = torch.empty(linear_activation.shape)
-        for i in range(linear_activation.size(0)):
-            for j in range(self.forward_output.size(1)):
-                if linear_activation[i, j, 0] >= 0:
-                    output[i, j, 0] = 1
-                else:
-                    output[i, j, 0] = self.negative_slope ** (-1)
-        return output
+        return torch.where(linear_activation >= 0,
+                           torch.ones_like(linear_activation),
+                           torch.full_like(linear_activation,
+                                           self.negative_slope ** (-1)))
 
 
 class OriginalDTPLinearLayer(OriginalDTPLayer):
@@ -136,10 +120,10 @@ class OriginalDTPLinearLayer(OriginalDTPLayer):
         return input
 
     def compute_vectorized_jacobian(self):
-        return torch.ones(self.forward_output.shape)
+        return torch.ones_like(self.forward_output)
 
     def compute_backward_vectorized_jacobian(self, linear_activation, upper_layer=None):
-        return torch.ones(linear_activation.shape)
+        return torch.ones_like(linear_activation)
 
 
 class OriginalDTPOutputLayer(OriginalDTPLayer):
@@ -266,13 +250,13 @@ class OriginalDTPLinearOutputLayer(OriginalDTPOutputLayer):
         return input
 
     def compute_vectorized_jacobian(self):
-        return torch.ones(self.forward_output.shape)
+        return torch.ones_like(self.forward_output)
 
     def compute_backward_vectorized_jacobian(self, linear_activation, upper_layer=None):
-        return torch.ones(linear_activation.shape)
+        return torch.ones_like(linear_activation)
 
     def compute_inverse_vectorized_jacobian(self, linear_activation):
-        return torch.ones(linear_activation.shape)
+        return torch.ones_like(linear_activation)
 
     def compute_backward_output(self, target):
         """ Compute the backward output based on a small move from the
@@ -332,7 +316,7 @@ class OriginalDTPInputLayer(OriginalDTPLayer):
 
 
     def compute_backward_vectorized_jacobian(self, linear_activation, upper_layer=None):
-        return torch.ones(linear_activation.shape)
+        return torch.ones_like(linear_activation)
 
     def init_velocities(self):
         """ InputLayer has no forward parameters"""
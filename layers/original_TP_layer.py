@@ -22,10 +22,34 @@ class OriginalTPLayer(TargetPropLayer):
         """ has to be implemented by the child class"""
         raise NetworkError('has to be implemented by the child class')
 
-    def update_backward_parameters(self, learning_rate, upper_layer):
+    def draw_noise_input(self, batch_size=None):
+        """ The reconstruction loss of original TP is computed on the
+        forward output instead of on noise."""
+        return None
+
+    def set_noise_batch_size(self, noise_batch_size):
+        """ Original TP trains the backward weights on the forward output,
+        not on noise, so only the default None is allowed."""
+        super().set_noise_batch_size(noise_batch_size)
+        if noise_batch_size is not None:
+            raise NetworkError("noise_batch_size is not defined for "
+                               "original TP layers, expecting None, got "
+                               "{}".format(noise_batch_size))
+
+    def set_backward_iterations(self, backward_iterations):
+        """ Original TP does a single gradient step on the backward weights
+        per call of update_backward_parameters."""
+        super().set_backward_iterations(backward_iterations)
+        if not backward_iterations == 1:
+            raise NetworkError("backward_iterations is not supported for "
+                               "original TP layers, expecting 1, got "
+                               "{}".format(backward_iterations))
+
+    def update_backward_parameters(self, learning_rate, upper_layer,
+                                   noise_input=None):
         nonlinear_activation = upper_layer.forward_output
-        linear_activation2 = torch.matmul(self.backward_weights,
-                                          nonlinear_activation) + \
+        linear_activation2 = hf.batch_matmul(self.backward_weights,
+                                             nonlinear_activation) + \
                              self.backward_bias
         nonlinear_activation2 = self.backward_nonlinearity(linear_activation2)
         approx_error = nonlinear_activation2 - self.forward_output
@@ -40,6 +64,15 @@ class OriginalTPLayer(TargetPropLayer):
 
         self.set_backward_parameters(updated_weights, updated_bias)
 
+    def fit_backward_parameters(self, upper_layer, nb_samples=10000,
+                                batch_size=1000, regularization=None):
+        """ The reconstruction loss of original TP is not linear in the
+        backward weights (the backward nonlinearity is applied after them),
+        so it has no closed-form least-squares solution."""
+        raise NetworkError('fit_backward_parameters is not defined for '
+                           'original TP layers, use '
+                           'update_backward_parameters instead')
+
     def compute_backward_vectorized_jacobian(self, linear_activation, upper_layer=None):
         """ has to be implemented by the child class"""
         raise NetworkError('has to be implemented by the child class')
@@ -52,8 +85,8 @@ class OriginalTPLayer(TargetPropLayer):
         if not upper_layer.in_dim == self.layer_dim:
             raise ValueError("Layer sizes are not compatible for propagating "
                              "backwards")
-        linear_output = torch.matmul(self.backward_weights,
-                                     upper_layer.backward_output) \
+        linear_output = hf.batch_matmul(self.backward_weights,
+                                        upper_layer.backward_output) \
                         + self.backward_bias
 
         backward_output = self.backward_nonlinearity(
@@ -61,14 +94,14 @@ class OriginalTPLayer(TargetPropLayer):
         self.set_backward_output(backward_output)
 
     def propagate_GN_error(self, upper_layer):
-        linear_activation = torch.matmul(self.backward_weights,
-                                         upper_layer.forward_output) + \
+        linear_activation = hf.batch_matmul(self.backward_weights,
+                                            upper_layer.forward_output) + \
                             self.backward_bias
         D_inv = self.compute_backward_vectorized_jacobian(
            linear_activation, upper_layer
         )
-        self.GN_error = D_inv*torch.matmul(self.backward_weights,
-                                           upper_layer.GN_error)
+        self.GN_error = D_inv*hf.batch_matmul(self.backward_weights,
+                                              upper_layer.GN_error)
 
 class OriginalTPLeakyReluLayer(OriginalTPLayer):
     """ Layer of an invertible neural network with a leaky RELU activation
@@ -114,44 +147,28 @@ class OriginalTPLeakyReluLayer(OriginalTPLayer):
         """ Compute the vectorized jacobian. The jacobian is a diagonal
         matrix, so can be represented by a vector instead of a matrix. """
 
-        output = torch.empty(self.forward_output.shape)
-        for i in range(self.forward_linear_activation.size(0)):
-            for j in range(self.forward_linear_activation.size(1)):
-                if self.forward_linear_activation[i, j, 0] >= 0:
-                    output[i, j, 0] = 1
-                else:
-                    output[i, j, 0] = self.negative_slope
-        return output
+        return torch.where(self.forward_linear_activation >= 0,
+                           torch.ones_like(self.forward_output),
+                           torch.full_like(self.forward_output,
+                                           self.negative_slope))
 
     def compute_inverse_vectorized_jacobian(self, linear_activation):
-        output = torch.empty(linear_activation.shape)
-        for i in range(linear_activation.size(0)):
-            for j in range(linear_activation.size(1)):
-                if linear_activation[i, j, 0] >= 0:
-                    output[i, j, 0] = 1
-                else:
-                    output[i, j, 0] = self.negative_slope**(-1)
-        return output
+        return torch.where(linear_activation >= 0,
+                           torch.ones_like(linear_activation),
+                           torch.full_like(linear_activation,
+                                           self.negative_slope**(-1)))
 
     def compute_backward_vectorized_jacobian(self, linear_activation, upper_layer=None):
-        output = torch.empty(linear_activation.shape)
-        for i in range(linear_activation.size(0)):
-            for j in range(linear_activation.size(1)):
-                if linear_activation[i, j, 0] >= 0:
-                    output[i, j, 0] = 1
-                else:
-                    output[i, j, 0] = self.negative_slope
-        return output
+        return torch.where(linear_activation >= 0,
+                           torch.ones_like(linear_activation),
+                           torch.full_like(linear_activation,
+                                           self.negative_slope))
 
     def compute_inverse_vectorized_jacobian(self, linear_activation):
-        output = torch.empty(linear_activation.shape)
-        for i in range(linear_activation.size(0)):
-            for j in range(self.forward_output.size(1)):
-                if linear_activation[i, j, 0] >= 0:
-                    output[i, j, 0] = 1
-                else:
-                    output[i, j, 0] = self.negative_slope ** (-1)
-        return output
+        return torch.where(linear_activation >= 0,
+                           torch.ones_like(linear_activation),
+                           torch.full_like(linear_activation,
+                                           self.negative_slope ** (-1)))
 
 
 class OriginalTPLinearLayer(OriginalTPLayer):
@@ -164,10 +181,10 @@ class OriginalTPLinearLayer(OriginalTPLayer):
         return input
 
     def compute_vectorized_jacobian(self):
-        return torch.ones(self.forward_output.shape)
+        return torch.ones_like(self.forward_output)
 
     def compute_backward_vectorized_jacobian(self, linear_activation, upper_layer=None):
-        return torch.ones(linear_activation.shape)
+        return torch.ones_like(linear_activation)
 
 
 class OriginalTPOutputLayer(OriginalTPLayer):
@@ -294,13 +311,13 @@ class OriginalTPLinearOutputLayer(OriginalTPOutputLayer):
         return input
 
     def compute_vectorized_jacobian(self):
-        return torch.ones(self.forward_output.shape)
+        return torch.ones_like(self.forward_output)
 
     def compute_backward_vectorized_jacobian(self, linear_activation, upper_layer=None):
-        return torch.ones(linear_activation.shape)
+        return torch.ones_like(linear_activation)
 
     def compute_inverse_vectorized_jacobian(self, linear_activation):
-        return torch.ones(linear_activation.shape)
+        return torch.ones_like(linear_activation)
 
     def compute_backward_output(self, target):
         """ Compute the backward output based on a small move from the
@@ -360,7 +377,7 @@ class OriginalTPInputLayer(OriginalTPLayer):
 
 
     def compute_backward_vectorized_jacobian(self, linear_activation, upper_layer=None):
-        return torch.ones(linear_activation.shape)
+        return torch.ones_like(linear_activation)
 
     def init_velocities(self):
         """ InputLayer has no forward parameters"""
@@ -19,6 +19,9 @@ import numpy as np
 class TargetPropLayer(BidirectionalLayer):
     """ Target propagation with approximate inverses, but still the right
     form of the inverse."""
+    history_state = ('approx_errors', 'approx_error_angles', 'GN_errors',
+                     'TP_errors', 'GN_angles', 'BP_angles')
+
     def __init__(self, in_dim, layer_dim, out_dim, writer, loss_function='mse',
                  name='target_prop_layer', debug_mode=True,
                  weight_decay=0.0, weight_decay_backward=0.0,
@@ -31,13 +34,10 @@ class TargetPropLayer(BidirectionalLayer):
                          weight_decay=weight_decay,
                          fixed=fixed)
         self.weight_decay_backward = weight_decay_backward
-        self.approx_errors = torch.Tensor([])
-        self.approx_error_angles = torch.Tensor([])
-        self.GN_errors = torch.Tensor([])
-        self.TP_errors = torch.Tensor([])
-        self.GN_angles = torch.Tensor([])
-        self.BP_angles = torch.Tensor([])
+        self.set_history_policy()
         self.backward_approx_error = torch.zeros((2,2,1))
+        self.set_noise_batch_size(None)
+        self.set_backward_iterations(1)
 
     def init_inverse(self, upper_layer):
         """ Initializes the backward weights to the inverse of the
@@ -61,29 +61,147 @@ class TargetPropLayer(BidirectionalLayer):
         nonlinearity."""
         return upper_layer.inverse_nonlinearity(input)
 
-    def update_backward_parameters(self, learning_rate, upper_layer):
-
-        noise_input = torch.randn(self.forward_output.shape)
-        linear_activation = torch.matmul(upper_layer.forward_weights,
-                                         noise_input) + upper_layer.forward_bias
+    def propagate_noise(self, noise_input, upper_layer):
+        """ Propagate noise_input forward through upper_layer and
+        return it after applying the backward nonlinearity, i.e. the input
+        of the backward weights of this layer in the reconstruction loss
+        ||Q*g(f(noise_input)) + c - noise_input||^2."""
+        linear_activation = hf.batch_matmul(upper_layer.forward_weights,
+                                            noise_input) + \
+                            upper_layer.forward_bias
         nonlinear_activation = upper_layer.forward_nonlinearity(linear_activation)
-        nonlinear_activation2 = self.backward_nonlinearity(nonlinear_activation,
-                                                           upper_layer)
-        linear_activation2 = torch.matmul(self.backward_weights,
-                                          nonlinear_activation2) + \
-                                            self.backward_bias
-        approx_error = linear_activation2 - noise_input
-        gradient = torch.matmul(approx_error,
-                               torch.transpose(nonlinear_activation2, -1, -2))
-        updated_weights = (1-learning_rate*self.weight_decay_backward) * \
-                          self.backward_weights - \
-                          learning_rate*torch.mean(gradient,0)
-        # updated_bias = self.backward_bias + learning_rate*torch.mean(approx_error, 0)
-        updated_bias = self.backward_bias
-
-        self.set_backward_parameters(updated_weights, updated_bias)
+        return self.backward_nonlinearity(nonlinear_activation, upper_layer)
+
+    def set_noise_batch_size(self, noise_batch_size):
+        """ Number of noise samples per inner iteration of
+        update_backward_parameters. If None, the batch size of the
+        forward_output is used."""
+        if noise_batch_size is not None:
+            if not isinstance(noise_batch_size, int):
+                raise TypeError("Expecting an integer or None for "
+                                "noise_batch_size, got {}".format(
+                    type(noise_batch_size)))
+            if noise_batch_size <= 0:
+                raise ValueError("Expecting a strictly positive "
+                                 "noise_batch_size, got {}".format(
+                    noise_batch_size))
+        self.noise_batch_size = noise_batch_size
+
+    def set_backward_iterations(self, backward_iterations):
+        """ Number of gradient steps on the backward weights per call of
+        update_backward_parameters."""
+        if not isinstance(backward_iterations, int):
+            raise TypeError("Expecting an integer for backward_iterations, "
+                            "got {}".format(type(backward_iterations)))
+        if backward_iterations <= 0:
+            raise ValueError("Expecting a strictly positive "
+                             "backward_iterations, got {}".format(
+                backward_iterations))
+        self.backward_iterations = backward_iterations
+
+    def get_noise_batch_size(self, batch_size=None):
+        """ :param batch_size: size of the data batch, the batch size of
+        the forward_output if None"""
+        if self.noise_batch_size is not None:
+            return self.noise_batch_size
+        if batch_size is None:
+            return self.forward_output.shape[0]
+        return batch_size
+
+    def draw_noise_input(self, batch_size=None):
+        """ Return the standard normal noise of all iterations of
+        update_backward_parameters, of size
+        (backward_iterations*noise_batch_size) x layer_dim x 1.
+        :param batch_size: see get_noise_batch_size"""
+        return torch.randn(self.backward_iterations *
+                           self.get_noise_batch_size(batch_size),
+                           self.layer_dim, 1,
+                           dtype=self.backward_weights.dtype)
+
+    def update_backward_parameters(self, learning_rate, upper_layer,
+                                   noise_input=None):
+        """ Do backward_iterations gradient steps on the reconstruction loss
+        of the backward weights, each on a fresh batch of noise_batch_size
+        noise samples. The noise of all iterations is propagated through
+        upper_layer in one batch, as it does not depend on the backward
+        weights.
+        :param noise_input: noise of all iterations, of size
+        (backward_iterations*noise_batch_size) x layer_dim x 1, drawn from a
+        standard normal distribution if None (see draw_noise_input)
+        """
+        batch_size = self.get_noise_batch_size()
+        if noise_input is None:
+            noise_input = self.draw_noise_input()
+        elif not noise_input.shape == (self.backward_iterations*batch_size,
+                                       self.layer_dim, 1):
+            raise ValueError("Expecting a noise_input of size {}, got "
+                             "{}".format((self.backward_iterations *
+                                          batch_size, self.layer_dim, 1),
+                                         tuple(noise_input.shape)))
+        nonlinear_activation2 = self.propagate_noise(noise_input, upper_layer)
+
+        for k in range(self.backward_iterations):
+            noise_batch = noise_input[k*batch_size:(k+1)*batch_size]
+            h = nonlinear_activation2[k*batch_size:(k+1)*batch_size]
+            linear_activation2 = hf.batch_matmul(self.backward_weights, h) + \
+                                 self.backward_bias
+            approx_error = linear_activation2 - noise_batch
+            gradient = hf.batch_outer_product_mean(approx_error, h)
+            updated_weights = (1-learning_rate*self.weight_decay_backward) * \
+                              self.backward_weights - \
+                              learning_rate*gradient
+            # updated_bias = self.backward_bias + learning_rate*torch.mean(approx_error, 0)
+            updated_bias = self.backward_bias
+
+            self.set_backward_parameters(updated_weights, updated_bias)
         self.backward_approx_error = approx_error
 
+    def fit_backward_parameters(self, upper_layer, nb_samples=10000,
+                                batch_size=1000, regularization=None):
+        """ Fit the backward weights in closed form to the regularized
+        least-squares reconstruction problem that update_backward_parameters
+        solves with SGD. The sufficient statistics sum(h*h^T) and
+        sum((x-c)*h^T) are accumulated in float64 over nb_samples gaussian
+        noise samples x, in chunks of batch_size samples, with
+        h = g(f(x)) the output of propagate_noise.
+        :param regularization: ridge penalty on the backward weights, equal
+        to weight_decay_backward if None (the fixed point of the SGD updates)
+        """
+        if not isinstance(nb_samples, int) or nb_samples <= 0:
+            raise ValueError("Expecting a strictly positive integer for "
+                             "nb_samples, got {}".format(nb_samples))
+        if not isinstance(batch_size, int) or batch_size <= 0:
+            raise ValueError("Expecting a strictly positive integer for "
+                             "batch_size, got {}".format(batch_size))
+        if regularization is None:
+            regularization = self.weight_decay_backward
+
+        gram = torch.zeros(self.out_dim, self.out_dim, dtype=torch.float64)
+        cross = torch.zeros(self.layer_dim, self.out_dim, dtype=torch.float64)
+        samples = 0
+        while samples < nb_samples:
+            size = min(batch_size, nb_samples - samples)
+            noise_input = torch.randn(size, self.layer_dim, 1,
+                                      dtype=self.backward_weights.dtype)
+            nonlinear_activation2 = self.propagate_noise(noise_input,
+                                                         upper_layer)
+            h = nonlinear_activation2.reshape(size, self.out_dim).double()
+            x = (noise_input - self.backward_bias).reshape(
+                size, self.layer_dim).double()
+            gram += torch.matmul(torch.transpose(h, 0, 1), h)
+            cross += torch.matmul(torch.transpose(x, 0, 1), h)
+            samples += size
+
+        backward_weights = hf.solve_normal_equations(gram/nb_samples,
+                                                     cross/nb_samples,
+                                                     regularization)
+        self.set_backward_parameters(
+            backward_weights.to(self.backward_weights.dtype),
+            self.backward_bias)
+        self.backward_approx_error = torch.matmul(
+            self.backward_weights, nonlinear_activation2) + \
+            self.backward_bias - noise_input
+
     def propagate_backward(self, upper_layer):
         """Propagate the target signal from the upper layer to the current
         layer (self)
@@ -101,7 +219,7 @@ class TargetPropLayer(BidirectionalLayer):
             upper_layer.backward_output, upper_layer)
 
 
-        backward_output = torch.matmul(self.backward_weights,
+        backward_output = hf.batch_matmul(self.backward_weights,
                                       target_inverse) + self.backward_bias
         self.set_backward_output(backward_output)
 
@@ -123,12 +241,11 @@ class TargetPropLayer(BidirectionalLayer):
         u = torch.mul(vectorized_jacobian, local_loss_der)
         v = lower_layer.forward_output
 
-        weight_gradients = torch.matmul(u, torch.transpose(v, -1, -2))
+        weight_gradients = hf.batch_outer_product_mean(u, v)
 
         # bias_gradients = u
-        bias_gradients = torch.zeros(u.shape)
-        self.set_forward_gradients(torch.mean(weight_gradients, 0), torch.mean(
-            bias_gradients, 0))
+        bias_gradients = u.new_zeros(u.shape[1:])
+        self.set_forward_gradients(weight_gradients, bias_gradients)
 
     def compute_vectorized_jacobian(self):
         """ Compute the vectorized Jacobian (as the jacobian for a ridge
@@ -144,9 +261,12 @@ class TargetPropLayer(BidirectionalLayer):
         frobeniusnorm of W^(-1)*W - I
         :type upper_layer: InvertibleLayer
         """
-        forward_weights = upper_layer.forward_weights
+        # torch.pinverse does not support half precision dtypes
+        forward_weights = upper_layer.forward_weights.to(
+            self.dtype_policy.accumulation_dtype)
         forward_weights_pinv = torch.pinverse(forward_weights)
-        error = self.backward_weights - forward_weights_pinv
+        error = self.backward_weights.to(forward_weights.dtype) - \
+            forward_weights_pinv
         return torch.norm(error)
 
     def save_inverse_error(self, upper_layer):
@@ -159,21 +279,23 @@ class TargetPropLayer(BidirectionalLayer):
         D_inv = self.compute_backward_vectorized_jacobian(
             upper_layer.forward_output, upper_layer
         )
-        self.GN_error = torch.matmul(self.backward_weights,
-                                     D_inv*upper_layer.GN_error)
+        self.GN_error = hf.batch_matmul(self.backward_weights,
+                                        D_inv*upper_layer.GN_error)
 
     def propagate_real_GN_error(self, upper_layer):
         D_inv = upper_layer.compute_inverse_vectorized_jacobian(
             upper_layer.forward_output
         )
-        weights_pinv = torch.pinverse(upper_layer.forward_weights)
+        weights_pinv = torch.pinverse(upper_layer.forward_weights.to(
+            self.dtype_policy.accumulation_dtype)).to(D_inv.dtype)
         self.real_GN_error = torch.matmul(weights_pinv,
                                           D_inv*upper_layer.real_GN_error)
 
     def propagate_BP_error(self, upper_layer):
         D = upper_layer.compute_vectorized_jacobian()
-        self.BP_error = torch.matmul(torch.transpose(upper_layer.forward_weights, -1,-2),
-                                     D*upper_layer.BP_error)
+        self.BP_error = hf.batch_matmul(
+            torch.transpose(upper_layer.forward_weights, -1, -2),
+            D*upper_layer.BP_error)
 
     def compute_inverse_vectorized_jacobian(self, linear_activation):
         """ Should be implemented by child class"""
@@ -215,9 +337,9 @@ class TargetPropLayer(BidirectionalLayer):
                                scalar_value=angle_BP,
                                global_step=self.global_step)
 
-        self.approx_error_angles = torch.cat((self.approx_error_angles, angle))
-        self.GN_angles = torch.cat((self.GN_angles, angle_GN))
-        self.BP_angles = torch.cat((self.BP_angles, angle_BP))
+        self.approx_error_angles.append(angle)
+        self.GN_angles.append(angle_GN)
+        self.BP_angles.append(angle_BP)
 
     def save_approx_error(self):
         error = torch.mean(torch.norm(self.compute_approx_error(), dim=1))
@@ -230,16 +352,14 @@ class TargetPropLayer(BidirectionalLayer):
         self.writer.add_scalar(tag='{}/backward_approx_error'.format(self.name),
                                scalar_value=backward_approx_error,
                                global_step=self.global_step)
-        self.approx_errors = torch.cat((self.approx_errors,
-                                        torch.Tensor([error])))
+        self.approx_errors.append(error)
 
     def save_GN_error(self):
         GN_error = torch.mean(torch.norm(self.GN_error, dim=1))
         self.writer.add_scalar(tag='{}/GN_error'.format(self.name),
                                scalar_value=GN_error,
                                global_step=self.global_step)
-        self.GN_errors = torch.cat(((self.GN_errors,
-                                     torch.Tensor([GN_error]))))
+        self.GN_errors.append(GN_error)
 
     def save_TP_error(self):
         error = self.backward_output - self.forward_output
@@ -247,8 +367,7 @@ class TargetPropLayer(BidirectionalLayer):
         self.writer.add_scalar(tag='{}/TP_error'.format(self.name),
                                scalar_value=error,
                                global_step=self.global_step)
-        self.TP_errors = torch.cat((self.TP_errors,
-                                    torch.Tensor([error])))
+        self.TP_errors.append(error)
 
     def save_state(self):
         super().save_state()
@@ -310,38 +429,22 @@ class TargetPropLeakyReluLayer(TargetPropLayer):
     def inverse_nonlinearity(self, input):
         """ perform the inverse of the forward nonlinearity on the given
         input. """
-        output = torch.empty(input.shape)
-        for i in range(input.size(0)):
-            for j in range(input.size(1)):
-                for k in range(input.size(2)):
-                    if input[i, j, k] >= 0:
-                        output[i, j, k] = input[i, j, k]
-                    else:
-                        output[i, j, k] = input[i, j, k] / self.negative_slope
-        return output
+        return torch.where(input >= 0, input, input / self.negative_slope)
 
     def compute_vectorized_jacobian(self):
         """ Compute the vectorized jacobian. The jacobian is a diagonal
         matrix, so can be represented by a vector instead of a matrix. """
 
-        output = torch.empty(self.forward_output.shape)
-        for i in range(self.forward_linear_activation.size(0)):
-            for j in range(self.forward_linear_activation.size(1)):
-                if self.forward_linear_activation[i, j, 0] >= 0:
-                    output[i, j, 0] = 1
-                else:
-                    output[i, j, 0] = self.negative_slope
-        return output
+        return torch.where(self.forward_linear_activation >= 0,
+                           torch.ones_like(self.forward_output),
+                           torch.full_like(self.forward_output,
+                                           self.negative_slope))
 
     def compute_inverse_vectorized_jacobian(self, linear_activation):
-        output = torch.empty(linear_activation.shape)
-        for i in range(linear_activation.size(0)):
-            for j in range(linear_activation.size(1)):
-                if linear_activation[i, j, 0] >= 0:
-                    output[i, j, 0] = 1
-                else:
-                    output[i, j, 0] = self.negative_slope**(-1)
-        return output
+        return torch.where(linear_activation >= 0,
+                           torch.ones_like(linear_activation),
+                           torch.full_like(linear_activation,
+                                           self.negative_slope**(-1)))
 
 
 class TargetPropLinearLayer(TargetPropLayer):
@@ -354,7 +457,7 @@ class TargetPropLinearLayer(TargetPropLayer):
         return input
 
     def compute_vectorized_jacobian(self):
-        return torch.ones(self.forward_output.shape)
+        return torch.ones_like(self.forward_output)
 
 
 class TargetPropOutputLayer(TargetPropLayer):
@@ -481,10 +584,10 @@ class TargetPropLinearOutputLayer(TargetPropOutputLayer):
         return input
 
     def compute_vectorized_jacobian(self):
-        return torch.ones(self.forward_output.shape)
+        return torch.ones_like(self.forward_output)
 
     def compute_inverse_vectorized_jacobian(self, linear_activation):
-        return torch.ones(linear_activation.shape)
+        return torch.ones_like(linear_activation)
 
     def compute_backward_output(self, target):
         """ Compute the backward output based on a small move from the
@@ -24,6 +24,7 @@ class BidirectionalNetwork(Network):
         """
         if not isinstance(target, torch.Tensor):
             raise TypeError("Expecting a torch.Tensor object as target")
+        target = target.to(self.dtype_policy.compute_dtype)
         # if not self.layers[-1].forward_output.shape == target.shape:
         #     raise ValueError('Expecting a tensor of dimensions: '
         #                      'batchdimension x class dimension x 1.'
@@ -0,0 +1,405 @@
+"""
+Copyright 2019 Alexander Meulemans
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+"""
+
+import json
+import numpy as np
+import torch
+import torch.nn.functional as F
+from layers.layer import ReluLayer, LeakyReluLayer, SoftmaxLayer, \
+    LinearLayer, LinearOutputLayer, SoftmaxOutputLayer, CapsuleOutputLayer
+from layers.target_prop_layer import TargetPropLeakyReluLayer, \
+    TargetPropLinearLayer, TargetPropLinearOutputLayer
+from layers.DTP_layer import DTPLeakyReluLayer, DTPLinearOutputLayer
+from layers.DTP_layer import TargetPropLinearLayer as DTPLinearLayer
+from layers.MTP_layer import MTPLayer, MTPInputLayer, MTPOutputLayer, \
+    MTPLeakyReluLayer, MTPLinearLayer, MTPLinearOutputLayer
+from layers.original_TP_layer import OriginalTPLeakyReluLayer, \
+    OriginalTPLinearLayer, OriginalTPLinearOutputLayer
+from layers.original_DTP_layer import OriginalDTPLeakyReluLayer, \
+    OriginalDTPLinearLayer, OriginalDTPLinearOutputLayer
+from layers.invertible_layer import InvertibleLeakyReluLayer, \
+    InvertibleLinearLayer, InvertibleLinearOutputLayer, \
+    InvertibleSoftmaxOutputLayer, InvertibleCapsuleOutputLayer
+from layers.modified_TP_layer import MTPInvertibleLeakyReluLayer, \
+    MTPInvertibleLinearLayer, MTPInvertibleLinearOutputLayer
+from utils.helper_classes import NetworkError
+
+# forward nonlinearity of the layer classes
+activations = {
+    'linear': (LinearLayer, LinearOutputLayer, TargetPropLinearLayer,
+               TargetPropLinearOutputLayer, DTPLinearLayer,
+               DTPLinearOutputLayer, MTPLinearLayer, MTPLinearOutputLayer,
+               OriginalTPLinearLayer, OriginalTPLinearOutputLayer,
+               OriginalDTPLinearLayer, OriginalDTPLinearOutputLayer,
+               InvertibleLinearLayer, InvertibleLinearOutputLayer,
+               MTPInvertibleLinearLayer, MTPInvertibleLinearOutputLayer),
+    'leaky_relu': (LeakyReluLayer, TargetPropLeakyReluLayer,
+                   DTPLeakyReluLayer, MTPLeakyReluLayer,
+                   OriginalTPLeakyReluLayer, OriginalDTPLeakyReluLayer,
+                   InvertibleLeakyReluLayer, MTPInvertibleLeakyReluLayer),
+    'relu': (ReluLayer,),
+    'softmax': (SoftmaxLayer, SoftmaxOutputLayer,
+                InvertibleSoftmaxOutputLayer),
+    # the output is capsule_squashed, see CapsuleOutputLayer
+    'capsule': (CapsuleOutputLayer, InvertibleCapsuleOutputLayer)}
+file_format = 'frozen_network'
+# version 2 adds int8 quantized networks (see FrozenNetwork.quantize)
+file_version = 2
+
+
+def get_activation(layer):
+    for activation, classes in activations.items():
+        if isinstance(layer, classes):
+            return activation
+    raise NetworkError('{} ({}) can not be frozen, as its forward '
+                       'nonlinearity is unknown'.format(layer.name,
+                                                        type(layer).__name__))
+
+
+def get_capsule_matrix(layer):
+    """ Return the nb_classes x layer_dim matrix that sums the squared
+    linear activations of each capsule of a capsule output layer."""
+    capsule_matrix = torch.zeros(layer.nb_classes, layer.layer_dim)
+    for capsule, (start, stop) in layer.capsule_indices.items():
+        capsule_matrix[capsule, start:stop] = 1.
+    return capsule_matrix
+
+
+def get_quantization_parameters(minimum, maximum, quant_max):
+    """ Return the scale and zero point of the asymmetric quint8
+    quantization of the range [minimum, maximum], extended to contain 0, onto
+    the integers 0 ... quant_max."""
+    minimum = min(float(minimum), 0.)
+    maximum = max(float(maximum), 0.)
+    scale = max((maximum - minimum) / quant_max, 1e-8)
+    zero_point = int(round(-minimum / scale))
+    return scale, min(max(zero_point, 0), quant_max)
+
+
+def get_int8_kernel():
+    """ Return 'onednn' if the int8 matmul of oneDNN on plain int8 and uint8
+    tensors (torch.ops.onednn.qlinear_pointwise) is available, else
+    'emulated', for which QuantizedFrozenNetwork computes the same
+    quantized layers with float32 matmuls."""
+    if not torch.backends.mkldnn.is_available():
+        return 'emulated'
+    try:
+        torch.ops.onednn.qlinear_prepack
+        torch.ops.onednn.qlinear_pointwise
+    except (AttributeError, RuntimeError):
+        return 'emulated'
+    return 'onednn'
+
+
+class FrozenNetwork(object):
+    """ Inference-only copy of the forward pass of a trained network (see
+    Network.freeze). Each layer is one GEMM with the bias (torch.addmm)
+    followed by its nonlinearity, computed in place on the output of the
+    GEMM. The predictor only reads its weights and keeps no state of the
+    propagated batches, so predict can be called concurrently from several
+    threads. The output is the forward output of the last layer of the
+    network in evaluation mode (capsule_squashed for capsule output layers),
+    such that hf.prob2class gives the predicted classes.
+    """
+    # tensors of the layers that are saved, the other tensors are derived
+    # from them in __init__
+    saved_tensors = ('weights', 'bias', 'capsule_matrix')
+    quantization = None
+
+    def __init__(self, layers, in_dim):
+        """
+        :param layers: list of dictionaries with the weights (out_dim x
+        in_dim), bias (out_dim) and activation of each layer, and the
+        negative_slope of leaky ReLU layers or the capsule_matrix of capsule
+        output layers
+        :param in_dim: input dimension of the network
+        """
+        self.in_dim = in_dim
+        self.layers = []
+        for layer in layers:
+            layer = dict(layer)
+            if layer['activation'] not in activations:
+                raise NetworkError('Unknown activation '
+                                   '{}'.format(layer['activation']))
+            # x*W^T is computed with a contiguous W^T, as in hf.batch_matmul
+            layer['weights_t'] = layer['weights'].t().contiguous()
+            if layer['activation'] == 'capsule':
+                layer['capsule_matrix_t'] = \
+                    layer['capsule_matrix'].t().contiguous()
+            self.layers.append(layer)
+        self.dtype = self.layers[0]['weights'].dtype
+        self.out_dim = self.layers[-1]['weights'].shape[0] if \
+            self.layers[-1]['activation'] != 'capsule' else \
+            self.layers[-1]['capsule_matrix'].shape[0]
+
+    @classmethod
+    def from_network(cls, network, dtype=torch.float32):
+        """ See Network.freeze."""
+        layers = []
+        for i in range(1, len(network.layers)):
+            layer = network.layers[i]
+            lower_layer = network.layers[i - 1]
+            weights = layer.forward_weights.detach().to(torch.float64)
+            bias = layer.forward_bias.detach().to(torch.float64).reshape(-1)
+            if isinstance(layer, MTPLayer) and \
+                    not isinstance(layer, MTPOutputLayer) and \
+                    not isinstance(lower_layer, MTPInputLayer):
+                # fold the batch normalization of the lower layer with its
+                # running statistics into the weights and bias
+                if lower_layer.running_mu is None:
+                    raise NetworkError('No running statistics available for '
+                                       '{}, propagate training batches of '
+                                       'size > 1 first'.format(
+                                           lower_layer.name))
+                mu = lower_layer.running_mu.to(torch.float64).reshape(-1)
+                sigma = torch.sqrt(lower_layer.running_var).to(
+                    torch.float64).reshape(-1)
+                weights = weights / sigma
+                bias = bias - torch.mv(weights, mu)
+            frozen_layer = {'activation': get_activation(layer),
+                            'weights': weights.to(dtype).contiguous(),
+                            'bias': bias.to(dtype)}
+            if frozen_layer['activation'] == 'leaky_relu':
+                frozen_layer['negative_slope'] = float(layer.negative_slope)
+            if frozen_layer['activation'] == 'capsule':
+                frozen_layer['capsule_matrix'] = get_capsule_matrix(
+                    layer).to(dtype)
+            layers.append(frozen_layer)
+        return cls(layers, in_dim=network.layers[0].layer_dim)
+
+    def predict(self, input_batch):
+        """ Return the output of the network for input_batch.
+        :param input_batch: tensor of size batch_size x in_dim x 1 (as for
+        Network.predict) or batch_size x in_dim
+        :return: tensor of size batch_size x out_dim x 1, resp.
+        batch_size x out_dim
+        """
+        if input_batch.dim() == 3:
+            output = self.predict_2d(input_batch.reshape(
+                input_batch.shape[0], input_batch.shape[1]))
+            return output.unsqueeze(2)
+        return self.predict_2d(input_batch)
+
+    __call__ = predict
+
+    def predict_2d(self, input_batch):
+        if not input_batch.shape[-1] == self.in_dim:
+            raise ValueError('Expecting an input batch of size batch_size x '
+                             '{}, got {}'.format(self.in_dim,
+                                                 tuple(input_batch.shape)))
+        with torch.no_grad():
+            output = input_batch.to(self.dtype)
+            for layer in self.layers:
+                output = torch.addmm(layer['bias'], output,
+                                     layer['weights_t'])
+                output = apply_activation(layer, output)
+        return output
+
+    def get_ranges(self, input_batch):
+        """ Return the minimum and maximum of the input and of the linear
+        activation of each layer for input_batch."""
+        if input_batch.dim() == 3:
+            input_batch = input_batch.reshape(input_batch.shape[0],
+                                              input_batch.shape[1])
+        ranges = []
+        with torch.no_grad():
+            output = input_batch.to(self.dtype)
+            for layer in self.layers:
+                input_range = (float(output.min()), float(output.max()))
+                output = torch.addmm(layer['bias'], output,
+                                     layer['weights_t'])
+                ranges.append({'input': input_range,
+                               'output': (float(output.min()),
+                                          float(output.max()))})
+                output = apply_activation(layer, output)
+        return ranges
+
+    def quantize(self, calibration_batch, dtype=torch.qint8):
+        """ Return a post-training quantized copy of the frozen network.
+        With torch.qint8, the weights are quantized to int8 per output
+        channel and the layers are computed with quantized matmuls on 8 bit
+        activations, whose ranges are calibrated on calibration_batch (see
+        QuantizedFrozenNetwork). With torch.float16, the weights and the
+        activations are float16.
+        :param calibration_batch: held-out batch of inputs, of size
+        batch_size x in_dim x 1 or batch_size x in_dim
+        :param dtype: torch.qint8 or torch.float16
+        """
+        ranges = self.get_ranges(calibration_batch)
+        if dtype == torch.float16:
+            maximum = max(max(abs(x) for x in layer_ranges['output'])
+                          for layer_ranges in ranges)
+            if maximum > torch.finfo(torch.float16).max:
+                raise NetworkError('The activations of the calibration batch '
+                                   'overflow float16 (maximum absolute '
+                                   'value {})'.format(maximum))
+            layers = [{key: value.to(torch.float16)
+                       if isinstance(value, torch.Tensor) else value
+                       for key, value in layer.items()
+                       if key in self.saved_tensors or
+                       not isinstance(value, torch.Tensor)}
+                      for layer in self.layers]
+            return FrozenNetwork(layers, in_dim=self.in_dim)
+        if not dtype == torch.qint8:
+            raise ValueError('Expecting torch.qint8 or torch.float16 for '
+                             'dtype, got {}'.format(dtype))
+        layers = []
+        for layer, layer_ranges in zip(self.layers, ranges):
+            weights = layer['weights'].to(torch.float32)
+            weight_scales = torch.clamp(weights.abs().max(dim=1)[0] / 127.,
+                                        min=1e-8)
+            quantized_layer = {
+                key: value for key, value in layer.items()
+                if not isinstance(value, torch.Tensor)}
+            quantized_layer.update({
+                'weights': torch.round(weights / weight_scales.unsqueeze(1))
+                .to(torch.int8),
+                'weight_scales': weight_scales,
+                'bias': layer['bias'].to(torch.float32)})
+            if 'capsule_matrix' in layer:
+                quantized_layer['capsule_matrix'] = \
+                    layer['capsule_matrix'].to(torch.float32)
+            scale, zero_point = get_quantization_parameters(
+                *layer_ranges['input'], quant_max=255)
+            quantized_layer['input_scale'] = scale
+            quantized_layer['input_zero_point'] = zero_point
+            layers.append(quantized_layer)
+        return QuantizedFrozenNetwork(layers, in_dim=self.in_dim)
+
+    def save(self, path):
+        """ Save the frozen network as a numpy .npz file, with the arrays of
+        each layer and a JSON description of the layers. The file can be
+        loaded without pickle (see load)."""
+        arrays = {}
+        description = []
+        for i, layer in enumerate(self.layers):
+            layer_description = {}
+            for key, value in layer.items():
+                if key in self.saved_tensors:
+                    arrays['{}_{}'.format(key, i)] = value.numpy()
+                elif isinstance(value, (str, int, float)):
+                    layer_description[key] = value
+            description.append(layer_description)
+        metadata = {'format': file_format, 'version': file_version,
+                    'in_dim': self.in_dim, 'layers': description}
+        if self.quantization is not None:
+            metadata['quantization'] = self.quantization
+        arrays['metadata'] = np.array(json.dumps(metadata))
+        with open(path, 'wb') as f:
+            np.savez(f, **arrays)
+
+    @staticmethod
+    def load(path):
+        """ Load a frozen network saved with save, a QuantizedFrozenNetwork
+        for int8 quantized networks."""
+        with np.load(path, allow_pickle=False) as arrays:
+            metadata = json.loads(str(arrays['metadata']))
+            if not metadata.get('format') == file_format:
+                raise NetworkError('{} is not a frozen network '
+                                   'file'.format(path))
+            if metadata['version'] > file_version:
+                raise NetworkError('Frozen network file version {} is not '
+                                   'supported, expecting version {} or '
+                                   'lower'.format(metadata['version'],
+                                                  file_version))
+            if metadata.get('quantization') == 'int8':
+                cls = QuantizedFrozenNetwork
+            else:
+                cls = FrozenNetwork
+            layers = []
+            for i, layer_description in enumerate(metadata['layers']):
+                layer = dict(layer_description)
+                for key in cls.saved_tensors:
+                    name = '{}_{}'.format(key, i)
+                    if name in arrays:
+                        layer[key] = torch.from_numpy(arrays[name])
+                layers.append(layer)
+        return cls(layers, in_dim=metadata['in_dim'])
+
+
+def apply_activation(layer, output):
+    """ Apply the nonlinearity of a frozen layer to its linear activation,
+    in place where possible."""
+    activation = layer['activation']
+    if activation == 'leaky_relu':
+        F.leaky_relu_(output, layer['negative_slope'])
+    elif activation == 'relu':
+        output.relu_()
+    elif activation == 'softmax':
+        output = torch.softmax(output, dim=1)
+    elif activation == 'capsule':
+        magnitudes = torch.mm(output.square_(), layer['capsule_matrix_t'])
+        output = magnitudes.div_(magnitudes + 1.)
+    return output
+
+
+class QuantizedFrozenNetwork(FrozenNetwork):
+    """ Frozen network with int8 weights, quantized per output channel, see
+    FrozenNetwork.quantize. The input of each layer is quantized to uint8
+    with the scale and zero point calibrated on a held-out batch, such that
+    the output of a sample does not depend on the other samples of its batch
+    (as it would with dynamic quantization), and multiplied with the weights
+    by the int8 matmul of oneDNN, which returns the float32 linear
+    activation for the nonlinearity. The weights and inputs are plain int8
+    and uint8 tensors with separate scales (not the deprecated quantized
+    tensors of torch.quantize_per_channel). Without oneDNN (see
+    get_int8_kernel), the same quantized layers are computed with float32
+    matmuls on the dequantized weights and inputs.
+    """
+    saved_tensors = ('weights', 'weight_scales', 'bias', 'capsule_matrix')
+    quantization = 'int8'
+
+    def __init__(self, layers, in_dim):
+        """
+        :param layers: list of dictionaries as for FrozenNetwork, with int8
+        weights, the float32 weight_scales of each output channel and the
+        input_scale and input_zero_point of the uint8 input
+        :param in_dim: input dimension of the network
+        """
+        super().__init__(layers, in_dim)
+        self.kernel = get_int8_kernel()
+        for layer in self.layers:
+            del layer['weights_t']
+            if self.kernel == 'onednn':
+                layer['packed_weights'] = torch.ops.onednn.qlinear_prepack(
+                    layer['weights'], None)
+                layer['weight_zero_points'] = torch.zeros(
+                    len(layer['weight_scales']), dtype=torch.long)
+            else:
+                layer['weights_t'] = (layer['weights'].to(torch.float32) *
+                                      layer['weight_scales'].unsqueeze(1)).t()
+        self.dtype = torch.float32
+
+    def predict_2d(self, input_batch):
+        if not input_batch.shape[-1] == self.in_dim:
+            raise ValueError('Expecting an input batch of size batch_size x '
+                             '{}, got {}'.format(self.in_dim,
+                                                 tuple(input_batch.shape)))
+        with torch.no_grad():
+            output = input_batch.to(torch.float32)
+            for layer in self.layers:
+                scale = layer['input_scale']
+                zero_point = layer['input_zero_point']
+                output = torch.clamp(torch.round(output / scale) + zero_point,
+                                     0, 255).to(torch.uint8)
+                if self.kernel == 'onednn':
+                    output = torch.ops.onednn.qlinear_pointwise(
+                        output, scale, zero_point, layer['packed_weights'],
+                        layer['weight_scales'], layer['weight_zero_points'],
+                        layer['bias'], 1., 0, torch.float32, 'none', [], '')
+                else:
+                    output = (output.to(torch.float32) - zero_point) * scale
+                    output = torch.addmm(layer['bias'], output,
+                                         layer['weights_t'])
+                output = apply_activation(layer, output)
+        return output
+
+    def get_ranges(self, input_batch):
+        raise NetworkError('The network is already quantized')
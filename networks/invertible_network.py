@@ -20,6 +20,7 @@ from utils.helper_classes import NetworkError
 class InvertibleNetwork(BidirectionalNetwork):
     """ Invertible Network consisting of multiple invertible layers. This class
         provides a range of methods to facilitate training of the networks """
+    history_state = ('random_layers',)
 
     def __init__(self, layers, log=True, name=None, debug_mode=False,
                  randomize=False):
@@ -65,6 +66,13 @@ class InvertibleNetwork(BidirectionalNetwork):
         for i in range(0, len(self.layers) - 1):
             self.layers[i].init_inverse(self.layers[i + 1])
 
+    def set_dtype_policy(self, dtype_policy):
+        """ Set the dtype policy of all layers and recompute the inverses
+        in its accumulation dtype, as casting the current inverses would
+        keep the rounding errors of their previous dtype."""
+        super().set_dtype_policy(dtype_policy)
+        self.init_inverses()
+
     def save_inverse_error(self):
         if self.log:
             for i in range(0, len(self.layers) - 1):
@@ -149,7 +157,10 @@ class InvertibleNetwork(BidirectionalNetwork):
     def compute_GN_targets(self):
         Jtot = self.compute_total_jacobian()
         g = self.get_output_gradient()
-        J_pinverse = torch.pinverse(Jtot, rcond=1e-6)
+        # torch.pinverse does not support half precision dtypes
+        J_pinverse = torch.pinverse(
+            Jtot.to(self.dtype_policy.accumulation_dtype),
+            rcond=1e-6).to(Jtot.dtype)
         htot = torch.matmul(J_pinverse, -g)
         return htot
 
@@ -159,8 +170,9 @@ class InvertibleNetwork(BidirectionalNetwork):
         for i in range(1,len(self.layers)-1):
             cols += self.layers[i].layer_dim
 
-        J_tot = torch.empty(rows, cols)
-        J = torch.eye(rows, rows)
+        dtype = self.dtype_policy.compute_dtype
+        J_tot = torch.empty(rows, cols, dtype=dtype)
+        J = torch.eye(rows, rows, dtype=dtype)
         end = cols
         for i in range(len(self.layers) - 1,1,-1):
             Di = self.layers[i].compute_vectorized_jacobian()
@@ -181,8 +193,8 @@ class InvertibleNetwork(BidirectionalNetwork):
         for i in range(1,len(self.layers)-1):
             total_length += self.layers[i].layer_dim
 
-        h_update = torch.empty(self.layers[0].forward_output.shape[0],
-                               total_length, 1)
+        h_update = self.layers[0].forward_output.new_empty(
+            (self.layers[0].forward_output.shape[0], total_length, 1))
         start = 0
         for i in range(1, len(self.layers)-1):
             stop = start + self.layers[i].layer_dim
@@ -224,6 +236,7 @@ class InvertibleNetwork(BidirectionalNetwork):
         """
         if not isinstance(target, torch.Tensor):
             raise TypeError("Expecting a torch.Tensor object as target")
+        target = target.to(self.dtype_policy.compute_dtype)
 
         self.layers[-1].compute_backward_output(target)
         self.layers[-1].compute_GN_error(target)
@@ -8,14 +8,23 @@ You may obtain a copy of the License at
    http://www.apache.org/licenses/LICENSE-2.0
 """
 
+import os
 import torch
+from concurrent.futures import ThreadPoolExecutor
 from layers.layer import Layer, InputLayer, OutputLayer, CapsuleOutputLayer
+from utils.helper_classes import DTypePolicy
+from utils.profiler import NetworkProfiler
+from utils import memory
+from networks.frozen_network import FrozenNetwork
 
 
 class Network(object):
     """ Network consisting of multiple layers. This class provides a range of
     methods to facilitate training of the
     networks """
+    # diagnostic histories that grow with the number of training steps (see
+    # utils.memory.MemoryMonitor)
+    history_state = ()
 
     def __init__(self, layers, log=True, name=None):
         """
@@ -29,6 +38,10 @@ class Network(object):
         self.writer = self.layers[0].writer
         self.set_log(log)
         self.global_step = 0
+        self.executor = None
+        self.previous_intra_op_threads = None
+        self.dtype_policy = self.layers[0].dtype_policy
+        self.profiler = None
 
     def set_log(self, log):
         if not isinstance(log, bool):
@@ -74,17 +87,140 @@ class Network(object):
         for layer in self.layers:
             layer.set_name(self.name + '/' + layer.name)
 
+    def set_nb_threads(self, nb_threads, intra_op_threads=None):
+        """ Dispatch the layer-local computations (see run_layer_updates)
+        concurrently over a pool of nb_threads threads. torch releases the
+        GIL inside its kernels, so the layers are computed in parallel.
+        To not oversubscribe the cores, the number of intra-op threads of
+        torch is set to cpu_count/nb_threads, unless intra_op_threads is
+        given. Note that this is a process-wide torch setting; the number of
+        intra-op threads from before the first call is restored by
+        set_nb_threads(None).
+        :param nb_threads: number of threads, or None to compute the layers
+        serially (the default)
+        """
+        if nb_threads is not None:
+            if not isinstance(nb_threads, int):
+                raise TypeError('Expecting an integer or None for '
+                                'nb_threads, got {}'.format(type(nb_threads)))
+            if nb_threads <= 0:
+                raise ValueError('Expecting a strictly positive nb_threads, '
+                                 'got {}'.format(nb_threads))
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+        if nb_threads is None:
+            if self.previous_intra_op_threads is not None:
+                torch.set_num_threads(self.previous_intra_op_threads)
+                self.previous_intra_op_threads = None
+            return
+        if intra_op_threads is None:
+            intra_op_threads = max(1, (os.cpu_count() or 1) // nb_threads)
+        if self.previous_intra_op_threads is None:
+            self.previous_intra_op_threads = torch.get_num_threads()
+        torch.set_num_threads(intra_op_threads)
+        self.executor = ThreadPoolExecutor(max_workers=nb_threads)
+
+    def enable_profiling(self, count_allocations=False,
+                         max_trace_events=100000):
+        """ Record the time of every layer method call, grouped by the
+        network phase (propagate_forward, propagate_backward,
+        compute_forward_gradients, update_parameters, save_state) in which
+        it happened. See utils.profiler.NetworkProfiler for the arguments
+        and the table, TensorBoard and Chrome trace exports.
+        :return: the NetworkProfiler object, also saved in self.profiler
+        """
+        if self.profiler is not None:
+            self.disable_profiling()
+        self.profiler = NetworkProfiler(count_allocations=count_allocations,
+                                        max_trace_events=max_trace_events)
+        self.profiler.install(self)
+        return self.profiler
+
+    def disable_profiling(self):
+        """ Remove the profiling wrappers, such that the network and its
+        layers run without overhead again.
+        :return: the NetworkProfiler object with the recorded calls
+        """
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.uninstall()
+            self.profiler = None
+        return profiler
+
+    def set_history_policy(self, policy='all', capacity=None):
+        """ Set the policy and capacity of the diagnostic histories of all
+        layers, e.g. set_history_policy('decimate', 10000) to keep at most
+        10000 values of each history (see utils.history.History)."""
+        for layer in self.layers:
+            layer.set_history_policy(policy, capacity)
+
+    def memory_report(self, optimizers=None):
+        """ Return a DataFrame, indexed by owner (network, layer or
+        optimizer) and attribute, with the type, shape and number of bytes of
+        every attribute of the network, its layers and the given optimizers
+        that holds tensors, numpy arrays or lists of them. Tensors that share
+        their storage with an earlier attribute count as 0 bytes. The
+        history column marks the diagnostic histories (see history_state).
+        :param optimizers: list of optimizers of the network to include
+        """
+        return memory.memory_report(self, optimizers)
+
+    def set_dtype_policy(self, dtype_policy):
+        """ Set the dtype policy of all layers (see Layer.set_dtype_policy).
+        The input batches and targets are cast to its compute dtype when
+        they are propagated through the network.
+        :param dtype_policy: DTypePolicy object or name of a predefined
+        policy, e.g. 'float64' or 'bfloat16' (see DTypePolicy.from_name)
+        """
+        if isinstance(dtype_policy, str):
+            dtype_policy = DTypePolicy.from_name(dtype_policy)
+        if not isinstance(dtype_policy, DTypePolicy):
+            raise TypeError("Expecting a DTypePolicy object or a string for "
+                            "dtype_policy, got {}".format(type(dtype_policy)))
+        for layer in self.layers:
+            layer.set_dtype_policy(dtype_policy)
+        self.dtype_policy = dtype_policy
+        self.writer = self.layers[0].writer
+
+    def run_layer_updates(self, update, indices):
+        """ Call update(i) for each layer index i in indices. The calls
+        should only depend on the cached outputs of layer i and its
+        neighbours, as they run concurrently if a thread pool is set with
+        set_nb_threads."""
+        if self.executor is None:
+            for i in indices:
+                update(i)
+        else:
+            futures = [self.executor.submit(update, i) for i in indices]
+            for future in futures:
+                # re-raises the exceptions of the layers
+                future.result()
+
     def init_velocities(self):
         """ Initialize the gradient velocities in all the layers. Only called
         when an optimizer with momentum is used."""
         for i in range(1, len(self.layers)):
             self.layers[i].init_velocities()
 
+    def train(self):
+        """ Put all layers in training mode (the default)."""
+        for layer in self.layers:
+            layer.set_training(True)
+
+    def eval(self):
+        """ Put all layers in evaluation mode, e.g. for computing the test
+        loss. Layers with batch statistics then use their running
+        statistics, so the results do not depend on the test batch size."""
+        for layer in self.layers:
+            layer.set_training(False)
+
     def propagate_forward(self, input_batch):
         """ Propagate the inputbatch forward through the network
         :param input_batch: Inputbatch of dimension
         batch dimension x input dimension x 1"""
         self.batch_size = input_batch.shape[0]
+        input_batch = input_batch.to(self.dtype_policy.compute_dtype)
         self.layers[0].set_forward_output(input_batch)
         for i in range(1, len(self.layers)):
             self.layers[i].propagate_forward(self.layers[i - 1])
@@ -97,6 +233,7 @@ class Network(object):
         """
         if not isinstance(target, torch.Tensor):
             raise TypeError("Expecting a torch.Tensor object as target")
+        target = target.to(self.dtype_policy.compute_dtype)
         if not type(self.layers[-1]) == CapsuleOutputLayer:
             if not self.layers[-1].forward_output.shape == target.shape:
                 raise ValueError('Expecting a tensor of dimensions: '
@@ -112,8 +249,10 @@ class Network(object):
     def compute_forward_gradients(self):
         """compute the gradient of the loss function to the
         parameters of each layer"""
-        for i in range(1, len(self.layers)):
-            self.layers[i].compute_forward_gradients(self.layers[i - 1])
+        self.run_layer_updates(
+            lambda i: self.layers[i].compute_forward_gradients(
+                self.layers[i - 1]),
+            range(1, len(self.layers)))
 
     def compute_forward_gradient_velocities(self, momentum, learning_rate):
         """Compute the gradient velocities for each layer"""
@@ -163,6 +302,18 @@ class Network(object):
         self.propagate_forward(input_batch)
         return self.layers[-1].forward_output
 
+    def freeze(self, dtype=torch.float32):
+        """ Return a FrozenNetwork (see networks.frozen_network) with a copy
+        of the current forward weights and biases, for fast and thread-safe
+        inference. The frozen network computes the forward pass of the
+        network in evaluation mode, e.g. with the running statistics of the
+        batch normalization of MTP layers, and can be saved to a compact
+        file with FrozenNetwork.save. See FrozenNetwork.quantize for int8
+        post-training quantization.
+        :param dtype: dtype of the frozen weights
+        """
+        return FrozenNetwork.from_network(self, dtype=dtype)
+
     def accuracy(self, targets):
         """ Return the test accuracy of network based on the given input
         test batch and the true targets
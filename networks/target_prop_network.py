@@ -17,10 +17,29 @@ import numpy as np
 from utils.helper_classes import NetworkError
 
 class TargetPropNetwork(BidirectionalNetwork):
+    history_state = ('random_layers',)
+
     def __init__(self, layers, log=True, name=None, debug_mode=False,
-                 randomize=False, find_inverses=False):
+                 randomize=False, find_inverses=False,
+                 refresh_inverses_interval=None, noise_batch_size=None,
+                 backward_iterations=1):
+        """
+        :param find_inverses: learn the backward weights from scratch
+        instead of initializing them to the pseudo-inverses of the forward
+        weights. The forward weights are kept fixed in this mode.
+        :param refresh_inverses_interval: if not None, refit the backward
+        weights in closed form (see fit_inverses) every
+        refresh_inverses_interval backward parameter updates.
+        :param noise_batch_size: number of noise samples per gradient step
+        on the backward weights. If None, the data batch size is used.
+        :param backward_iterations: number of gradient steps on the backward
+        weights per training step.
+        """
         super().__init__(layers=layers, log=log, name=name)
         self.find_inverses = find_inverses
+        self.set_refresh_inverses_interval(refresh_inverses_interval)
+        self.backward_updates = 0
+        self.set_noise_batching(noise_batch_size, backward_iterations)
         self.init_inverses()
         self.debug_mode = debug_mode
         self.randomize = randomize
@@ -38,6 +57,38 @@ class TargetPropNetwork(BidirectionalNetwork):
         else:
             pass
 
+    def set_refresh_inverses_interval(self, refresh_inverses_interval):
+        if refresh_inverses_interval is not None:
+            if not isinstance(refresh_inverses_interval, int):
+                raise TypeError('Expecting an integer or None for '
+                                'refresh_inverses_interval, got {}'.format(
+                    type(refresh_inverses_interval)))
+            if refresh_inverses_interval <= 0:
+                raise ValueError('Expecting a strictly positive '
+                                 'refresh_inverses_interval, got {}'.format(
+                    refresh_inverses_interval))
+        self.refresh_inverses_interval = refresh_inverses_interval
+
+    def set_noise_batching(self, noise_batch_size, backward_iterations):
+        """ Set the noise batch size and the number of inner iterations of
+        the backward weight updates of all layers."""
+        for i in range(0, len(self.layers) - 1):
+            self.layers[i].set_noise_batch_size(noise_batch_size)
+            self.layers[i].set_backward_iterations(backward_iterations)
+
+    def fit_inverses(self, nb_samples=10000, batch_size=1000,
+                     regularization=None):
+        """ Fit the backward weights of all layers in closed form to the
+        regularized least-squares reconstruction problem on gaussian noise,
+        instead of with many small SGD steps (see
+        TargetPropLayer.fit_backward_parameters). Can be used once before
+        training and is used periodically if refresh_inverses_interval
+        is set."""
+        for i in range(0, len(self.layers) - 1):
+            self.layers[i].fit_backward_parameters(
+                self.layers[i + 1], nb_samples=nb_samples,
+                batch_size=batch_size, regularization=regularization)
+
     def save_inverse_error(self):
         if self.log:
             for i in range(0, len(self.layers) - 1):
@@ -110,7 +161,10 @@ class TargetPropNetwork(BidirectionalNetwork):
     def compute_GN_targets(self):
         Jtot = self.compute_total_jacobian()
         g = self.get_output_gradient()
-        J_pinverse = hf.pinverse(Jtot, rcond=1e-6)
+        # torch.pinverse does not support half precision dtypes
+        J_pinverse = hf.pinverse(
+            Jtot.to(self.dtype_policy.accumulation_dtype),
+            rcond=1e-6).to(Jtot.dtype)
         htot = torch.matmul(J_pinverse, -g)
         return htot
 
@@ -120,8 +174,9 @@ class TargetPropNetwork(BidirectionalNetwork):
         for i in range(1,len(self.layers)-1):
             cols += self.layers[i].layer_dim
 
-        J_tot = torch.empty(self.batch_size, rows, cols)
-        J = hf.eye(rows=rows, batch_size=self.batch_size)
+        dtype = self.dtype_policy.compute_dtype
+        J_tot = torch.empty(self.batch_size, rows, cols, dtype=dtype)
+        J = hf.eye(rows=rows, batch_size=self.batch_size, dtype=dtype)
         end = cols
         for i in range(len(self.layers) - 1,1,-1):
             Di = self.layers[i].compute_vectorized_jacobian()
@@ -142,8 +197,8 @@ class TargetPropNetwork(BidirectionalNetwork):
         for i in range(1,len(self.layers)-1):
             total_length += self.layers[i].layer_dim
 
-        h_update = torch.empty(self.layers[0].forward_output.shape[0],
-                               total_length, 1)
+        h_update = self.layers[0].forward_output.new_empty(
+            (self.layers[0].forward_output.shape[0], total_length, 1))
         start = 0
         for i in range(1, len(self.layers)-1):
             stop = start + self.layers[i].layer_dim
@@ -161,9 +216,18 @@ class TargetPropNetwork(BidirectionalNetwork):
         #     self.layers[i].update_backward_parameters(learning_rate,
         #                                                   self.layers[i + 1])
         # else:
-        for i in range(0, len(self.layers) - 1):
-            self.layers[i].update_backward_parameters(learning_rate,
-                                                      self.layers[i + 1])
+        # the noise is drawn here in layer order, such that the random
+        # stream does not depend on the order of concurrent updates
+        noise_inputs = [self.layers[i].draw_noise_input()
+                        for i in range(0, len(self.layers) - 1)]
+        self.run_layer_updates(
+            lambda i: self.layers[i].update_backward_parameters(
+                learning_rate, self.layers[i + 1], noise_inputs[i]),
+            range(0, len(self.layers) - 1))
+        self.backward_updates += 1
+        if self.refresh_inverses_interval is not None:
+            if self.backward_updates % self.refresh_inverses_interval == 0:
+                self.fit_inverses()
 
     def update_forward_parameters(self, learning_rate):
         """ Update all the parameters of the network with the
@@ -188,6 +252,7 @@ class TargetPropNetwork(BidirectionalNetwork):
         """
         if not isinstance(target, torch.Tensor):
             raise TypeError("Expecting a torch.Tensor object as target")
+        target = target.to(self.dtype_policy.compute_dtype)
 
         self.layers[-1].compute_backward_output(target)
         self.layers[-1].compute_GN_error(target)
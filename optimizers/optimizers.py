@@ -13,10 +13,20 @@ from utils import helper_functions as hf
 from networks.network import Network
 import pandas as pd
 from networks.invertible_network import InvertibleNetwork
+from utils.mnist_store import MNISTStore
+from utils.prefetch import BatchPrefetcher
+from utils.memory import MemoryMonitor
 
 
 class Optimizer(object):
     """" Super class for all the different optimizers (e.g. SGD)"""
+    # results that grow with the number of training steps (see
+    # utils.memory.MemoryMonitor)
+    history_state = ('epoch_losses', 'batch_losses', 'single_batch_losses',
+                     'test_losses', 'test_batch_losses', 'epoch_accuracies',
+                     'batch_accuracies', 'single_batch_accuracies',
+                     'test_accuracies', 'test_batch_accuracies',
+                     'data_wait_times')
 
     def __init__(self, network, max_epoch=150, compute_accuracies=False,
                  outputfile_name='result_file.csv'):
@@ -36,7 +46,6 @@ class Optimizer(object):
         self.set_network(network)
         self.set_compute_accuracies(compute_accuracies)
         self.set_max_epoch(max_epoch)
-        self.writer = self.network.writer
         self.global_step = 0
         self.outputfile = pd.DataFrame(columns=['Train_loss', 'Test_loss'])
         self.outputfile_name = '../logs/{}'.format(outputfile_name)
@@ -52,6 +61,10 @@ class Optimizer(object):
         self.log = network.log
         self.start_train_loss = torch.Tensor([])
         self.start_test_loss = torch.Tensor([])
+        self.set_prefetch(None)
+        self.set_print_data_wait_time(False)
+        self.data_wait_times = []
+        self.memory_monitor = None
 
     def set_network(self, network):
         if not isinstance(network, Network):
@@ -59,6 +72,11 @@ class Optimizer(object):
                             "{}".format(type(network)))
         self.network = network
 
+    @property
+    def writer(self):
+        # the writer of the network can change with its dtype policy
+        return self.network.writer
+
     def set_learning_rate(self, learning_rate):
         if not isinstance(learning_rate, float):
             raise TypeError("Expecting a float number as learning_rate")
@@ -87,6 +105,41 @@ class Optimizer(object):
                              'max_epoch, got {}'.format(max_epoch))
         self.max_epoch = max_epoch
 
+    def set_prefetch(self, prefetch):
+        """ Number of training batches that are prepared in a background
+        thread while the current step runs (see BatchPrefetcher). 0 to
+        prepare the batches synchronously. None (default) to prefetch 2
+        batches in run_mnist, where the batches are loaded and transformed,
+        and none in run_dataset, where the batches are slices of in-memory
+        tensors and a thread would only add overhead."""
+        if prefetch is not None and not isinstance(prefetch, int):
+            raise TypeError('Expecting integer or None for prefetch, got '
+                            '{}'.format(type(prefetch)))
+        if prefetch is not None and prefetch < 0:
+            raise ValueError('Expecting positive integer for prefetch, got '
+                             '{}'.format(prefetch))
+        self.prefetch = prefetch
+
+    def get_prefetch(self, default):
+        return default if self.prefetch is None else self.prefetch
+
+    def set_print_data_wait_time(self, print_data_wait_time):
+        """ Print the time the training loop waited for data after each
+        epoch."""
+        if not isinstance(print_data_wait_time, bool):
+            raise TypeError('Expecting a bool for print_data_wait_time, got '
+                            '{}'.format(type(print_data_wait_time)))
+        self.print_data_wait_time = print_data_wait_time
+
+    def set_memory_monitor(self, memory_monitor):
+        """ Sample memory_monitor (see utils.memory.MemoryMonitor) after
+        each training step, or None to not monitor the memory."""
+        if memory_monitor is not None and \
+                not isinstance(memory_monitor, MemoryMonitor):
+            raise TypeError('Expecting a MemoryMonitor object or None, got '
+                            '{}'.format(type(memory_monitor)))
+        self.memory_monitor = memory_monitor
+
     def reset_single_batch_losses(self):
         self.single_batch_losses = torch.Tensor([])
 
@@ -107,6 +160,7 @@ class Optimizer(object):
         self.test_losses = torch.Tensor([])
         self.test_batch_losses = torch.Tensor([])
         self.global_step = 0
+        self.data_wait_times = []
         if self.compute_accuracies:
             self.epoch_accuracies = torch.Tensor([])
             self.batch_accuracies = torch.Tensor([])
@@ -139,6 +193,8 @@ class Optimizer(object):
                                               0)
             self.single_batch_accuracies = torch.cat(
                 [self.single_batch_accuracies, accuracy], 0)
+        if self.memory_monitor is not None:
+            self.memory_monitor.sample(self.global_step)
 
     def test_step(self, data, target):
         self.network.propagate_forward(data)
@@ -196,6 +252,17 @@ class Optimizer(object):
             self.reset_single_batch_accuracies()
             print('Train Accuracy: ' + str(epoch_accuracy))
 
+    def save_data_wait_time(self, wait_time):
+        """ Save the time the training loop waited for data during the
+        epoch, to see whether the input pipeline is the bottleneck."""
+        self.data_wait_times.append(wait_time)
+        if self.log:
+            self.writer.add_scalar(tag='data_wait_time',
+                                   scalar_value=wait_time,
+                                   global_step=self.epoch)
+        if self.print_data_wait_time:
+            print('Data wait time: {:.3f}s'.format(wait_time))
+
     def save_result_file(self):
         train_loss = self.epoch_losses[-1]
         test_loss = self.test_losses[-1]
@@ -211,22 +278,26 @@ class Optimizer(object):
         """ Train the network on the total training set of MNIST as
         long as epoch loss is above the threshold
         :param train_loader: a torch.utils.data.DataLoader object
-        which containts the dataset"""
-        if not isinstance(train_loader, torch.utils.data.DataLoader):
-            raise TypeError("Expecting a DataLoader object, now got a "
-                            "{}".format(type(train_loader)))
+        which containts the dataset, or a MNISTStore"""
+        if not isinstance(train_loader, (torch.utils.data.DataLoader,
+                                         MNISTStore)):
+            raise TypeError("Expecting a DataLoader or MNISTStore object, "
+                            "now got a {}".format(type(train_loader)))
 
         epoch_loss = float('inf')
         print('====== Training started =======')
         print('Epoch: ' + str(self.epoch) + ' ------------------------')
         while epoch_loss > self.threshold and self.epoch < self.max_epoch:
-            for batch_idx, (data, target) in enumerate(train_loader):
+            train_batches = BatchPrefetcher(
+                train_loader,
+                lambda data, target: self.prepare_mnist_batch(
+                    train_loader, data, target, device),
+                nb_prefetch=self.get_prefetch(2))
+            for batch_idx, (data, target) in enumerate(train_batches):
                 if batch_idx % 200 == 0:
                     print('batch: ' + str(batch_idx))
-                data = data.view(-1, 28 * 28, 1)
-                target = hf.one_hot(target, 10)
-                data, target = data.to(device), target.to(device)
                 self.step(data, target)
+            self.save_data_wait_time(train_batches.wait_time)
             self.save_train_results_epoch()
             epoch_loss = self.epoch_losses[-1]
             self.test_mnist(test_loader, device)
@@ -242,12 +313,22 @@ class Optimizer(object):
         #     self.writer.close()
         print('====== Training finished =======')
 
-    def test_mnist(self, test_loader, device):
-        for batch_idx, (data, target) in enumerate(test_loader):
+    def prepare_mnist_batch(self, loader, data, target, device):
+        """ Reshape the images and one-hot encode the labels of a batch of
+        a DataLoader. The batches of a MNISTStore are already in this
+        form."""
+        if not isinstance(loader, MNISTStore):
             data = data.view(-1, 28 * 28, 1)
             target = hf.one_hot(target, 10)
-            data, target = data.to(device), target.to(device)
+        return data.to(device), target.to(device)
+
+    def test_mnist(self, test_loader, device):
+        self.network.eval()
+        for batch_idx, (data, target) in enumerate(test_loader):
+            data, target = self.prepare_mnist_batch(test_loader, data,
+                                                    target, device)
             self.test_step(data, target)
+        self.network.train()
         self.save_test_results_epoch()
 
     def run_dataset(self, input_data, targets, input_data_test, targets_test):
@@ -261,9 +342,11 @@ class Optimizer(object):
         self.get_start_loss(input_data, targets, input_data_test, targets_test)
         print('Epoch: ' + str(self.epoch) + ' ------------------------')
         while epoch_loss > self.threshold and self.epoch < self.max_epoch:
-            for i in range(input_data.size(0)):
-                data = input_data[i, :, :, :]
-                target = targets[i, :, :, :]
+            train_batches = BatchPrefetcher(
+                ((input_data[i, :, :, :], targets[i, :, :, :])
+                 for i in range(input_data.size(0))),
+                nb_prefetch=self.get_prefetch(0))
+            for i, (data, target) in enumerate(train_batches):
                 if i % 2000 == 0:
                     print('batch: ' + str(i))
                 # if i % 3000 == 0:
@@ -271,6 +354,7 @@ class Optimizer(object):
                 #         self.network.init_inverses
                 #         print('recomputing inverses')
                 self.step(data, target)
+            self.save_data_wait_time(train_batches.wait_time)
             self.save_train_results_epoch()
             epoch_loss = self.epoch_losses[-1]
             self.test_dataset(input_data_test, targets_test)
@@ -288,10 +372,12 @@ class Optimizer(object):
         return self.epoch_losses.cpu().numpy(), self.test_losses.cpu().numpy()
 
     def test_dataset(self, input_data, targets):
+        self.network.eval()
         for i in range(input_data.size(0)):
             data = input_data[i, :, :, :]
             target = targets[i, :, :, :]
             self.test_step(data, target)
+        self.network.train()
         self.save_test_results_epoch()
 
     def step(self, input_batch, targets):
@@ -316,10 +402,12 @@ class Optimizer(object):
             data = input_data[i, :, :, :]
             target = targets[i, :, :, :]
             self.fixed_step(data, target)
+        self.network.eval()
         for i in range(input_data_test.size(0)):
             data = input_data_test[i, :, :, :]
             target = targets_test[i, :, :, :]
             self.fixed_step_test(data, target)
+        self.network.train()
 
         start_train_loss = torch.Tensor([torch.mean(self.start_train_loss)])
         start_test_loss = torch.Tensor([torch.mean(self.start_test_loss)])
@@ -0,0 +1,312 @@
+"""
+Copyright 2019 Alexander Meulemans
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+"""
+
+import os
+import queue
+import traceback
+import torch
+import torch.multiprocessing as mp
+from networks.target_prop_network import TargetPropNetwork
+from utils.helper_classes import NetworkError
+
+# Attributes of a layer that depend on the batch that is being processed.
+# They are sent along with the activations and targets between the workers
+# and restored before the layer-local computations of a batch.
+BATCH_ATTRIBUTES = ('forward_input', 'forward_linear_activation',
+                    'forward_output', 'forward_output_batchnorm', 'mu',
+                    'sigma', 'backward_output', 'backward_output_batchnorm')
+
+
+def get_batch_state(layer):
+    return {name: getattr(layer, name) for name in BATCH_ATTRIBUTES
+            if getattr(layer, name, None) is not None}
+
+
+def set_batch_state(layer, state):
+    for name, value in state.items():
+        setattr(layer, name, value)
+
+
+class SGDPipelined(object):
+    """ Layer-pipelined asynchronous training of a TargetPropNetwork.
+    As the learning rules of target propagation are local, each layer
+    (except the input layer) is trained in its own worker process. Forward
+    activations are streamed up and targets are streamed down the pipeline
+    through queues, such that layer i can work on batch t while layer i+1
+    works on batch t-1. The forward and backward parameters of all layers
+    live in shared memory, so the parameters of the network object in the
+    main process are updated in place. The noise of the backward updates is
+    drawn in the main process when a batch is submitted, in the same order
+    as TargetPropNetwork.update_backward_parameters, such that the
+    pipeline follows the random stream of the synchronous updates.
+
+    The workers are forked, so this optimizer only works with the 'fork'
+    start method (Linux). The per-network options randomize and
+    refresh_inverses_interval, and the GN/BP diagnostics computed in
+    TargetPropNetwork.propagate_backward are not used in pipelined mode.
+    """
+    # interval in seconds at which receive checks that the workers are alive
+    poll_interval = 1.
+
+    def __init__(self, network, learning_rate, learning_rate_backward,
+                 max_staleness=2, intra_op_threads=None):
+        """
+        :param max_staleness: maximum number of batches in flight in the
+        pipeline. The forward pass of batch t is computed with the
+        parameters updated on at least batch t-max_staleness. With
+        max_staleness=1, the updates are the same as with
+        SGDbidirectional.step.
+        :param intra_op_threads: number of torch threads of each worker,
+        cpu_count/number of workers if None.
+        """
+        self.set_network(network)
+        self.set_learning_rates(learning_rate, learning_rate_backward)
+        self.set_max_staleness(max_staleness)
+        if intra_op_threads is None:
+            intra_op_threads = max(1, (os.cpu_count() or 1) //
+                                   (len(network.layers) - 1))
+        self.intra_op_threads = intra_op_threads
+        self.workers = []
+        self.batch_losses = []
+
+    def set_network(self, network):
+        if not isinstance(network, TargetPropNetwork):
+            raise TypeError("Expecting a TargetPropNetwork object, got "
+                            "{}".format(type(network)))
+        if len(network.layers) < 3:
+            raise ValueError("Expecting a network with at least one hidden "
+                             "layer to pipeline")
+        self.network = network
+
+    def set_learning_rates(self, learning_rate, learning_rate_backward):
+        for rate in (learning_rate, learning_rate_backward):
+            if not isinstance(rate, float):
+                raise TypeError("Expecting a float number as learning rate, "
+                                "got {}".format(type(rate)))
+            if rate <= 0.:
+                raise ValueError("Expecting a strictly positive learning "
+                                 "rate, got {}".format(rate))
+        self.learning_rate = learning_rate
+        self.learning_rate_backward = learning_rate_backward
+
+    def set_max_staleness(self, max_staleness):
+        if not isinstance(max_staleness, int):
+            raise TypeError("Expecting an integer for max_staleness, "
+                            "got {}".format(type(max_staleness)))
+        if max_staleness <= 0:
+            raise ValueError("Expecting a strictly positive max_staleness, "
+                             "got {}".format(max_staleness))
+        self.max_staleness = max_staleness
+
+    def share_parameters(self):
+        """ Move the parameters of all layers to shared memory, such that
+        the forked workers and the main process see the same tensors."""
+        self.shared_parameters = []
+        for layer in self.network.layers:
+            parameters = {}
+            for name in ('forward_weights', 'forward_bias',
+                         'backward_weights', 'backward_bias'):
+                if getattr(layer, name, None) is not None:
+                    parameters[name] = getattr(layer, name).share_memory_()
+            self.shared_parameters.append(parameters)
+
+    def start(self):
+        """ Fork one worker process per layer."""
+        if self.workers:
+            raise NetworkError("The pipeline is already started")
+        try:
+            context = mp.get_context('fork')
+        except ValueError:
+            raise NetworkError("SGDPipelined needs the 'fork' start method")
+        self.share_parameters()
+        nb_layers = len(self.network.layers)
+        self.inboxes = [None] + [context.Queue() for _ in
+                                 range(1, nb_layers)]
+        self.outbox = context.Queue()
+        for i in range(1, nb_layers):
+            worker = context.Process(target=self.run_worker,
+                                     args=(i,), daemon=True)
+            worker.start()
+            self.workers.append(worker)
+        self.submitted = 0
+        self.completed = 0
+
+    def run_worker(self, i):
+        torch.set_num_threads(self.intra_op_threads)
+        try:
+            self.worker_loop(i)
+        except Exception:
+            self.outbox.put(('error', self.network.layers[i].name,
+                             traceback.format_exc()))
+
+    def worker_loop(self, i):
+        layers = self.network.layers
+        layer = layers[i]
+        lower_layer = layers[i - 1]
+        is_output = i == len(layers) - 1
+        upper_layer = None if is_output else layers[i + 1]
+        update_forward = not self.network.find_inverses
+        batch_states = {}
+
+        while True:
+            message = self.inboxes[i].get()
+            if message[0] == 'stop':
+                if not is_output:
+                    self.inboxes[i + 1].put(message)
+                return
+            elif message[0] == 'forward':
+                _, t, lower_state, targets, noise_inputs = message
+                set_batch_state(lower_layer, lower_state)
+                layer.propagate_forward(lower_layer)
+                if is_output:
+                    layer.compute_backward_output(targets)
+                    self.outbox.put(('loss', t, float(layer.loss(targets))))
+                    self.update_forward_parameters(i, update_forward)
+                    self.inboxes[i - 1].put(('backward', t,
+                                             get_batch_state(layer)))
+                else:
+                    batch_states[t] = (lower_state, get_batch_state(layer),
+                                       noise_inputs)
+                    self.inboxes[i + 1].put(('forward', t,
+                                             batch_states[t][1], targets,
+                                             noise_inputs))
+            elif message[0] == 'backward':
+                _, t, upper_state = message
+                lower_state, state, noise_inputs = batch_states.pop(t)
+                set_batch_state(lower_layer, lower_state)
+                set_batch_state(layer, state)
+                set_batch_state(upper_layer, upper_state)
+                layer.propagate_backward(upper_layer)
+                self.update_forward_parameters(i, update_forward)
+                layer.update_backward_parameters(self.learning_rate_backward,
+                                                 upper_layer,
+                                                 noise_inputs[i])
+                self.publish_parameters(i)
+                if i > 1:
+                    self.inboxes[i - 1].put(('backward', t,
+                                             get_batch_state(layer)))
+                else:
+                    lower_layer.update_backward_parameters(
+                        self.learning_rate_backward, layer, noise_inputs[0])
+                    self.publish_parameters(0)
+                    self.outbox.put(('done', t))
+            else:
+                raise NetworkError("Unknown message {}".format(message[0]))
+
+    def update_forward_parameters(self, i, update_forward):
+        if update_forward:
+            layers = self.network.layers
+            layers[i].compute_forward_gradients(layers[i - 1])
+            layers[i].update_forward_parameters(self.learning_rate)
+            self.publish_parameters(i)
+
+    def publish_parameters(self, i):
+        """ The setters of the layers assign new tensors to the parameters.
+        Copy them into the shared tensors, such that the other processes
+        see the update, and let the layer point to the shared tensors
+        again."""
+        layer = self.network.layers[i]
+        for name, shared in self.shared_parameters[i].items():
+            if getattr(layer, name) is not shared:
+                shared.copy_(getattr(layer, name))
+                setattr(layer, name, shared)
+
+    def step(self, input_batch, targets):
+        """ Feed one batch into the pipeline. Blocks while max_staleness
+        batches are in flight."""
+        if not self.workers:
+            raise NetworkError("The pipeline should be started before "
+                               "calling step")
+        while self.submitted - self.completed >= self.max_staleness:
+            self.receive()
+        noise_inputs = [layer.draw_noise_input(input_batch.shape[0])
+                        for layer in self.network.layers[:-1]]
+        self.inboxes[1].put(('forward', self.submitted,
+                             {'forward_output': input_batch}, targets,
+                             noise_inputs))
+        self.submitted += 1
+
+    def receive(self):
+        """ Handle the next message of the workers. Raise a NetworkError if
+        a worker reports an error or exits without reporting one (e.g. when
+        it is killed)."""
+        while True:
+            try:
+                message = self.outbox.get(timeout=self.poll_interval)
+                break
+            except queue.Empty:
+                dead_workers = [worker for worker in self.workers
+                                if not worker.is_alive()]
+                if not dead_workers:
+                    continue
+                # an error message may still be on its way
+                try:
+                    message = self.outbox.get(timeout=self.poll_interval)
+                    break
+                except queue.Empty:
+                    pass
+                exit_codes = [worker.exitcode for worker in dead_workers]
+                self.stop(terminate=True)
+                raise NetworkError("{} pipeline worker(s) exited "
+                                   "unexpectedly with exit code(s) "
+                                   "{}".format(len(exit_codes), exit_codes))
+        if message[0] == 'done':
+            self.completed += 1
+        elif message[0] == 'loss':
+            self.batch_losses.append(message[2])
+        else:
+            self.stop(terminate=True)
+            raise NetworkError("Worker of {} failed:\n{}".format(
+                message[1], message[2]))
+
+    def synchronize(self):
+        """ Wait until all the batches in flight are processed."""
+        while self.completed < self.submitted:
+            self.receive()
+
+    def stop(self, terminate=False):
+        """ Wait for the batches in flight and shut the workers down."""
+        if terminate:
+            for worker in self.workers:
+                worker.terminate()
+        else:
+            self.synchronize()
+            self.inboxes[1].put(('stop',))
+        for worker in self.workers:
+            worker.join()
+        self.workers = []
+
+    def run_dataset(self, input_data, targets):
+        """ Train for one epoch on the dataset and return the mean training
+        loss of the batches.
+        :param input_data: 4D tensor of size nb_batches x batch_size x
+        input dimension x 1
+        :param targets: 4D tensor of size nb_batches x batch_size x
+        output dimension x 1
+        """
+        started = bool(self.workers)
+        if not started:
+            self.start()
+        nb_losses = len(self.batch_losses)
+        for i in range(input_data.shape[0]):
+            self.step(input_data[i], targets[i])
+        if started:
+            self.synchronize()
+        else:
+            self.stop()
+        epoch_losses = self.batch_losses[nb_losses:]
+        return sum(epoch_losses)/len(epoch_losses)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.stop(terminate=exc_type is not None)
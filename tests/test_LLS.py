@@ -0,0 +1,97 @@
+import numpy as np
+import torch
+from utils.LLS import streaming_linear_least_squares
+from utils.helper_classes import TestError
+
+
+def lstsq(inputs, outputs, bias, regularization):
+    """ Reference solution with np.linalg.lstsq, the ridge penalty being
+    added as extra rows sqrt(regularization)*I (zero for the bias)."""
+    if bias:
+        inputs = np.concatenate((inputs, np.ones((inputs.shape[0], 1))), 1)
+    penalty = np.sqrt(regularization) * np.eye(inputs.shape[1])
+    if bias:
+        penalty[-1, -1] = 0.
+    weights = np.linalg.lstsq(
+        np.concatenate((inputs, penalty), 0),
+        np.concatenate((outputs, np.zeros((inputs.shape[1],
+                                           outputs.shape[1]))), 0),
+        rcond=None)[0]
+    loss = np.mean(np.sum((np.matmul(inputs, weights) - outputs) ** 2, 1))
+    return weights, loss
+
+
+torch.manual_seed(3)
+in_dim, out_dim = 6, 4
+true_weights = torch.randn(out_dim, in_dim, dtype=torch.float64)
+input_dataset = torch.randn(10, 32, in_dim, 1, dtype=torch.float64)
+output_dataset = torch.matmul(true_weights, input_dataset) + 0.5 + \
+    0.1 * torch.randn(10, 32, out_dim, 1, dtype=torch.float64)
+input_dataset_test = torch.randn(3, 32, in_dim, 1, dtype=torch.float64)
+output_dataset_test = torch.matmul(true_weights, input_dataset_test) + 0.5
+inputs = input_dataset.reshape(-1, in_dim).numpy()
+outputs = output_dataset.reshape(-1, out_dim).numpy()
+
+for bias in [False, True]:
+    for regularization in [0., 10.]:
+        weights, train_loss, test_loss = streaming_linear_least_squares(
+            (input_dataset, output_dataset),
+            (input_dataset_test, output_dataset_test), bias=bias,
+            regularization=regularization)
+        weights_lstsq, train_loss_lstsq = lstsq(inputs, outputs, bias,
+                                                regularization)
+        if not np.allclose(weights, weights_lstsq, atol=1e-8):
+            raise TestError('The weights differ from np.linalg.lstsq (bias='
+                            '{}, regularization={})'.format(bias,
+                                                            regularization))
+        if not np.isclose(train_loss, train_loss_lstsq, rtol=1e-8):
+            raise TestError('The train loss differs from np.linalg.lstsq '
+                            '(bias={}, regularization={}): {} != {}'.format(
+                                bias, regularization, train_loss,
+                                train_loss_lstsq))
+
+        # a single-pass iterator gives the same solution and train loss
+        stream = zip(input_dataset, output_dataset)
+        weights_stream, train_loss_stream, _ = \
+            streaming_linear_least_squares(stream, bias=bias,
+                                           regularization=regularization)
+        if not np.allclose(weights_stream, weights, atol=1e-10) or \
+                not np.isclose(train_loss_stream, train_loss, rtol=1e-6):
+            raise TestError('The single-pass iterator gives another '
+                            'solution')
+
+# the test loss is the mean squared error on the test set
+weights, _, test_loss = streaming_linear_least_squares(
+    (input_dataset, output_dataset),
+    (input_dataset_test, output_dataset_test), bias=True)
+inputs_test = input_dataset_test.reshape(-1, in_dim).numpy()
+outputs_test = output_dataset_test.reshape(-1, out_dim).numpy()
+prediction = np.matmul(inputs_test, weights[:-1]) + weights[-1]
+if not np.isclose(test_loss, np.mean(np.sum((prediction - outputs_test) ** 2,
+                                            1)), rtol=1e-10):
+    raise TestError('Wrong test loss')
+
+# the weights have the dtype of the training inputs, the solution is
+# computed in float64 for float32 inputs as well
+weights_float, train_loss_float, test_loss_float = \
+    streaming_linear_least_squares(
+        (input_dataset.float(), output_dataset.float()),
+        (input_dataset_test.float(), output_dataset_test.float()), bias=True)
+if not weights_float.dtype == np.float32 or not weights.dtype == np.float64:
+    raise TestError('Expecting the weights in the dtype of the inputs, got '
+                    '{} and {}'.format(weights_float.dtype, weights.dtype))
+if not np.allclose(weights_float, weights, atol=1e-5) or \
+        not np.isclose(test_loss_float, test_loss, rtol=1e-5):
+    raise TestError('The float32 inputs give another solution')
+
+# an exact fit of large outputs has a (non-negative) zero train loss, where
+# the expanded quadratic form cancels catastrophically
+output_dataset = 1e4 * torch.matmul(true_weights, input_dataset)
+for train_data in [(input_dataset, output_dataset),
+                   zip(input_dataset, output_dataset)]:
+    _, train_loss, _ = streaming_linear_least_squares(train_data)
+    if not 0. <= train_loss < 1e-6:
+        raise TestError('Expecting a zero train loss for an exact fit, got '
+                        '{}'.format(train_loss))
+
+print('LLS OK')
@@ -0,0 +1,104 @@
+import tempfile
+import torch
+from tensorboardX import SummaryWriter
+from layers.target_prop_layer import TargetPropInputLayer, \
+    TargetPropLeakyReluLayer, TargetPropLinearOutputLayer
+from layers.original_TP_layer import OriginalTPInputLayer, \
+    OriginalTPLeakyReluLayer, OriginalTPLinearOutputLayer
+from networks.target_prop_network import TargetPropNetwork
+from utils.helper_classes import TestError, NetworkError
+
+torch.manual_seed(47)
+writer = SummaryWriter(log_dir=tempfile.mkdtemp())
+learning_rate = 0.05
+
+
+def create_network(noise_batch_size=None, backward_iterations=1):
+    torch.manual_seed(11)
+    network = TargetPropNetwork(
+        [TargetPropInputLayer(layer_dim=5, out_dim=6, writer=writer,
+                              debug_mode=False),
+         TargetPropLeakyReluLayer(negative_slope=0.35, in_dim=5, layer_dim=6,
+                                  out_dim=4, writer=writer,
+                                  debug_mode=False),
+         TargetPropLinearOutputLayer(in_dim=6, layer_dim=4, step_size=0.01,
+                                     writer=writer, debug_mode=False)],
+        log=False, find_inverses=True, noise_batch_size=noise_batch_size,
+        backward_iterations=backward_iterations)
+    network.layers[1].weight_decay_backward = 0.1
+    return network
+
+
+batch = torch.randn(16, 5, 1)
+
+# the defaults reproduce the single gradient step on a noise batch of the
+# data batch size, as before noise_batch_size and backward_iterations
+network = create_network()
+network.propagate_forward(batch)
+layer, upper_layer = network.layers[1], network.layers[2]
+weights = layer.backward_weights.clone()
+torch.manual_seed(5)
+layer.update_backward_parameters(learning_rate, upper_layer)
+torch.manual_seed(5)
+noise_input = torch.randn(layer.forward_output.shape)
+h = layer.propagate_noise(noise_input, upper_layer)
+approx_error = torch.matmul(weights, h) + layer.backward_bias - noise_input
+gradient = torch.matmul(approx_error, torch.transpose(h, -1, -2))
+expected_weights = (1 - learning_rate*layer.weight_decay_backward) * \
+    weights - learning_rate*torch.mean(gradient, 0)
+if not torch.allclose(layer.backward_weights, expected_weights, rtol=1e-5,
+                      atol=1e-7):
+    raise TestError('The default backward update differs from the single '
+                    'gradient step')
+
+# K iterations on pre-drawn noise equal K single steps on its slices
+noise_batch_size, backward_iterations = 8, 4
+noise_input = torch.randn(backward_iterations*noise_batch_size, 6, 1)
+network = create_network(noise_batch_size, backward_iterations)
+network.layers[1].update_backward_parameters(learning_rate,
+                                             network.layers[2], noise_input)
+sequential_network = create_network(noise_batch_size, 1)
+for k in range(backward_iterations):
+    sequential_network.layers[1].update_backward_parameters(
+        learning_rate, sequential_network.layers[2],
+        noise_input[k*noise_batch_size:(k+1)*noise_batch_size])
+if not torch.allclose(network.layers[1].backward_weights,
+                      sequential_network.layers[1].backward_weights,
+                      rtol=1e-5, atol=1e-7):
+    raise TestError('{} backward iterations differ from {} sequential '
+                    'steps'.format(backward_iterations, backward_iterations))
+if not torch.equal(network.layers[1].backward_approx_error,
+                   sequential_network.layers[1].backward_approx_error):
+    raise TestError('Expecting the approximation error of the last step')
+
+try:
+    network.layers[1].update_backward_parameters(
+        learning_rate, network.layers[2], noise_input[:noise_batch_size])
+except ValueError:
+    pass
+else:
+    raise TestError('Expecting a ValueError for noise_input of a wrong size')
+
+# original TP trains the backward weights on the forward output, it refuses
+# the noise batching instead of ignoring it
+for noise_batch_size, backward_iterations in [(8, 1), (None, 4)]:
+    try:
+        TargetPropNetwork(
+            [OriginalTPInputLayer(layer_dim=5, out_dim=6, writer=writer,
+                                  debug_mode=False),
+             OriginalTPLeakyReluLayer(negative_slope=0.35, in_dim=5,
+                                      layer_dim=6, out_dim=4, writer=writer,
+                                      debug_mode=False),
+             OriginalTPLinearOutputLayer(in_dim=6, layer_dim=4,
+                                         step_size=0.01, writer=writer,
+                                         debug_mode=False)],
+            log=False, noise_batch_size=noise_batch_size,
+            backward_iterations=backward_iterations)
+    except NetworkError:
+        pass
+    else:
+        raise TestError('Expecting a NetworkError for original TP layers '
+                        'with noise_batch_size={} and backward_iterations='
+                        '{}'.format(noise_batch_size, backward_iterations))
+
+print('Backward iterations OK')
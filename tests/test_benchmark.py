@@ -0,0 +1,31 @@
+import torch
+from utils import benchmark
+from utils.helper_classes import TestError
+
+# The allocation counter should count the new tensors, but not the views
+# and in-place operations
+a = torch.randn(100, 10)
+
+
+def allocate():
+    b = a + 1
+    b.add_(1)
+    c = b.t()
+    d = torch.matmul(c, a)
+    return d
+
+
+allocations = benchmark.count_allocations(allocate)
+print(allocations)
+if not allocations['nb_allocations'] == 2:
+    raise TestError('Expecting 2 allocations, counted '
+                    '{}'.format(allocations['nb_allocations']))
+if not allocations['allocated_bytes'] == (100 * 10 + 10 * 10) * 4:
+    raise TestError('Expecting {} allocated bytes, counted {}'.format(
+        (100 * 10 + 10 * 10) * 4, allocations['allocated_bytes']))
+
+result = benchmark.benchmark_call(allocate, nb_repeats=5)
+if not result['nb_calls'] == 5 or result['latency_min'] <= 0.:
+    raise TestError('Expecting 5 timed calls with positive latencies, got '
+                    '{}'.format(result))
+print('Benchmark harness OK')
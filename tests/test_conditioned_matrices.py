@@ -0,0 +1,48 @@
+import torch
+import numpy as np
+import random
+import utils.helper_functions as hf
+from utils.helper_classes import TestError
+
+seed = 47
+torch.manual_seed(seed)
+torch.cuda.manual_seed(seed)
+np.random.seed(seed)
+random.seed(seed)
+
+# User variables
+rows = 6
+cols = 4
+batch_size = 50
+s_min = 0.5
+s_max = 2.
+tolerance = 1e-4
+
+# The generated matrices should have their singular values within the
+# prescribed bounds, with the extreme values attained
+matrices = hf.get_conditioned_random_matrix(rows, cols, s_min, s_max,
+                                            batch_size=batch_size)
+S = torch.linalg.svdvals(matrices)
+print('singular values in [{}, {}]'.format(float(torch.min(S)),
+                                           float(torch.max(S))))
+if not matrices.shape == (batch_size, rows, cols):
+    raise TestError('Expecting a batch of {}x{} matrices, got shape '
+                    '{}'.format(rows, cols, matrices.shape))
+if torch.max(torch.abs(S[:, 0] - s_max)) > tolerance or \
+        torch.max(torch.abs(S[:, -1] - s_min)) > tolerance:
+    raise TestError('Singular values of get_conditioned_random_matrix are '
+                    'not within the prescribed bounds')
+
+# A neighbourhood of a singular matrix should be projected on the
+# invertible matrices
+singular_matrix = torch.zeros(rows, rows)
+singular_matrix[0, 0] = 1.
+neighbour = hf.get_conditioned_neighbourhood_matrix(singular_matrix, 0.1,
+                                                    s_min)
+S_neighbour = torch.linalg.svdvals(neighbour)
+print('smallest singular value of the neighbour: {}'.format(
+    float(S_neighbour[-1])))
+if S_neighbour[-1] < s_min - tolerance:
+    raise TestError('get_conditioned_neighbourhood_matrix did not project '
+                    'on the feasible set')
+print('Conditioned matrices OK')
@@ -0,0 +1,94 @@
+import tempfile
+import torch
+from tensorboardX import SummaryWriter
+from layers.layer import InputLayer, LeakyReluLayer, LinearOutputLayer
+from networks.network import Network
+from utils.create_datasets import GenerateDatasetFromModel
+from utils.helper_classes import TestError
+
+writer = SummaryWriter(log_dir=tempfile.mkdtemp())
+torch.manual_seed(5)
+true_network = Network(
+    [InputLayer(layer_dim=5, writer=writer, debug_mode=False),
+     LeakyReluLayer(negative_slope=0.35, in_dim=5, layer_dim=7,
+                    writer=writer, debug_mode=False),
+     LinearOutputLayer(in_dim=7, layer_dim=3, loss_function='mse',
+                       writer=writer, debug_mode=False)],
+    log=False)
+nb_batches, batch_size = 12, 8
+
+
+def generate(chunk_size, seed=1):
+    torch.manual_seed(seed)
+    return GenerateDatasetFromModel(true_network, chunk_size).generate(
+        nb_batches, batch_size)
+
+
+def stream(chunk_size, seed=1):
+    torch.manual_seed(seed)
+    batches = list(GenerateDatasetFromModel(true_network, chunk_size).stream(
+        batch_size, nb_batches))
+    return torch.stack([input_batch for input_batch, _ in batches]), \
+        torch.stack([output_batch for _, output_batch in batches])
+
+
+# the chunked propagation gives the one-shot dataset
+input_dataset, output_dataset = generate(chunk_size=10000)
+if not output_dataset.shape == (nb_batches, batch_size, 3, 1):
+    raise TestError('Wrong shape of the output dataset: {}'.format(
+        tuple(output_dataset.shape)))
+for chunk_size in [1, 7, 8, 50]:
+    chunked_input_dataset, chunked_output_dataset = generate(chunk_size)
+    if not torch.equal(chunked_input_dataset, input_dataset):
+        raise TestError('The chunked generation draws other inputs')
+    if not torch.allclose(chunked_output_dataset, output_dataset, rtol=1e-5,
+                          atol=1e-5):
+        raise TestError('The chunked generation (chunk_size={}) differs from '
+                        'the one-shot generation'.format(chunk_size))
+
+# a stream within one chunk gives the batches of generate
+streamed_input_dataset, streamed_output_dataset = stream(chunk_size=10000)
+if not torch.equal(streamed_input_dataset, input_dataset) or \
+        not torch.equal(streamed_output_dataset, output_dataset):
+    raise TestError('The stream differs from the one-shot generation')
+
+# over several chunks, the stream is reproducible and its outputs are the
+# one-shot propagation of its inputs
+streamed_input_dataset, streamed_output_dataset = stream(chunk_size=20)
+repeated_input_dataset, repeated_output_dataset = stream(chunk_size=20)
+if not torch.equal(streamed_input_dataset, repeated_input_dataset) or \
+        not torch.equal(streamed_output_dataset, repeated_output_dataset):
+    raise TestError('The stream is not reproducible for a given seed')
+true_network.propagate_forward(streamed_input_dataset.reshape(-1, 5, 1))
+if not torch.allclose(streamed_output_dataset.reshape(-1, 3, 1),
+                      true_network.get_output(), rtol=1e-5, atol=1e-5):
+    raise TestError('The streamed outputs differ from the one-shot '
+                    'propagation of the streamed inputs')
+if len(list(GenerateDatasetFromModel(true_network, 20).stream(
+        batch_size, 5))) != 5:
+    raise TestError('Expecting 5 streamed batches')
+
+# the outputs keep the dtype of the inputs, also for a float64 network
+torch.set_default_dtype(torch.float64)
+try:
+    torch.manual_seed(5)
+    double_network = Network(
+        [InputLayer(layer_dim=5, writer=writer, debug_mode=False),
+         LeakyReluLayer(negative_slope=0.35, in_dim=5, layer_dim=7,
+                        writer=writer, debug_mode=False),
+         LinearOutputLayer(in_dim=7, layer_dim=3, loss_function='mse',
+                           writer=writer, debug_mode=False)],
+        log=False)
+    input_samples = torch.randn(20, 5, 1)
+finally:
+    torch.set_default_dtype(torch.float32)
+output_samples = GenerateDatasetFromModel(double_network, 7).propagate(
+    input_samples)
+double_network.propagate_forward(input_samples)
+if not output_samples.dtype == torch.float64 or \
+        not torch.allclose(output_samples, double_network.get_output(),
+                           rtol=1e-12, atol=1e-12):
+    raise TestError('Expecting the float64 outputs of the network, got {} '
+                    'outputs'.format(output_samples.dtype))
+
+print('Dataset generation OK')
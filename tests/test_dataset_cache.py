@@ -0,0 +1,102 @@
+import shutil
+import tempfile
+import numpy as np
+import torch
+from tensorboardX import SummaryWriter
+from layers.layer import InputLayer, LeakyReluLayer, LinearOutputLayer
+from networks.network import Network
+from utils.dataset_cache import DatasetCache
+from utils.helper_classes import TestError
+
+writer = SummaryWriter(log_dir=tempfile.mkdtemp())
+cache_dir = tempfile.mkdtemp()
+nb_batches, batch_size, testing_size = 6, 8, 20
+
+
+def create_true_network(hidden_dim=7):
+    torch.manual_seed(5)
+    return Network(
+        [InputLayer(layer_dim=5, writer=writer, debug_mode=False),
+         LeakyReluLayer(negative_slope=0.35, in_dim=5, layer_dim=hidden_dim,
+                        writer=writer, debug_mode=False),
+         LinearOutputLayer(in_dim=hidden_dim, layer_dim=3,
+                           loss_function='mse', writer=writer,
+                           debug_mode=False)],
+        log=False)
+
+
+def load_or_generate(cache, true_network, seed=1, nb_batches=nb_batches,
+                     batch_size=batch_size):
+    torch.manual_seed(seed)
+    result = cache.load_or_generate(true_network, nb_batches, batch_size,
+                                    testing_size)
+    return result, torch.get_rng_state()
+
+
+def get_key(cache, true_network, nb_batches=nb_batches,
+            batch_size=batch_size, testing_size=testing_size, seed=1):
+    torch.manual_seed(seed)
+    return cache.get_key(true_network, nb_batches, batch_size, testing_size)
+
+
+try:
+    cache = DatasetCache(cache_dir)
+    true_network = create_true_network()
+
+    # a miss generates the datasets, a hit loads the same arrays and puts
+    # the random number generator in the state after the generation
+    generated, rng_state_generated = load_or_generate(cache, true_network)
+    if cache.hit is not False:
+        raise TestError('Expecting a cache miss on an empty cache')
+    loaded, rng_state_loaded = load_or_generate(cache, true_network)
+    if cache.hit is not True:
+        raise TestError('Expecting a cache hit for the same arguments')
+    for name, generated_dataset, loaded_dataset in zip(
+            ['input', 'output', 'test input', 'test output'], generated[:4],
+            loaded[:4]):
+        if not torch.equal(generated_dataset, loaded_dataset):
+            raise TestError('The cached {} dataset differs from the '
+                            'generated one'.format(name))
+    for generated_lls, loaded_lls in zip(generated[4], loaded[4]):
+        if not np.array_equal(generated_lls, loaded_lls):
+            raise TestError('The cached least-squares baseline differs from '
+                            'the computed one')
+    if not torch.equal(rng_state_loaded, rng_state_generated):
+        raise TestError('The random number generator is not in the state '
+                        'after the generation after a cache hit')
+
+    # the key changes with the weights, the architecture, the sizes and the
+    # state of the random number generator
+    changed_network = create_true_network()
+    changed_network.layers[1].forward_weights[0, 0] += 1e-3
+    wider_network = create_true_network(hidden_dim=8)
+
+    key = get_key(cache, true_network)
+    if not get_key(cache, create_true_network()) == key:
+        raise TestError('The key changes for the same arguments')
+    for description, other_key in [
+            ('weights', get_key(cache, changed_network)),
+            ('layer size', get_key(cache, wider_network)),
+            ('number of batches', get_key(cache, true_network,
+                                          nb_batches=nb_batches + 1)),
+            ('batch size', get_key(cache, true_network,
+                                   batch_size=batch_size + 1)),
+            ('testing size', get_key(cache, true_network,
+                                     testing_size=testing_size + 1)),
+            ('random state', get_key(cache, true_network, seed=2))]:
+        if other_key == key:
+            raise TestError('The key does not change with the '
+                            '{}'.format(description))
+
+    # other sizes are a miss and do not return the cached datasets
+    (input_dataset, _, _, _, _), _ = load_or_generate(
+        cache, true_network, batch_size=batch_size + 1)
+    if cache.hit is not False:
+        raise TestError('Expecting a cache miss for another batch size')
+    if not input_dataset.shape[1] == batch_size + 1:
+        raise TestError('Wrong batch size of the generated dataset: '
+                        '{}'.format(input_dataset.shape[1]))
+finally:
+    shutil.rmtree(cache_dir)
+
+print('Dataset cache OK')
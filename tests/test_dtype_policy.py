@@ -0,0 +1,60 @@
+import tempfile
+import torch
+from tensorboardX import SummaryWriter
+from layers.target_prop_layer import TargetPropInputLayer, \
+    TargetPropLeakyReluLayer, TargetPropLinearOutputLayer
+from layers.invertible_layer import InvertibleInputLayer, \
+    InvertibleLeakyReluLayer, InvertibleLinearOutputLayer
+from networks.target_prop_network import TargetPropNetwork
+from networks.invertible_network import InvertibleNetwork
+from optimizers.optimizers import SGDbidirectional, SGDInvertible
+from utils.helper_classes import TestError
+
+torch.manual_seed(47)
+writer = SummaryWriter(log_dir=tempfile.mkdtemp())
+
+# one training step with logging (including the GN diagnostics that use the
+# total jacobian) under each dtype policy
+for policy, dtype in [('float64', torch.float64),
+                      ('bfloat16', torch.bfloat16)]:
+    network = TargetPropNetwork(
+        [TargetPropInputLayer(layer_dim=6, out_dim=6, writer=writer,
+                              debug_mode=False),
+         TargetPropLeakyReluLayer(negative_slope=0.35, in_dim=6, layer_dim=6,
+                                  out_dim=6, writer=writer, debug_mode=False),
+         TargetPropLinearOutputLayer(in_dim=6, layer_dim=6, step_size=0.01,
+                                     writer=writer, debug_mode=False)],
+        log=True)
+    network.set_dtype_policy(policy)
+    optimizer = SGDbidirectional(network=network, threshold=1e-7,
+                                 init_learning_rate=1e-4, tau=100,
+                                 final_learning_rate=1e-5,
+                                 init_learning_rate_backward=1e-4,
+                                 final_learning_rate_backward=1e-5)
+    optimizer.step(torch.randn(32, 6, 1), torch.randn(32, 6, 1))
+    if not network.compute_total_jacobian().dtype == dtype:
+        raise TestError('Expecting a {} total jacobian of the TP network for '
+                        'the {} policy'.format(dtype, policy))
+
+    network = InvertibleNetwork(
+        [InvertibleInputLayer(layer_dim=6, out_dim=6, writer=writer,
+                              debug_mode=False),
+         InvertibleLeakyReluLayer(negative_slope=0.35, in_dim=6, layer_dim=6,
+                                  out_dim=6, writer=writer, debug_mode=False),
+         InvertibleLinearOutputLayer(in_dim=6, layer_dim=6, step_size=0.01,
+                                     writer=writer, debug_mode=False)],
+        log=True)
+    network.set_dtype_policy(policy)
+    optimizer = SGDInvertible(network=network, threshold=1e-7,
+                              init_step_size=0.01, tau=100,
+                              final_step_size=0.001, learning_rate=0.01)
+    optimizer.step(torch.randn(1, 6, 1), torch.randn(1, 6, 1))
+    if not network.compute_total_jacobian().dtype == dtype:
+        raise TestError('Expecting a {} total jacobian of the invertible '
+                        'network for the {} policy'.format(dtype, policy))
+    for layer in network.layers[1:]:
+        if not layer.forward_weights.dtype == dtype:
+            raise TestError('Expecting {} forward weights for the {} '
+                            'policy'.format(dtype, policy))
+writer.close()
+print('Dtype policies OK')
@@ -0,0 +1,43 @@
+import torch
+import numpy as np
+import random
+from layers.target_prop_layer import TargetPropInputLayer, \
+    TargetPropLeakyReluLayer, TargetPropLinearOutputLayer
+from networks.target_prop_network import TargetPropNetwork
+from tensorboardX import SummaryWriter
+from utils.helper_classes import TestError
+
+seed = 47
+torch.manual_seed(seed)
+torch.cuda.manual_seed(seed)
+np.random.seed(seed)
+random.seed(seed)
+
+# User variables
+n = 5
+nb_samples = 20000
+
+writer = SummaryWriter()
+
+input_layer = TargetPropInputLayer(layer_dim=n, out_dim=n, writer=writer,
+                                   name='input_layer')
+hidden_layer = TargetPropLeakyReluLayer(negative_slope=0.35, in_dim=n,
+                                        layer_dim=n, out_dim=n, writer=writer,
+                                        name='hidden_layer')
+output_layer = TargetPropLinearOutputLayer(in_dim=n, layer_dim=n,
+                                           writer=writer, step_size=0.1,
+                                           name='output_layer')
+network = TargetPropNetwork([input_layer, hidden_layer, output_layer],
+                            find_inverses=True, log=False)
+
+# Without regularization, the closed-form fit should recover the exact
+# pseudo-inverses of the forward weights
+network.fit_inverses(nb_samples=nb_samples)
+inverse_errors = [input_layer.check_inverse(hidden_layer),
+                  hidden_layer.check_inverse(output_layer)]
+print('inverse errors: {}'.format(inverse_errors))
+
+if max(inverse_errors) < 1e-4:
+    print('Closed-form fit of the inverses OK')
+else:
+    raise(TestError('Closed-form fit of the inverses failed'))
@@ -0,0 +1,117 @@
+import os
+import tempfile
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+import torch
+from tensorboardX import SummaryWriter
+from layers.layer import InputLayer, LeakyReluLayer, SoftmaxOutputLayer
+from layers.invertible_layer import InvertibleInputLayer, \
+    InvertibleLeakyReluLayer, InvertibleCapsuleOutputLayer
+from networks.network import Network
+from networks.invertible_network import InvertibleNetwork
+import networks.frozen_network
+from networks.frozen_network import FrozenNetwork, QuantizedFrozenNetwork
+from utils import helper_functions as hf
+from utils.helper_classes import TestError
+
+torch.manual_seed(47)
+log_dir = tempfile.mkdtemp()
+writer = SummaryWriter(log_dir=log_dir)
+input_batch = torch.randn(64, 20, 1)
+
+network = Network([InputLayer(layer_dim=20, writer=writer, debug_mode=False),
+                   LeakyReluLayer(negative_slope=0.1, in_dim=20, layer_dim=30,
+                                  writer=writer, debug_mode=False),
+                   SoftmaxOutputLayer(in_dim=30, layer_dim=10,
+                                      loss_function='crossEntropy',
+                                      writer=writer, debug_mode=False)],
+                  log=False)
+frozen_network = network.freeze()
+output = network.predict(input_batch)
+if not torch.allclose(frozen_network.predict(input_batch), output,
+                      atol=1e-6):
+    raise TestError('The frozen network does not match Network.predict')
+
+# the frozen network keeps its own copy of the weights
+network.layers[1].set_forward_parameters(
+    torch.zeros_like(network.layers[1].forward_weights),
+    network.layers[1].forward_bias)
+if not torch.allclose(frozen_network.predict(input_batch), output,
+                      atol=1e-6):
+    raise TestError('The frozen network changed with the network')
+
+path = os.path.join(log_dir, 'frozen_network.npz')
+frozen_network.save(path)
+loaded_network = FrozenNetwork.load(path)
+if not torch.equal(loaded_network.predict(input_batch),
+                   frozen_network.predict(input_batch)):
+    raise TestError('The loaded frozen network differs from the saved one')
+
+# concurrent callers should get the same outputs as serial calls
+batches = [torch.randn(16, 20, 1) for i in range(8)]
+with ThreadPoolExecutor(max_workers=4) as executor:
+    outputs = list(executor.map(loaded_network.predict, batches))
+for batch, output in zip(batches, outputs):
+    if not torch.equal(output, loaded_network.predict(batch)):
+        raise TestError('Concurrent predictions differ from serial ones')
+
+# post-training quantization, calibrated on another batch
+calibration_batch = torch.randn(256, 20, 1)
+float16_network = loaded_network.quantize(calibration_batch, torch.float16)
+if not float16_network.predict(input_batch).dtype == torch.float16:
+    raise TestError('Expecting a float16 output of the float16 network')
+# building and loading int8 networks does not use deprecated torch APIs
+with warnings.catch_warnings():
+    warnings.simplefilter('error')
+    quantized_network = loaded_network.quantize(calibration_batch)
+classes = hf.prob2class(loaded_network.predict(input_batch))
+for network_copy in [float16_network, quantized_network]:
+    agreement = hf.accuracy(hf.prob2class(network_copy.predict(input_batch)),
+                            classes)
+    if agreement < 0.9:
+        raise TestError('The quantized network predicts other classes for '
+                        '{} of the samples'.format(float(1. - agreement)))
+# the calibrated quantization does not depend on the rest of the batch
+if not torch.equal(quantized_network.predict(input_batch[:1]),
+                   quantized_network.predict(input_batch)[:1]):
+    raise TestError('The quantized output depends on the batch')
+path = os.path.join(log_dir, 'quantized_network.npz')
+quantized_network.save(path)
+with warnings.catch_warnings():
+    warnings.simplefilter('error')
+    loaded_quantized_network = FrozenNetwork.load(path)
+if not torch.equal(loaded_quantized_network.predict(input_batch),
+                   quantized_network.predict(input_batch)):
+    raise TestError('The loaded quantized network differs from the saved '
+                    'one')
+# without oneDNN, the quantized layers are emulated with float32 matmuls
+get_int8_kernel = networks.frozen_network.get_int8_kernel
+networks.frozen_network.get_int8_kernel = lambda: 'emulated'
+emulated_network = QuantizedFrozenNetwork(quantized_network.layers,
+                                          in_dim=quantized_network.in_dim)
+networks.frozen_network.get_int8_kernel = get_int8_kernel
+if not torch.allclose(emulated_network.predict(input_batch),
+                      quantized_network.predict(input_batch), atol=1e-4):
+    raise TestError('The emulated int8 network differs from the int8 '
+                    'kernel')
+
+# capsule output layer: the output is capsule_squashed
+network = InvertibleNetwork(
+    [InvertibleInputLayer(layer_dim=20, out_dim=20, writer=writer,
+                          debug_mode=False),
+     InvertibleLeakyReluLayer(negative_slope=0.1, in_dim=20, layer_dim=20,
+                              out_dim=20, writer=writer, debug_mode=False),
+     InvertibleCapsuleOutputLayer(in_dim=20, layer_dim=20, nb_classes=10,
+                                  writer=writer, step_size=0.01,
+                                  debug_mode=False)], log=False)
+network.predict(input_batch)
+output = network.layers[-1].capsule_squashed
+if not torch.allclose(network.freeze().predict(input_batch), output,
+                      atol=1e-6):
+    raise TestError('The frozen capsule network does not match '
+                    'capsule_squashed')
+if not torch.equal(hf.prob2class(network.freeze().predict(input_batch)),
+                   network.layers[-1].predicted_classes):
+    raise TestError('The frozen capsule network predicts other classes')
+writer.close()
+print('Frozen network OK')
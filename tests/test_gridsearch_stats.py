@@ -0,0 +1,141 @@
+import contextlib
+import io
+import numpy as np
+import pandas as pd
+from utils import helper_functions as hf
+from utils.helper_classes import TestError
+
+
+# the nested-loop implementations of get_stats_gridsearch and
+# get_stats_gridsearch2 replaced by get_stats_gridsearch_nd, without printing
+def get_stats_gridsearch_loops(results, distances, learning_rates):
+    best_results = np.min(results, 2)
+    succesful_runs = best_results != 0
+    descending_runs = np.zeros(succesful_runs.shape,dtype=bool)
+    for i in range(len(distances)):
+        for j in range(len(learning_rates)):
+            if succesful_runs[i,j]:
+                if hf.is_descending_run(results[i,j,:]):
+                    descending_runs[i,j] = True
+    best_results_distance = np.zeros(len(distances))
+    best_learning_rates = np.zeros(len(distances))
+    success_counts = np.zeros(len(distances))
+    descending_counts = np.zeros(len(distances))
+    for i in range(len(distances)):
+        valid_run = False
+        best_results_distance[i] = float('inf')
+        success_counts[i] = np.sum(succesful_runs[i,:])
+        descending_counts[i] = np.sum(descending_runs[i,:])
+        for j, learning_rate in enumerate(learning_rates):
+            if descending_runs[i,j]:
+                valid_run = True
+                best_result = best_results[i,j]
+                if best_result < best_results_distance[i]:
+                    best_results_distance[i] = best_result
+                    best_learning_rates[i] = learning_rate
+        if not valid_run:
+            best_results_distance[i] = np.nan
+            best_learning_rates[i] = np.nan
+    result_array = np.empty((len(distances), 4))
+    result_array[:,0] = success_counts
+    result_array[:,1] = descending_counts
+    result_array[:,2] = best_results_distance
+    result_array[:,3] = best_learning_rates
+    columns = ['success_count', 'descending_count', 'best_result', 'best_learning_rate']
+    result_frame = pd.DataFrame(result_array,index=distances,columns=columns)
+    return result_frame
+
+
+def get_stats_gridsearch2_loops(results, distances, learning_rates,
+                                weight_decays):
+    best_results = np.min(results, 3)
+    succesful_runs = best_results != 0
+    descending_runs = np.zeros(succesful_runs.shape,dtype=bool)
+    for i in range(len(distances)):
+        for j in range(len(learning_rates)):
+            for k in range(len(weight_decays)):
+                if succesful_runs[i,j,k]:
+                    if hf.is_descending_run(results[i,j,k,:]):
+                        descending_runs[i,j,k] = True
+    best_results_distance = np.zeros(len(distances))
+    best_learning_rates = np.zeros(len(distances))
+    best_weight_decays = np.zeros(len(distances))
+    success_counts = np.zeros(len(distances))
+    descending_counts = np.zeros(len(distances))
+    for i in range(len(distances)):
+        valid_run = False
+        best_results_distance[i] = float('inf')
+        success_counts[i] = np.sum(succesful_runs[i,:,:])
+        descending_counts[i] = np.sum(descending_runs[i,:,:])
+        for j, learning_rate in enumerate(learning_rates):
+            for k, weight_decay in enumerate(weight_decays):
+                if descending_runs[i,j,k]:
+                    valid_run = True
+                    best_result = best_results[i,j,k]
+                    if best_result < best_results_distance[i]:
+                        best_results_distance[i] = best_result
+                        best_learning_rates[i] = learning_rate
+                        best_weight_decays[i] = weight_decay
+        if not valid_run:
+            best_results_distance[i] = np.nan
+            best_learning_rates[i] = np.nan
+            best_weight_decays[i] = np.nan
+    result_array = np.empty((len(distances), 5))
+    result_array[:,0] = success_counts
+    result_array[:,1] = descending_counts
+    result_array[:,2] = best_results_distance
+    result_array[:,3] = best_learning_rates
+    result_array[:,4] = best_weight_decays
+    columns = ['success_count', 'descending_count', 'best_result',
+               'best_learning_rate', 'best_weight_decay']
+    result_frame = pd.DataFrame(result_array, index=distances, columns=columns)
+    return result_frame
+
+
+def random_results(shape, nb_epochs=6):
+    """ Random loss curves, with failed runs (0) and diverged runs (NaN)."""
+    results = rng.uniform(0.1, 2., size=shape + (nb_epochs,))
+    cells = rng.uniform(size=shape)
+    results[cells < 0.2] = 0.
+    results[(cells >= 0.2) & (cells < 0.3)] = np.nan
+    # some curves only have a NaN at the end
+    results[(cells >= 0.3) & (cells < 0.35), -1] = np.nan
+    return results
+
+
+rng = np.random.RandomState(17)
+distances = [0.1, 0.5, 1., 2., 5.]
+learning_rates = [0.001, 0.01, 0.1, 1.]
+weight_decays = [0., 1e-4, 1e-2]
+for trial in range(20):
+    results = random_results((len(distances), len(learning_rates)))
+    # a distance without successful runs
+    results[trial % len(distances)] = 0.
+    with contextlib.redirect_stdout(io.StringIO()):
+        frame = hf.get_stats_gridsearch(results, distances, learning_rates)
+    expected_frame = get_stats_gridsearch_loops(results, distances,
+                                                learning_rates)
+    results2 = random_results((len(distances), len(learning_rates),
+                               len(weight_decays)))
+    with contextlib.redirect_stdout(io.StringIO()):
+        frame2 = hf.get_stats_gridsearch2(results2, distances,
+                                          learning_rates, weight_decays)
+    expected_frame2 = get_stats_gridsearch2_loops(
+        results2, distances, learning_rates, weight_decays)
+    for frame, expected_frame in [(frame, expected_frame),
+                                  (frame2, expected_frame2)]:
+        if not list(frame.columns) == list(expected_frame.columns) or \
+                not list(frame.index) == distances or \
+                not np.array_equal(frame.values, expected_frame.values,
+                                   equal_nan=True):
+            raise TestError('get_stats_gridsearch_nd differs from the loops '
+                            'on\n{}\n{}'.format(frame, expected_frame))
+
+try:
+    hf.get_stats_gridsearch_nd(results, [('distance', distances)])
+except ValueError:
+    pass
+else:
+    raise TestError('Expecting a ValueError for a missing axis')
+
+print('Grid search statistics OK')
@@ -0,0 +1,72 @@
+import torch
+from utils import helper_functions as hf
+from utils.helper_classes import TestError
+
+torch.manual_seed(13)
+batch_size, in_dim, out_dim = 32, 7, 5
+
+# batch_matmul equals the batched matrix-vector product with torch.bmm
+weights = torch.randn(out_dim, in_dim)
+input = torch.randn(batch_size, in_dim, 1)
+reference = torch.bmm(weights.expand(batch_size, out_dim, in_dim), input)
+output = hf.batch_matmul(weights, input)
+if not output.shape == (batch_size, out_dim, 1) or \
+        not torch.allclose(output, reference, rtol=1e-5, atol=1e-6):
+    raise TestError('batch_matmul differs from torch.bmm')
+# other shapes fall back to torch.matmul
+matrices = torch.randn(batch_size, in_dim, 3)
+if not torch.equal(hf.batch_matmul(weights, matrices),
+                   torch.matmul(weights, matrices)):
+    raise TestError('batch_matmul differs from torch.matmul for a batch of '
+                    'matrices')
+
+# batch_outer_product_mean equals the mean of the bmm outer products
+u = torch.randn(batch_size, out_dim, 1)
+v = torch.randn(batch_size, in_dim, 1)
+outer_products = torch.bmm(u, torch.transpose(v, 1, 2))
+for reference in [torch.mean(outer_products, 0),
+                  torch.sum(outer_products, 0) / batch_size]:
+    if not torch.allclose(hf.batch_outer_product_mean(u, v), reference,
+                          rtol=1e-5, atol=1e-6):
+        raise TestError('batch_outer_product_mean differs from the mean of '
+                        'the outer products')
+u_matrices = torch.randn(batch_size, out_dim, 2)
+v_matrices = torch.randn(batch_size, in_dim, 2)
+if not torch.allclose(hf.batch_outer_product_mean(u_matrices, v_matrices),
+                      torch.mean(torch.bmm(u_matrices, torch.transpose(
+                          v_matrices, 1, 2)), 0)):
+    raise TestError('batch_outer_product_mean differs for batches of '
+                    'matrices')
+
+# solve_normal_equations equals the pseudo-inverse solution
+x = torch.randn(100, in_dim, dtype=torch.float64)
+y = torch.randn(100, out_dim, dtype=torch.float64)
+gram = torch.matmul(x.t(), x)
+cross = torch.matmul(y.t(), x)
+for regularization in [0., 0.5]:
+    A = gram + regularization * torch.eye(in_dim, dtype=torch.float64)
+    if not torch.allclose(hf.solve_normal_equations(gram, cross,
+                                                    regularization),
+                          torch.matmul(cross, torch.pinverse(A)),
+                          rtol=1e-10, atol=1e-12):
+        raise TestError('solve_normal_equations differs from the '
+                        'pseudo-inverse solution (regularization={})'.format(
+                            regularization))
+
+# if the Cholesky factorization fails (a feature that is always 0, or an
+# indefinite matrix), the pseudo-inverse solution is returned
+x[:, 2] = 0.
+singular_gram = torch.matmul(x.t(), x)
+indefinite_gram = gram - 2. * torch.diag(torch.diag(gram))
+for A in [singular_gram, indefinite_gram]:
+    if torch.linalg.cholesky_ex(A)[1] == 0:
+        raise TestError('Expecting a failing Cholesky factorization')
+    cross = torch.matmul(y.t(), x)
+    if not torch.allclose(hf.solve_normal_equations(A, cross),
+                          torch.matmul(cross, torch.pinverse(A)),
+                          rtol=1e-10, atol=1e-12):
+        raise TestError('solve_normal_equations differs from the '
+                        'pseudo-inverse solution after a failing Cholesky '
+                        'factorization')
+
+print('Helper functions OK')
@@ -0,0 +1,56 @@
+import numpy as np
+from utils.history import History
+from utils.helper_classes import TestError
+
+# the value of each step is the step itself, such that the kept values can
+# be checked with the kept steps
+nb_steps = 1000
+capacity = 16
+
+history = History()
+for step in range(nb_steps):
+    history.append(float(step))
+if not np.array_equal(history.numpy(), np.arange(nb_steps)):
+    raise TestError("Expecting all values for the policy 'all'")
+
+history = History('decimate', capacity)
+for step in range(nb_steps):
+    history.append(float(step))
+steps = history.get_steps()
+if not len(history) <= capacity or not len(history) > capacity // 2:
+    raise TestError('Expecting between {} and {} values, got {}'.format(
+        capacity // 2, capacity, len(history)))
+if not np.array_equal(steps, history.stride * np.arange(len(history))):
+    raise TestError('Expecting every {}-th step, got {}'.format(
+        history.stride, steps))
+if not np.array_equal(history.numpy(), steps):
+    raise TestError('The decimated values do not match their steps')
+
+history = History('reservoir', capacity)
+for step in range(nb_steps):
+    history.append(float(step))
+steps = history.get_steps()
+if not len(np.unique(steps)) == capacity or \
+        not np.array_equal(history.numpy(), steps) or \
+        not np.all(np.diff(steps) > 0):
+    raise TestError('Expecting {} distinct values ordered by step, got '
+                    '{}'.format(capacity, steps))
+# a uniform sample of 0..999 should not be concentrated at the start
+if not steps.max() > nb_steps // 2:
+    raise TestError('The reservoir does not contain late values: '
+                    '{}'.format(steps))
+
+history = History('buckets', capacity)
+for step in range(nb_steps):
+    history.append(float(step))
+steps = history.get_steps()
+ends = np.append(steps[1:], nb_steps)
+if not np.array_equal(history.get_minima(), steps) or \
+        not np.array_equal(history.get_maxima(), ends - 1):
+    raise TestError('Wrong bucket minima or maxima')
+if not np.allclose(history.numpy(), (steps + ends - 1) / 2.):
+    raise TestError('Wrong bucket means: {}'.format(history.numpy()))
+if not history.counts[:len(history)].sum() == nb_steps:
+    raise TestError('Expecting the buckets to count all {} '
+                    'steps'.format(nb_steps))
+print('History OK')
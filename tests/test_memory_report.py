@@ -0,0 +1,71 @@
+import tempfile
+import warnings
+import torch
+from tensorboardX import SummaryWriter
+from layers.target_prop_layer import TargetPropInputLayer, \
+    TargetPropLeakyReluLayer, TargetPropLinearOutputLayer
+from networks.target_prop_network import TargetPropNetwork
+from optimizers.optimizers import SGDbidirectional
+from utils.memory import MemoryMonitor
+from utils.helper_classes import TestError
+
+torch.manual_seed(47)
+writer = SummaryWriter(log_dir=tempfile.mkdtemp())
+layers = [TargetPropInputLayer(layer_dim=6, out_dim=6, writer=writer,
+                               debug_mode=False),
+          TargetPropLeakyReluLayer(negative_slope=0.35, in_dim=6, layer_dim=6,
+                                   out_dim=6, writer=writer,
+                                   debug_mode=False, name='hidden_layer'),
+          TargetPropLinearOutputLayer(in_dim=6, layer_dim=6, step_size=0.01,
+                                      writer=writer, debug_mode=False)]
+network = TargetPropNetwork(layers, log=True)
+optimizer = SGDbidirectional(network=network, threshold=1e-7,
+                             init_learning_rate=1e-4, tau=100,
+                             final_learning_rate=1e-5,
+                             init_learning_rate_backward=1e-4,
+                             final_learning_rate_backward=1e-5)
+
+report = network.memory_report([optimizer])
+if not report.loc[('1:hidden_layer', 'forward_weights'), 'nbytes'] == \
+        6 * 6 * 4:
+    raise TestError('Expecting 144 bytes for the forward weights, got '
+                    '{}'.format(report.loc[('1:hidden_layer',
+                                            'forward_weights'), 'nbytes']))
+if not report.loc[('1:hidden_layer', 'GN_angles'), 'history']:
+    raise TestError('Expecting GN_angles to be marked as a history')
+
+# the histories grow with the training steps, so a small budget should
+# give a warning for each of them
+monitor = MemoryMonitor(network, [optimizer], interval=5, history_budget=40)
+optimizer.set_memory_monitor(monitor)
+with warnings.catch_warnings(record=True) as caught:
+    warnings.simplefilter('always')
+    for i in range(20):
+        optimizer.step(torch.randn(32, 6, 1), torch.randn(32, 6, 1))
+samples = monitor.get_samples()
+print(samples.to_string())
+if not list(samples.index) == [0, 5, 10, 15]:
+    raise TestError('Expecting samples at steps 0, 5, 10 and 15, got '
+                    '{}'.format(list(samples.index)))
+if not samples['1:hidden_layer/approx_errors'].is_monotonic_increasing:
+    raise TestError('Expecting a growing approx_errors history')
+warned = [str(warning.message) for warning in caught]
+if not any('approx_errors of 1:hidden_layer' in message
+           for message in warned):
+    raise TestError('Expecting a warning for the approx_errors history, '
+                    'got {}'.format(warned))
+if not len(warned) == len(monitor.warned):
+    raise TestError('Expecting one warning per history')
+
+# with a capacity, the histories should not grow anymore
+network.set_history_policy('decimate', 8)
+monitor = MemoryMonitor(network, [optimizer], interval=5, history_budget=2**20)
+optimizer.set_memory_monitor(monitor)
+for i in range(40):
+    optimizer.step(torch.randn(32, 6, 1), torch.randn(32, 6, 1))
+samples = monitor.get_samples()
+if not samples['1:hidden_layer/approx_errors'].nunique() == 1:
+    raise TestError('Expecting a constant size of the bounded history, got '
+                    '{}'.format(samples['1:hidden_layer/approx_errors']))
+writer.close()
+print('Memory report OK')
@@ -0,0 +1,67 @@
+import tempfile
+import numpy as np
+import torch
+from utils.mnist_store import save_mnist_arrays, MNISTStore, MNIST_MEAN, \
+    MNIST_STD
+from utils.helper_classes import TestError
+
+# small synthetic split, with the label of each image in its first pixel
+rng = np.random.RandomState(3)
+nb_images = 50
+labels = rng.randint(0, 10, size=nb_images)
+images = rng.randint(0, 256, size=(nb_images, 28, 28)).astype(np.uint8)
+images[:, 0, 0] = labels
+store_dir = tempfile.mkdtemp()
+save_mnist_arrays(images, labels, store_dir, 'train')
+save_mnist_arrays(images[:20], labels[:20], store_dir, 'test')
+
+store = MNISTStore(store_dir, train=True, batch_size=16, dtype=torch.uint8)
+if not isinstance(store.images, np.memmap):
+    raise TestError('Expecting memory-mapped images')
+if not len(store) == 4:
+    raise TestError('Expecting 4 batches, got {}'.format(len(store)))
+
+# the test split is not shuffled and round-trips the arrays
+test_store = MNISTStore(store_dir, train=False, batch_size=16)
+batches = list(test_store)
+if not [batch[0].shape for batch in batches] == \
+        [(16, 784, 1), (4, 784, 1)]:
+    raise TestError('Wrong batch shapes of the test split')
+test_images = torch.cat([batch[0] for batch in batches])
+test_targets = torch.cat([batch[1] for batch in batches])
+expected_images = (images[:20].reshape(20, 784, 1) / 255. - MNIST_MEAN) / \
+    MNIST_STD
+if not test_images.dtype == torch.float32 or \
+        not np.allclose(test_images.numpy(), expected_images, atol=1e-6):
+    raise TestError('The normalized images do not round-trip')
+if not test_targets.shape == (20, 10, 1) or \
+        not np.array_equal(test_targets[:, :, 0].argmax(1).numpy(),
+                           labels[:20]) or \
+        not np.array_equal(test_targets.sum(1).numpy(), np.ones((20, 1))):
+    raise TestError('The one-hot targets do not round-trip')
+
+# the shuffled training batches are a permutation of the samples, with
+# matching images and targets, reproducible for a given seed
+epochs = []
+for seed in [7, 7, 8]:
+    np.random.seed(seed)
+    epochs.append(list(store))
+for image_batch, target_batch in epochs[0]:
+    if not torch.equal(image_batch[:, 0, 0].long(),
+                       target_batch[:, :, 0].argmax(1)):
+        raise TestError('The shuffled images and targets do not match')
+raw_images = torch.cat([batch[0] for batch in epochs[0]])
+if not raw_images.dtype == torch.uint8 or not sorted(
+        map(tuple, raw_images.reshape(nb_images, -1).tolist())) == sorted(
+        map(tuple, images.reshape(nb_images, -1).tolist())):
+    raise TestError('The shuffled epoch is not a permutation of the images')
+for (images_a, targets_a), (images_b, targets_b) in zip(epochs[0],
+                                                        epochs[1]):
+    if not torch.equal(images_a, images_b) or \
+            not torch.equal(targets_a, targets_b):
+        raise TestError('The shuffling is not reproducible for a seed')
+if all(torch.equal(batch_a[0], batch_b[0])
+       for batch_a, batch_b in zip(epochs[0], epochs[2])):
+    raise TestError('Expecting another order for another seed')
+
+print('MNIST store OK')
@@ -0,0 +1,84 @@
+import tempfile
+import torch
+from tensorboardX import SummaryWriter
+from layers.layer import InputLayer, LeakyReluLayer, LinearOutputLayer
+from layers.DTP_layer import DTPInputLayer, DTPLeakyReluLayer, \
+    DTPLinearOutputLayer
+from networks.network import Network
+from networks.target_prop_network import TargetPropNetwork
+from utils.helper_classes import TestError
+
+writer = SummaryWriter(log_dir=tempfile.mkdtemp())
+
+
+def create_network(network_type):
+    torch.manual_seed(7)
+    if network_type == 'BP':
+        return Network(
+            [InputLayer(layer_dim=6, writer=writer, debug_mode=False),
+             LeakyReluLayer(negative_slope=0.35, in_dim=6, layer_dim=8,
+                            writer=writer, debug_mode=False),
+             LeakyReluLayer(negative_slope=0.35, in_dim=8, layer_dim=8,
+                            writer=writer, debug_mode=False),
+             LinearOutputLayer(in_dim=8, layer_dim=4, loss_function='mse',
+                               writer=writer, debug_mode=False)],
+            log=False)
+    return TargetPropNetwork(
+        [DTPInputLayer(layer_dim=6, out_dim=8, writer=writer,
+                       debug_mode=False),
+         DTPLeakyReluLayer(negative_slope=0.35, in_dim=6, layer_dim=8,
+                           out_dim=8, writer=writer, debug_mode=False),
+         DTPLeakyReluLayer(negative_slope=0.35, in_dim=8, layer_dim=8,
+                           out_dim=4, writer=writer, debug_mode=False),
+         DTPLinearOutputLayer(in_dim=8, layer_dim=4, step_size=0.01,
+                              writer=writer, debug_mode=False)],
+        log=False, noise_batch_size=16, backward_iterations=2)
+
+
+def train(network, nb_threads):
+    network.set_nb_threads(nb_threads,
+                           intra_op_threads=torch.get_num_threads())
+    torch.manual_seed(3)
+    for step in range(5):
+        input_batch = torch.randn(32, 6, 1)
+        network.propagate_forward(input_batch)
+        network.propagate_backward(torch.randn(32, 4, 1))
+        network.compute_gradients()
+        network.update_parameters(0.01)
+    network.set_nb_threads(None)
+    return [tensor for layer in network.layers[1:]
+            for tensor in (layer.forward_weights, layer.forward_bias) +
+            ((layer.backward_weights,) if hasattr(layer, 'backward_weights')
+             else ())]
+
+
+# the layer updates give the same parameters serially and in threads
+for network_type in ['BP', 'TP']:
+    serial_parameters = train(create_network(network_type), None)
+    threaded_parameters = train(create_network(network_type), 3)
+    for serial, threaded in zip(serial_parameters, threaded_parameters):
+        if not torch.equal(serial, threaded):
+            raise TestError('The threaded {} updates differ from the serial '
+                            'ones'.format(network_type))
+
+# set_nb_threads(None) restores the number of intra-op threads of torch
+nb_intra_op_threads = torch.get_num_threads()
+network = create_network('TP')
+network.set_nb_threads(2, intra_op_threads=nb_intra_op_threads + 2)
+network.set_nb_threads(4, intra_op_threads=nb_intra_op_threads + 1)
+if not torch.get_num_threads() == nb_intra_op_threads + 1:
+    raise TestError('Expecting {} intra-op threads, got {}'.format(
+        nb_intra_op_threads + 1, torch.get_num_threads()))
+network.set_nb_threads(None)
+if not torch.get_num_threads() == nb_intra_op_threads:
+    raise TestError('The intra-op threads were not restored: expecting {}, '
+                    'got {}'.format(nb_intra_op_threads,
+                                    torch.get_num_threads()))
+try:
+    network.set_nb_threads(0)
+except ValueError:
+    pass
+else:
+    raise TestError('Expecting a ValueError for nb_threads=0')
+
+print('Layer threads OK')
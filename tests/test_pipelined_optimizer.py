@@ -0,0 +1,109 @@
+import os
+import signal
+import torch
+import numpy as np
+import random
+from layers.target_prop_layer import TargetPropInputLayer, \
+    TargetPropLeakyReluLayer, TargetPropLinearOutputLayer
+from networks.target_prop_network import TargetPropNetwork
+from optimizers.pipelined_optimizer import SGDPipelined
+from tensorboardX import SummaryWriter
+from utils.helper_classes import TestError, NetworkError
+
+seed = 47
+torch.manual_seed(seed)
+torch.cuda.manual_seed(seed)
+np.random.seed(seed)
+random.seed(seed)
+
+# User variables
+n = 5
+nb_batches = 10
+batch_size = 8
+learning_rate = 0.01
+learning_rate_backward = 0.01
+
+writer = SummaryWriter()
+
+
+def create_network():
+    torch.manual_seed(seed)
+    layers = [TargetPropInputLayer(layer_dim=n, out_dim=n, writer=writer,
+                                   name='input_layer')]
+    for i in range(2):
+        layers.append(TargetPropLeakyReluLayer(negative_slope=0.35, in_dim=n,
+                                               layer_dim=n, out_dim=n,
+                                               writer=writer,
+                                               name='hidden_layer{}'.format(i)))
+    layers.append(TargetPropLinearOutputLayer(in_dim=n, layer_dim=n,
+                                              writer=writer, step_size=0.1,
+                                              name='output_layer'))
+    for layer in layers[1:]:
+        Q, R = torch.linalg.qr(layer.forward_weights)
+        layer.set_forward_parameters(Q, layer.forward_bias)
+    return TargetPropNetwork(layers, log=False)
+
+
+input_dataset = torch.randn(nb_batches, batch_size, n, 1)
+output_dataset = torch.randn(nb_batches, batch_size, n, 1)
+
+# Synchronous reference
+network = create_network()
+torch.manual_seed(seed + 1)
+for i in range(nb_batches):
+    network.propagate_forward(input_dataset[i])
+    network.propagate_backward(output_dataset[i])
+    network.compute_gradients()
+    network.update_parameters(learning_rate, learning_rate_backward)
+
+# With one batch in flight, the pipeline should do the same updates
+network_pipelined = create_network()
+optimizer = SGDPipelined(network_pipelined, learning_rate,
+                         learning_rate_backward, max_staleness=1)
+# the noise of the backward updates is drawn in the main process, in the
+# same order as in the synchronous updates
+torch.manual_seed(seed + 1)
+loss = optimizer.run_dataset(input_dataset, output_dataset)
+
+forward_error = max(
+    float(torch.max(torch.abs(layer.forward_weights -
+                              layer_pipelined.forward_weights)))
+    for layer, layer_pipelined in zip(network.layers[1:],
+                                      network_pipelined.layers[1:]))
+backward_error = max(
+    float(torch.max(torch.abs(layer.backward_weights -
+                              layer_pipelined.backward_weights)))
+    for layer, layer_pipelined in zip(network.layers[:-1],
+                                      network_pipelined.layers[:-1]))
+backward_change = max(
+    float(torch.max(torch.abs(layer.backward_weights -
+                              layer_initial.backward_weights)))
+    for layer, layer_initial in zip(network.layers[:-1],
+                                    create_network().layers[:-1]))
+print('max forward weight difference: {}'.format(forward_error))
+print('max backward weight difference: {} (change in training: {})'.format(
+    backward_error, backward_change))
+
+if not (forward_error < 1e-5 and backward_error < 1e-5 and
+        backward_change > 1e-4 and len(optimizer.batch_losses) == nb_batches):
+    raise(TestError('Pipelined optimizer does not match the synchronous '
+                    'updates'))
+
+# a worker that dies without reporting an error does not hang the pipeline
+optimizer = SGDPipelined(create_network(), learning_rate,
+                         learning_rate_backward, max_staleness=1)
+optimizer.poll_interval = 0.1
+optimizer.start()
+os.kill(optimizer.workers[1].pid, signal.SIGKILL)
+try:
+    for i in range(nb_batches):
+        optimizer.step(input_dataset[i], output_dataset[i])
+    optimizer.synchronize()
+except NetworkError:
+    pass
+else:
+    raise TestError('Expecting a NetworkError for a killed worker')
+if optimizer.workers:
+    raise TestError('Expecting the pipeline to be stopped')
+
+print('Pipelined optimizer OK')
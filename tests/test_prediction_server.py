@@ -0,0 +1,100 @@
+import tempfile
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor
+import torch
+from tensorboardX import SummaryWriter
+from layers.layer import InputLayer, LeakyReluLayer, SoftmaxOutputLayer
+from networks.network import Network
+from utils.prediction_server import MicroBatcher, PredictionServer, \
+    generate_load, get_server_statistics, request_prediction
+from utils.helper_classes import TestError
+
+torch.manual_seed(47)
+writer = SummaryWriter(log_dir=tempfile.mkdtemp())
+network = Network([InputLayer(layer_dim=20, writer=writer, debug_mode=False),
+                   LeakyReluLayer(negative_slope=0.1, in_dim=20, layer_dim=30,
+                                  writer=writer, debug_mode=False),
+                   SoftmaxOutputLayer(in_dim=30, layer_dim=10,
+                                      loss_function='crossEntropy',
+                                      writer=writer, debug_mode=False)],
+                  log=False)
+frozen_network = network.freeze()
+samples = torch.randn(64, 20)
+outputs = frozen_network.predict(samples)
+
+# requests submitted within max_latency should be predicted in few batches
+batcher = MicroBatcher(frozen_network.predict, 20, max_batch_size=8,
+                       max_latency=0.05)
+futures = [batcher.submit(sample) for sample in samples[:16]]
+for future, output in zip(futures, outputs):
+    if not torch.allclose(future.result(), output, atol=1e-6):
+        raise TestError('The micro-batched output differs from the batch '
+                        'output')
+statistics = batcher.get_statistics()
+try:
+    batcher.submit(torch.randn(3))
+    raise TestError('Expecting a ValueError for a sample of the wrong size')
+except ValueError:
+    pass
+batcher.close()
+try:
+    batcher.submit(samples[0])
+    raise TestError('Expecting a RuntimeError when submitting to a closed '
+                    'MicroBatcher')
+except RuntimeError:
+    pass
+if not statistics['nb_requests'] == 16:
+    raise TestError('Expecting 16 requests, got '
+                    '{}'.format(statistics['nb_requests']))
+if not statistics['nb_batches'] < 16:
+    raise TestError('Expecting the requests to be batched, got {} '
+                    'batches'.format(statistics['nb_batches']))
+
+
+def request_status(url, sample):
+    try:
+        request_prediction(url, sample)
+        return 200
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+# a malformed request must not fail the valid requests it would be batched
+# with
+server = PredictionServer(frozen_network.predict, 20, max_batch_size=16,
+                          max_latency=0.2).start()
+try:
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        statuses = list(executor.map(
+            lambda sample: request_status(server.url, sample),
+            [torch.randn(3).numpy(), samples[0].numpy()]))
+finally:
+    server.stop()
+if not statuses == [400, 200]:
+    raise TestError('Expecting status 400 for the malformed request and '
+                    '200 for the valid one, got {}'.format(statuses))
+
+server = PredictionServer(frozen_network.predict, 20, max_batch_size=16,
+                          max_latency=0.005).start()
+try:
+    responses, client_statistics = generate_load(server.url, samples.numpy(),
+                                                 nb_clients=8)
+    server_statistics = get_server_statistics(server.url)
+finally:
+    server.stop()
+for response, output in zip(responses, outputs):
+    if not torch.allclose(torch.tensor(response['output']), output,
+                          atol=1e-6):
+        raise TestError('The served output differs from the batch output')
+    if not response['class'] == int(torch.argmax(output)):
+        raise TestError('The served class differs from the batch class')
+for statistics in [client_statistics, server_statistics]:
+    for key in ['requests_per_sec', 'latency_p50_ms', 'latency_p99_ms']:
+        if key not in statistics:
+            raise TestError('Expecting {} in the statistics, got '
+                            '{}'.format(key, statistics))
+if not server_statistics['nb_requests'] == len(samples):
+    raise TestError('Expecting {} requests on the server, got {}'.format(
+        len(samples), server_statistics['nb_requests']))
+writer.close()
+print('Prediction server OK')
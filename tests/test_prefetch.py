@@ -0,0 +1,117 @@
+import threading
+import time
+import torch
+from utils.prefetch import BatchPrefetcher
+from utils.helper_classes import TestError
+
+torch.manual_seed(13)
+batches = [(torch.randn(4, 3, 1), torch.randint(10, (4,))) for i in range(7)]
+
+
+def scale(inputs, targets):
+    return 2. * inputs, targets
+
+
+# the prefetched batches come in the order of the iterable, transformed
+for nb_prefetch in [0, 1, 2, 5]:
+    prefetcher = BatchPrefetcher(batches, scale, nb_prefetch=nb_prefetch)
+    prefetched = list(prefetcher)
+    if not len(prefetched) == len(prefetcher) == len(batches):
+        raise TestError('Expecting {} batches with nb_prefetch={}, got '
+                        '{}'.format(len(batches), nb_prefetch,
+                                    len(prefetched)))
+    for (inputs, targets), (prefetched_inputs, prefetched_targets) in \
+            zip(batches, prefetched):
+        if not torch.equal(prefetched_inputs, 2. * inputs) or \
+                not torch.equal(prefetched_targets, targets):
+            raise TestError('The batches are not in order with '
+                            'nb_prefetch={}'.format(nb_prefetch))
+
+# with nb_prefetch=0, a batch is prepared in the main thread only when the
+# consumer asks for it
+prepared = []
+
+
+def record(inputs, targets):
+    prepared.append(threading.current_thread())
+    return inputs, targets
+
+
+iterator = iter(BatchPrefetcher(batches, record, nb_prefetch=0))
+time.sleep(0.05)
+if prepared:
+    raise TestError('A batch was prepared before it was requested')
+for step in range(3):
+    next(iterator)
+    time.sleep(0.05)
+    if not len(prepared) == step + 1:
+        raise TestError('Expecting {} prepared batches, got {}'.format(
+            step + 1, len(prepared)))
+if not all(thread is threading.main_thread() for thread in prepared):
+    raise TestError('Expecting the batches to be prepared in the main thread')
+
+
+# an exception of the loader thread is raised in the consumer, after the
+# batches that were prepared before it
+def failing_batches():
+    for batch in batches[:3]:
+        yield batch
+    raise RuntimeError('loader failure')
+
+
+def failing_transform(inputs, targets):
+    if torch.equal(inputs, batches[3][0]):
+        raise KeyError('transform failure')
+    return inputs, targets
+
+
+for nb_prefetch in [0, 2]:
+    for iterable, transform, error_type in [
+            (failing_batches(), None, RuntimeError),
+            (batches, failing_transform, KeyError)]:
+        received = []
+        try:
+            for batch in BatchPrefetcher(iterable, transform,
+                                         nb_prefetch=nb_prefetch):
+                received.append(batch)
+        except error_type:
+            pass
+        else:
+            raise TestError('Expecting a {} from the loader with '
+                            'nb_prefetch={}'.format(error_type.__name__,
+                                                    nb_prefetch))
+        if not len(received) == 3:
+            raise TestError('Expecting the 3 batches before the failure, got '
+                            '{}'.format(len(received)))
+
+
+# wait_time accumulates the time spent waiting for data over the epochs
+def slow(inputs, targets):
+    time.sleep(0.02)
+    return inputs, targets
+
+
+for nb_prefetch in [0, 2]:
+    prefetcher = BatchPrefetcher(batches, slow, nb_prefetch=nb_prefetch)
+    for batch in prefetcher:
+        pass
+    first_epoch = prefetcher.wait_time
+    if first_epoch < 0.9 * 0.02 * len(batches):
+        raise TestError('Expecting a wait time of at least {}s with '
+                        'nb_prefetch={}, got {}s'.format(
+                            0.02 * len(batches), nb_prefetch, first_epoch))
+    for batch in prefetcher:
+        pass
+    if prefetcher.wait_time < first_epoch + 0.9 * 0.02 * len(batches):
+        raise TestError('The wait time did not accumulate over the epochs '
+                        'with nb_prefetch={}'.format(nb_prefetch))
+
+# a slow consumer does not wait for data that is prefetched meanwhile
+prefetcher = BatchPrefetcher(batches, slow, nb_prefetch=len(batches))
+for batch in prefetcher:
+    time.sleep(0.05)
+if not prefetcher.wait_time < 0.5 * 0.02 * len(batches):
+    raise TestError('Expecting the prefetching to hide the data preparation, '
+                    'waited {}s'.format(prefetcher.wait_time))
+
+print('Batch prefetching OK')
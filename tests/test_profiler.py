@@ -0,0 +1,107 @@
+import json
+import os
+import tempfile
+import numpy as np
+import torch
+from tensorboardX import SummaryWriter
+from layers.target_prop_layer import TargetPropInputLayer, \
+    TargetPropLeakyReluLayer, TargetPropLinearOutputLayer
+from networks.target_prop_network import TargetPropNetwork
+from utils.helper_classes import TestError
+from utils.profiler import CallStatistics
+
+torch.manual_seed(47)
+log_dir = tempfile.mkdtemp()
+writer = SummaryWriter(log_dir=log_dir)
+layers = [TargetPropInputLayer(layer_dim=6, out_dim=6, writer=writer,
+                               debug_mode=False),
+          TargetPropLeakyReluLayer(negative_slope=0.35, in_dim=6, layer_dim=6,
+                                   out_dim=6, writer=writer,
+                                   debug_mode=False, name='hidden_layer'),
+          TargetPropLinearOutputLayer(in_dim=6, layer_dim=6, step_size=0.01,
+                                      writer=writer, debug_mode=False)]
+network = TargetPropNetwork(layers, log=False)
+input_batch = torch.randn(32, 6, 1)
+target = torch.randn(32, 6, 1)
+
+
+def train_step():
+    network.propagate_forward(input_batch)
+    network.propagate_backward(target)
+    network.compute_gradients()
+    network.update_parameters(1e-4, 1e-4)
+
+
+profiler = network.enable_profiling(count_allocations=True)
+for i in range(3):
+    train_step()
+table = profiler.table()
+print(table.to_string())
+hidden_calls = table.xs('hidden_layer', level='layer')
+for phase, method in [('propagate_forward', 'propagate_forward'),
+                      ('propagate_backward', 'propagate_backward'),
+                      ('compute_forward_gradients',
+                       'compute_forward_gradients'),
+                      ('update_parameters', 'update_forward_parameters'),
+                      ('update_parameters', 'update_backward_parameters')]:
+    if not hidden_calls.loc[(phase, 1, method), 'nb_calls'] == 3:
+        raise TestError('Expecting 3 calls of {} in phase {}'.format(method,
+                                                                    phase))
+if not hidden_calls.loc[('propagate_forward', 1, 'propagate_forward'),
+                        'nb_allocations'] > 0:
+    raise TestError('Expecting the forward propagation to allocate tensors')
+counts, edges = profiler.histogram('propagate_forward', 'hidden_layer',
+                                   'propagate_forward', bins=5)
+if not counts.sum() == 3:
+    raise TestError('Expecting 3 calls in the histogram, got '
+                    '{}'.format(counts.sum()))
+
+path = os.path.join(log_dir, 'trace.json')
+profiler.save_chrome_trace(path)
+with open(path) as f:
+    events = json.load(f)['traceEvents']
+if not len(events) == sum(record.nb_calls for record in
+                          profiler.records.values()):
+    raise TestError('Expecting one trace event per recorded call')
+profiler.save_tensorboard(writer, global_step=0)
+
+# after disabling, the network should run the unwrapped methods
+network.disable_profiling()
+for obj in [network] + network.layers:
+    if 'propagate_forward' in obj.__dict__:
+        raise TestError('The profiling wrappers were not removed')
+train_step()
+if not profiler.get_statistics('propagate_forward', 'hidden_layer',
+                               'propagate_forward').nb_calls == 3:
+    raise TestError('Calls were recorded after disabling the profiler')
+writer.close()
+
+# the streaming statistics approximate the exact ones within the bin width,
+# with a memory that does not grow with the number of calls
+durations = np.exp(np.random.RandomState(3).normal(np.log(1e-3), 1., 10000))
+statistics = CallStatistics()
+for duration in durations:
+    statistics.add(duration, nb_allocations=2, allocated_bytes=64)
+if not statistics.counts.shape == (CallStatistics.nb_bins,):
+    raise TestError('The number of bins grows with the number of calls')
+if not np.isclose(statistics.mean(), durations.mean(), rtol=1e-10) or \
+        not statistics.min == durations.min() or \
+        not statistics.max == durations.max():
+    raise TestError('Wrong mean, minimum or maximum duration')
+if not statistics.nb_allocations == 2 * len(durations):
+    raise TestError('Wrong number of allocations')
+bin_error = 10. ** (1. / CallStatistics.bins_per_decade) - 1.
+for q in [0, 5, 50, 95, 99, 100]:
+    if not np.isclose(statistics.percentile(q), np.percentile(durations, q),
+                      rtol=bin_error):
+        raise TestError('The {}th percentile {} differs from the exact {}'
+                        .format(q, statistics.percentile(q),
+                                np.percentile(durations, q)))
+counts, edges = statistics.histogram(bins=20)
+if not len(counts) <= 20 or not counts.sum() == len(durations) or \
+        not np.all(np.diff(edges) > 0):
+    raise TestError('Wrong histogram of the streaming statistics')
+exact_counts, _ = np.histogram(durations, bins=edges)
+if not np.abs(counts - exact_counts).sum() <= 0.02 * len(durations):
+    raise TestError('The histogram differs from the exact one')
+print('Profiler OK')
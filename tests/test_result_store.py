@@ -0,0 +1,34 @@
+import tempfile
+import numpy as np
+from utils.result_store import ResultStore
+from utils.helper_classes import TestError
+
+store_dir = tempfile.mkdtemp()
+config = {'randomize': False, 'max_epoch': 60, 'seed': 32,
+          'learning_rates': {'TP': 0.09, 'BP': 0.01}}
+store = ResultStore(store_dir)
+if store.matches_config(config):
+    raise TestError('An empty store should not match a configuration')
+store.set_config(config)
+store.save('TP', 'train_losses', np.arange(6.).reshape(2, 3))
+
+# a script with the same configuration reuses the results
+store = ResultStore(store_dir)
+if not store.matches_config(dict(config)):
+    raise TestError('The store should match its own configuration')
+if not np.array_equal(store.load('TP', 'train_losses', seed=1),
+                      [3., 4., 5.]):
+    raise TestError('Wrong results loaded from the store')
+
+# a script with another configuration sharing the store retrains
+other_config = dict(config, randomize=True)
+if store.matches_config(other_config):
+    raise TestError('The store should not match another configuration')
+store.set_config(other_config)
+if store.contains():
+    raise TestError('The results of the previous configuration should be '
+                    'removed')
+store.save('TP', 'train_losses', np.zeros((2, 3)))
+if ResultStore(store_dir).matches_config(config):
+    raise TestError('The store should only match the last configuration')
+print('Result store OK')
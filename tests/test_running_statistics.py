@@ -0,0 +1,95 @@
+import tempfile
+import torch
+from tensorboardX import SummaryWriter
+from layers.MTP_layer import MTPInputLayer, MTPLeakyReluLayer, \
+    MTPLinearOutputLayer
+from networks.target_prop_network import TargetPropNetwork
+from utils.helper_classes import TestError, NetworkError
+
+torch.manual_seed(47)
+writer = SummaryWriter(log_dir=tempfile.mkdtemp())
+
+
+def create_network(momentum):
+    return TargetPropNetwork(
+        [MTPInputLayer(layer_dim=6, out_dim=6, writer=writer,
+                       debug_mode=False),
+         MTPLeakyReluLayer(negative_slope=0.35, in_dim=6, layer_dim=6,
+                           out_dim=6, writer=writer, debug_mode=False,
+                           momentum=momentum),
+         MTPLinearOutputLayer(in_dim=6, layer_dim=6, step_size=0.01,
+                              writer=writer, debug_mode=False)],
+        log=False)
+
+
+batches = [torch.randn(batch_size, 6, 1) for batch_size in [16, 8, 32, 5]]
+
+# without training updates, the running statistics only depend on the
+# forward outputs of the training batches
+for momentum in [None, 0.1]:
+    network = create_network(momentum)
+    layer = network.layers[1]
+    outputs = []
+    expected_mu = None
+    for batch in batches:
+        network.propagate_forward(batch)
+        outputs.append(layer.forward_output)
+        mu = torch.mean(layer.forward_output, dim=0)
+        var = torch.var(layer.forward_output, dim=0)
+        if expected_mu is None:
+            expected_mu, expected_var = mu, var
+        elif momentum is not None:
+            expected_mu = (1. - momentum)*expected_mu + momentum*mu
+            expected_var = (1. - momentum)*expected_var + momentum*var
+    # batches of size 1 have no variance and are skipped
+    network.propagate_forward(torch.randn(1, 6, 1))
+    if momentum is None:
+        # cumulative statistics over all training samples together
+        expected_mu = torch.mean(torch.cat(outputs), dim=0)
+        expected_var = torch.var(torch.cat(outputs), dim=0)
+    if not (torch.allclose(layer.running_mu, expected_mu, atol=1e-6) and
+            torch.allclose(layer.running_var, expected_var, atol=1e-6)):
+        raise TestError('The running statistics with momentum {} do not '
+                        'match the statistics of the training '
+                        'batches'.format(momentum))
+    if not layer.running_count == sum(len(batch) for batch in batches):
+        raise TestError('Expecting a running count of {}, got {}'.format(
+            sum(len(batch) for batch in batches), layer.running_count))
+
+    # in evaluation mode, the output of a sample does not depend on its
+    # batch, also for batches of size 1
+    running_mu = layer.running_mu.clone()
+    network.eval()
+    test_batch = torch.randn(10, 6, 1)
+    network.propagate_forward(test_batch)
+    output = network.layers[-1].forward_output
+    for i in range(len(test_batch)):
+        network.propagate_forward(test_batch[i:i + 1])
+        if not torch.allclose(network.layers[-1].forward_output[0],
+                              output[i], atol=1e-6):
+            raise TestError('The output in evaluation mode depends on the '
+                            'batch')
+    if not torch.equal(layer.running_mu, running_mu):
+        raise TestError('The running statistics changed in evaluation mode')
+    network.train()
+
+# the fused normalization of the forward output is (output - mu)/sigma
+network = create_network(None)
+network.propagate_forward(batches[0])
+layer = network.layers[1]
+expected_batchnorm = (layer.forward_output - layer.mu)/layer.sigma
+if not torch.allclose(layer.forward_output_batchnorm, expected_batchnorm,
+                      atol=1e-6):
+    raise TestError('Wrong batch normalization of the forward output')
+
+# evaluation mode without running statistics
+network = create_network(0.1)
+network.eval()
+try:
+    network.propagate_forward(torch.randn(4, 6, 1))
+    raise TestError('Expecting a NetworkError in evaluation mode without '
+                    'running statistics')
+except NetworkError:
+    pass
+writer.close()
+print('Running statistics OK')
@@ -9,39 +9,122 @@ You may obtain a copy of the License at
 """
 
 import numpy as np
+import torch
+from utils import helper_functions as hf
 
 
 def linear_least_squares(input_dataset, output_dataset, input_dataset_test,
                          output_dataset_test):
     # compute least squares solution as control
     print('computing LS solution ...')
-    input_dataset_np = input_dataset.cpu().numpy()
-    output_dataset_np = output_dataset.cpu().numpy()
-    input_dataset_test_np = input_dataset_test.cpu().numpy()
-    output_dataset_test_np = output_dataset_test.cpu().numpy()
-
-    input_dataset_np = np.reshape(input_dataset_np,
-                                  (input_dataset_np.shape[0] * \
-                                   input_dataset_np.shape[1],
-                                   input_dataset_np.shape[2]))
-    output_dataset_np = np.reshape(output_dataset_np,
-                                   (output_dataset_np.shape[0] * \
-                                    output_dataset_np.shape[1],
-                                    output_dataset_np.shape[2]))
-    input_dataset_test_np = np.reshape(input_dataset_test_np,
-                                       (input_dataset_test_np.shape[0] * \
-                                        input_dataset_test_np.shape[1],
-                                        input_dataset_test_np.shape[2]))
-    output_dataset_test_np = np.reshape(output_dataset_test_np,
-                                        (output_dataset_test_np.shape[0] * \
-                                         output_dataset_test_np.shape[1],
-                                         output_dataset_test_np.shape[2]))
-
-    weights = np.linalg.lstsq(input_dataset_np, output_dataset_np)
-    weights = weights[0]
-    train_loss = np.mean(np.sum(np.square(np.matmul(input_dataset_np, weights) \
-                                          - output_dataset_np), axis=1))
-    test_loss = np.mean(np.sum(np.square(np.matmul(input_dataset_test_np,
-                                                   weights) \
-                                         - output_dataset_test_np), axis=1))
-    return weights, train_loss, test_loss
+    return streaming_linear_least_squares(
+        (input_dataset, output_dataset),
+        (input_dataset_test, output_dataset_test))
+
+
+def iterate_batches(data, dtype=torch.float64):
+    """ Iterate over the (input_batch, output_batch) pairs of data, which is
+    either a pair of datasets of size nb_batches x batch_size x dim x 1
+    (tensors or (memory-mapped) arrays) or an iterable of batch pairs, e.g.
+    GenerateDatasetFromModel.stream. The batches are returned as tensors of
+    size batch_size x dim, converted to dtype unless it is None."""
+    if isinstance(data, tuple) and len(data) == 2 and \
+            all(isinstance(dataset, (torch.Tensor, np.ndarray))
+                for dataset in data):
+        data = zip(data[0], data[1])
+    for input_batch, output_batch in data:
+        input_batch = torch.as_tensor(input_batch)
+        output_batch = torch.as_tensor(output_batch)
+        input_batch = input_batch.reshape(-1, input_batch.shape[-2])
+        output_batch = output_batch.reshape(-1, output_batch.shape[-2])
+        if dtype is not None:
+            input_batch = input_batch.to(dtype)
+            output_batch = output_batch.to(dtype)
+        yield input_batch, output_batch
+
+
+def streaming_linear_least_squares(train_data, test_data=None, bias=False,
+                                   regularization=0.):
+    """ Linear least-squares baseline, whose weights are computed in one
+    pass over the training data. The normal equations X^T*X and X^T*Y are
+    accumulated batch by batch in float64 and solved with a Cholesky
+    factorization, such that the datasets never have to be in memory at
+    once. The training and test losses are computed from the residuals in
+    a second streaming pass over train_data and test_data. If train_data
+    can only be iterated once (e.g. GenerateDatasetFromModel.stream), the
+    training loss follows from the accumulated statistics instead, clamped
+    at 0 against cancellation. The losses are computed with the float64
+    weights, which are then returned in the floating point dtype of the
+    training inputs.
+    :param train_data: training batches, see iterate_batches
+    :param test_data: test batches, see iterate_batches (optional)
+    :param bias: fit a bias, which is the last row of the weights
+    :param regularization: ridge penalty on the weights (not on the bias)
+    :return: weights (numpy array of size in_dim(+1) x out_dim, such that
+    the prediction is input*weights), train loss and test loss (None if no
+    test_data is given), the losses being the mean over the samples of the
+    summed squared errors
+    """
+    gram = None
+    nb_samples = 0
+    for input_batch, output_batch in iterate_batches(train_data, dtype=None):
+        input_dtype = input_batch.dtype
+        input_batch, output_batch = input_batch.double(), output_batch.double()
+        if bias:
+            input_batch = torch.cat((input_batch,
+                                     input_batch.new_ones(
+                                         input_batch.shape[0], 1)), 1)
+        if gram is None:
+            gram = input_batch.new_zeros(input_batch.shape[1],
+                                         input_batch.shape[1])
+            cross = input_batch.new_zeros(output_batch.shape[1],
+                                          input_batch.shape[1])
+            output_energy = 0.
+        gram += torch.matmul(torch.transpose(input_batch, 0, 1), input_batch)
+        cross += torch.matmul(torch.transpose(output_batch, 0, 1),
+                              input_batch)
+        output_energy += float(torch.sum(output_batch ** 2))
+        nb_samples += input_batch.shape[0]
+    if gram is None:
+        raise ValueError('Expecting at least one training batch')
+
+    penalty = torch.full((gram.shape[0],), float(regularization),
+                         dtype=gram.dtype)
+    if bias:
+        penalty[-1] = 0.
+    weights = torch.transpose(
+        hf.solve_normal_equations(gram + torch.diag(penalty), cross), 0, 1)
+    if iter(train_data) is train_data:
+        # sum ||y - W^T x||^2 = sum y^T y - 2 tr(W^T X^T Y) + tr(W^T X^T X W)
+        squared_error = output_energy \
+            - 2. * float(torch.sum(weights * torch.transpose(cross, 0, 1))) \
+            + float(torch.sum(weights * torch.matmul(gram, weights)))
+        train_loss = max(squared_error, 0.) / nb_samples
+    else:
+        squared_error, _ = get_squared_error(train_data, weights, bias)
+        train_loss = squared_error / nb_samples
+
+    test_loss = None
+    if test_data is not None:
+        squared_error, nb_test_samples = get_squared_error(test_data,
+                                                           weights, bias)
+        test_loss = squared_error / nb_test_samples
+    if input_dtype.is_floating_point:
+        weights = weights.to(input_dtype)
+    return weights.numpy(), train_loss, test_loss
+
+
+def get_squared_error(data, weights, bias=False):
+    """ Return the summed squared error of the linear prediction
+    input*weights (see streaming_linear_least_squares) over the batches of
+    data (see iterate_batches) and the number of samples."""
+    squared_error = 0.
+    nb_samples = 0
+    for input_batch, output_batch in iterate_batches(data):
+        prediction = torch.matmul(input_batch,
+                                  weights[:input_batch.shape[1]])
+        if bias:
+            prediction += weights[-1]
+        squared_error += float(torch.sum((prediction - output_batch) ** 2))
+        nb_samples += input_batch.shape[0]
+    return squared_error, nb_samples
@@ -0,0 +1,191 @@
+"""
+Copyright 2019 Alexander Meulemans
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+"""
+
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+import torch
+from torch.utils._python_dispatch import TorchDispatchMode
+from torch.utils._pytree import tree_leaves
+
+
+class AllocationCounter(TorchDispatchMode):
+    """ Context manager that counts the tensors allocated by the torch
+    operations run inside it. An operation allocates a tensor if it returns
+    a tensor whose storage is not shared with any of its inputs, so views
+    and in-place operations are not counted."""
+
+    def __init__(self):
+        super().__init__()
+        self.nb_allocations = 0
+        self.allocated_bytes = 0
+
+    def __torch_dispatch__(self, func, types, args=(), kwargs=None):
+        output = func(*args, **(kwargs or {}))
+        input_storages = set(
+            tensor.untyped_storage().data_ptr()
+            for tensor in tree_leaves((args, kwargs))
+            if isinstance(tensor, torch.Tensor))
+        for tensor in tree_leaves(output):
+            if isinstance(tensor, torch.Tensor):
+                storage = tensor.untyped_storage()
+                if storage.nbytes() > 0 and \
+                        storage.data_ptr() not in input_storages:
+                    self.nb_allocations += 1
+                    self.allocated_bytes += storage.nbytes()
+        return output
+
+
+def time_call(function, nb_repeats=20, nb_warmup=2, max_time=1.):
+    """ Time the calls of function (without arguments).
+    :param nb_repeats: maximum number of timed calls
+    :param max_time: stop timing after max_time seconds (at least 3 calls
+    are timed)
+    :return: dictionary with the median, mean and minimum latency per call
+    in seconds and the number of timed calls
+    """
+    for i in range(nb_warmup):
+        function()
+    latencies = []
+    start = time.perf_counter()
+    while len(latencies) < nb_repeats:
+        call_start = time.perf_counter()
+        function()
+        latencies.append(time.perf_counter() - call_start)
+        if len(latencies) >= 3 and time.perf_counter() - start > max_time:
+            break
+    return {'latency_median': float(np.median(latencies)),
+            'latency_mean': float(np.mean(latencies)),
+            'latency_min': float(np.min(latencies)),
+            'nb_calls': len(latencies)}
+
+
+def count_allocations(function):
+    """ Return the number of tensors and bytes allocated by one call of
+    function (without arguments)."""
+    with AllocationCounter() as counter:
+        function()
+    return {'nb_allocations': counter.nb_allocations,
+            'allocated_bytes': counter.allocated_bytes}
+
+
+def benchmark_call(function, **kwargs):
+    """ Latencies (see time_call) and allocations (see count_allocations)
+    of function."""
+    result = time_call(function, **kwargs)
+    result.update(count_allocations(function))
+    return result
+
+
+class PhaseTimer(object):
+    """ Accumulates the wall-clock time spent in named phases, e.g.
+    with timer.phase('forward'):
+        network.propagate_forward(input_batch)
+    """
+
+    def __init__(self):
+        self.times = {}
+        self.counts = {}
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.times[name] = self.times.get(name, 0.) + \
+                time.perf_counter() - start
+            self.counts[name] = self.counts.get(name, 0) + 1
+
+    def reset(self):
+        self.times = {}
+        self.counts = {}
+
+    def total_time(self):
+        return sum(self.times.values())
+
+
+def get_peak_rss():
+    """ Return the peak resident set size of the current process in
+    bytes."""
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    return peak_rss if sys.platform == 'darwin' else peak_rss * 1024
+
+
+def get_git_commit():
+    """ Return the hash of the checked out commit of the repository, or None
+    if it can't be determined."""
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def save_benchmark(results, path, **metadata):
+    """ Save a list of benchmark results (dictionaries) as JSON, together
+    with the commit, torch version, number of threads and machine on which
+    they were measured.
+    :param metadata: extra metadata to save, e.g. the benchmark settings
+    """
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    metadata.update({'commit': get_git_commit(),
+                     'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+                     'torch_version': torch.__version__,
+                     'nb_threads': torch.get_num_threads(),
+                     'machine': platform.platform()})
+    with open(path, 'w') as f:
+        json.dump({'metadata': metadata, 'results': results}, f, indent=1)
+
+
+def load_benchmark(path):
+    """ Return the results of a benchmark saved with save_benchmark as a
+    DataFrame, and its metadata."""
+    with open(path) as f:
+        benchmark = json.load(f)
+    return pd.DataFrame(benchmark['results']), benchmark['metadata']
+
+
+def compare_benchmarks(baseline_path, path, keys, threshold=1.2):
+    """ Compare the median latencies and allocations of two saved
+    benchmarks.
+    :param keys: names of the columns that identify a benchmark case, e.g.
+    ['family', 'method', 'width', 'batch_size']
+    :param threshold: cases whose median latency increased by more than this
+    factor are marked as regressions
+    :return: DataFrame with the ratios (new / baseline) for the cases that
+    are in both benchmarks
+    """
+    baseline, _ = load_benchmark(baseline_path)
+    results, _ = load_benchmark(path)
+    columns = ['latency_median', 'nb_allocations', 'allocated_bytes']
+    baseline = baseline.dropna(subset=['latency_median'])
+    results = results.dropna(subset=['latency_median'])
+    merged = pd.merge(baseline[keys + columns], results[keys + columns],
+                      on=keys, suffixes=('_baseline', ''))
+    comparison = merged[keys].copy()
+    for column in columns:
+        comparison[column + '_ratio'] = merged[column] / \
+            merged[column + '_baseline']
+    comparison['regression'] = comparison['latency_median_ratio'] > \
+        threshold
+    return comparison
@@ -16,19 +16,63 @@ class GenerateDatasetFromModel(object):
     """ Generates a toy example dataset from a given true network, that can be
     used to train a new network"""
 
-    def __init__(self, true_network):
+    def __init__(self, true_network, chunk_size=10000):
+        """
+        :param chunk_size: maximal number of samples that are propagated
+        through the true network at once
+        """
         if not isinstance(true_network, Network):
             raise TypeError("Expecting Network object for true_network")
         self.true_network = true_network
         self.input_size = true_network.layers[0].layer_dim
         self.output_size = true_network.layers[-1].layer_dim
+        self.set_chunk_size(chunk_size)
+
+    def set_chunk_size(self, chunk_size):
+        if not isinstance(chunk_size, int):
+            raise TypeError("Expecting an integer for chunk_size, got "
+                            "{}".format(type(chunk_size)))
+        if chunk_size <= 0:
+            raise ValueError("Expecting a strictly positive chunk_size, got "
+                             "{}".format(chunk_size))
+        self.chunk_size = chunk_size
+
+    def propagate(self, input_samples):
+        """ Propagate the samples (3D tensor of size nb_samples x input
+        dimension x 1) through the true network in chunks of chunk_size
+        samples and return the outputs"""
+        output_samples = input_samples.new_empty(input_samples.shape[0],
+                                                 self.output_size, 1)
+        for start in range(0, input_samples.shape[0], self.chunk_size):
+            stop = start + self.chunk_size
+            self.true_network.propagate_forward(input_samples[start:stop])
+            output_samples[start:stop] = self.true_network.get_output()
+        return output_samples
 
     def generate(self, nb_batches, batch_sizes):
         """ Generate dataset of given batch size and number of batches"""
         input_dataset = torch.randn(nb_batches, batch_sizes, self.input_size, 1)
-        output_dataset = torch.empty(nb_batches, batch_sizes,
-                                     self.output_size, 1)
-        for i in range(nb_batches):
-            self.true_network.propagate_forward(input_dataset[i, :, :, :])
-            output_dataset[i, :, :, :] = self.true_network.get_output()
-        return input_dataset, output_dataset
+        output_dataset = self.propagate(
+            input_dataset.view(nb_batches * batch_sizes, self.input_size, 1))
+        return input_dataset, output_dataset.view(nb_batches, batch_sizes,
+                                                  self.output_size, 1)
+
+    def stream(self, batch_size, nb_batches=None):
+        """ Iterator that yields fresh (input_batch, output_batch) pairs
+        on demand, without materializing the dataset. The batches are
+        generated chunk_size samples at a time, such that the memory use is
+        bounded. Within one chunk, the batches equal those of
+        generate(nb_batches, batch_size) for the same seed; over several
+        chunks, the inputs are drawn chunk by chunk and differ from them.
+        :param nb_batches: number of batches to yield, infinite if None
+        """
+        batches_per_chunk = max(1, self.chunk_size // batch_size)
+        count = 0
+        while nb_batches is None or count < nb_batches:
+            if nb_batches is not None:
+                batches_per_chunk = min(batches_per_chunk, nb_batches - count)
+            input_chunk, output_chunk = self.generate(batches_per_chunk,
+                                                      batch_size)
+            for i in range(batches_per_chunk):
+                yield input_chunk[i], output_chunk[i]
+            count += batches_per_chunk
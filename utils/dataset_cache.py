@@ -0,0 +1,132 @@
+"""
+Copyright 2019 Alexander Meulemans
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
+import torch
+from networks.network import Network
+from utils.create_datasets import GenerateDatasetFromModel
+from utils.LLS import linear_least_squares
+
+DATASET_NAMES = ('input_dataset', 'output_dataset', 'input_dataset_test',
+                 'output_dataset_test')
+
+
+class DatasetCache(object):
+    """ On-disk cache of the toy datasets generated from a true network,
+    together with the linear least-squares baseline. The entries are
+    addressed by a hash of everything the generated data depends on: the
+    architecture (layer types, sizes and negative slopes) and weights of the
+    true network, the dataset sizes and the state of the torch random
+    number generator. The tensors are stored as .npy files and loaded
+    memory-mapped without copy. After a cache hit, the random number
+    generator is set to the state it has after generating the data, such
+    that a seeded script gives the same results with and without cache.
+    Whether the last call of load_or_generate was a cache hit is kept in
+    hit.
+    """
+
+    def __init__(self, cache_dir='../cache/datasets', verbose=False):
+        """
+        :param verbose: print the directory of the entries loaded from the
+        cache
+        """
+        self.cache_dir = cache_dir
+        self.verbose = verbose
+        self.hit = None
+
+    def get_key(self, true_network, nb_batches, batch_size, testing_size):
+        if not isinstance(true_network, Network):
+            raise TypeError("Expecting Network object for true_network")
+        architecture = [(type(layer).__name__, getattr(layer, 'in_dim', None),
+                         layer.layer_dim,
+                         getattr(layer, 'negative_slope', None))
+                        for layer in true_network.layers]
+        description = json.dumps({'architecture': architecture,
+                                  'nb_batches': nb_batches,
+                                  'batch_size': batch_size,
+                                  'testing_size': testing_size})
+        sha = hashlib.sha256(description.encode())
+        for layer in true_network.layers[1:]:
+            sha.update(layer.forward_weights.cpu().numpy().tobytes())
+            sha.update(layer.forward_bias.cpu().numpy().tobytes())
+        sha.update(torch.get_rng_state().numpy().tobytes())
+        return sha.hexdigest()
+
+    def load_or_generate(self, true_network, nb_batches, batch_size,
+                         testing_size=1000):
+        """ Return the training and test datasets generated from
+        true_network and the linear least-squares baseline, from the cache
+        if possible.
+        :return: input_dataset, output_dataset, input_dataset_test,
+        output_dataset_test, (lls_weights, lls_train_loss, lls_test_loss)
+        """
+        key = self.get_key(true_network, nb_batches, batch_size,
+                           testing_size)
+        directory = os.path.join(self.cache_dir, key)
+        self.hit = os.path.exists(directory)
+        if self.hit:
+            return self.load(directory)
+
+        generator = GenerateDatasetFromModel(true_network)
+        input_dataset, output_dataset = generator.generate(nb_batches,
+                                                           batch_size)
+        input_dataset_test, output_dataset_test = generator.generate(
+            testing_size, 1)
+        rng_state = torch.get_rng_state()
+        weights, train_loss, test_loss = linear_least_squares(
+            input_dataset, output_dataset, input_dataset_test,
+            output_dataset_test)
+        self.save(directory, (input_dataset, output_dataset,
+                              input_dataset_test, output_dataset_test),
+                  rng_state, weights, train_loss, test_loss)
+        return input_dataset, output_dataset, input_dataset_test, \
+            output_dataset_test, (weights, train_loss, test_loss)
+
+    def save(self, directory, datasets, rng_state, weights, train_loss,
+             test_loss):
+        """ Write the entry to a temporary directory and move it in place,
+        such that parallel runs never see a partially written entry."""
+        if not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        tmp_directory = tempfile.mkdtemp(dir=self.cache_dir)
+        for name, dataset in zip(DATASET_NAMES, datasets):
+            np.save(os.path.join(tmp_directory, name + '.npy'),
+                    dataset.cpu().numpy())
+        np.save(os.path.join(tmp_directory, 'rng_state.npy'),
+                rng_state.numpy())
+        np.save(os.path.join(tmp_directory, 'lls_weights.npy'), weights)
+        with open(os.path.join(tmp_directory, 'lls_losses.json'), 'w') as f:
+            json.dump({'train_loss': float(train_loss),
+                       'test_loss': float(test_loss)}, f)
+        try:
+            os.rename(tmp_directory, directory)
+        except OSError:
+            # another run stored the same entry in the meantime
+            shutil.rmtree(tmp_directory)
+
+    def load(self, directory):
+        # copy-on-write memory maps give writable arrays without copying
+        datasets = [torch.from_numpy(np.load(
+            os.path.join(directory, name + '.npy'), mmap_mode='c'))
+            for name in DATASET_NAMES]
+        torch.set_rng_state(torch.from_numpy(
+            np.load(os.path.join(directory, 'rng_state.npy'))))
+        weights = np.load(os.path.join(directory, 'lls_weights.npy'))
+        with open(os.path.join(directory, 'lls_losses.json')) as f:
+            losses = json.load(f)
+        if self.verbose:
+            print('loaded datasets from cache {}'.format(directory))
+        return datasets[0], datasets[1], datasets[2], datasets[3], \
+            (weights, losses['train_loss'], losses['test_loss'])
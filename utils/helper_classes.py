@@ -8,6 +8,7 @@ You may obtain a copy of the License at
    http://www.apache.org/licenses/LICENSE-2.0
 """
 
+import torch
 import torch.nn as nn
 
 
@@ -28,3 +29,92 @@ class NotImplementedError(Exception):
 
 class TestError(Exception):
     pass
+
+
+class Float32Writer(object):
+    """ Wraps a tensorboardX SummaryWriter such that the logged tensors are
+    converted to float32, as tensorboardX converts them to numpy arrays and
+    numpy has no bfloat16 type (see Layer.set_dtype_policy). The other
+    methods are those of the wrapped writer."""
+
+    def __init__(self, writer):
+        self.writer = writer
+
+    @staticmethod
+    def to_float32(value):
+        if isinstance(value, torch.Tensor) and value.is_floating_point():
+            return value.to(torch.float32)
+        return value
+
+    def add_scalar(self, tag, scalar_value, *args, **kwargs):
+        self.writer.add_scalar(tag, self.to_float32(scalar_value), *args,
+                               **kwargs)
+
+    def add_histogram(self, tag, values, *args, **kwargs):
+        self.writer.add_histogram(tag, self.to_float32(values), *args,
+                                  **kwargs)
+
+    def __getattr__(self, name):
+        if name == 'writer':
+            # not initialized, e.g. while unpickling
+            raise AttributeError(name)
+        return getattr(self.writer, name)
+
+
+class DTypePolicy(object):
+    """ Floating point types used by the layers of a network. The parameters,
+    activations and gradients are stored and computed in compute_dtype.
+    State that is updated incrementally over the whole training, i.e. the
+    inverse of the forward weights that InvertibleLayer tracks with the
+    Sherman-Morrison formula, is kept in accumulation_dtype, such that its
+    rounding errors do not accumulate in a low precision type."""
+
+    compute_dtypes = (torch.float16, torch.bfloat16, torch.float32,
+                      torch.float64)
+    accumulation_dtypes = (torch.float32, torch.float64)
+
+    def __init__(self, compute_dtype=None, accumulation_dtype=None):
+        """
+        :param compute_dtype: torch dtype, the default torch dtype if None
+        :param accumulation_dtype: torch dtype, equal to compute_dtype if
+        None, or float32 for a half precision compute_dtype
+        """
+        if compute_dtype is None:
+            compute_dtype = torch.get_default_dtype()
+        if compute_dtype not in self.compute_dtypes:
+            raise ValueError("Expecting a compute_dtype in {}, got "
+                             "{}".format(self.compute_dtypes, compute_dtype))
+        if accumulation_dtype is None:
+            accumulation_dtype = compute_dtype \
+                if compute_dtype in self.accumulation_dtypes \
+                else torch.float32
+        if accumulation_dtype not in self.accumulation_dtypes:
+            raise ValueError("Expecting an accumulation_dtype in {}, got "
+                             "{}".format(self.accumulation_dtypes,
+                                         accumulation_dtype))
+        self.compute_dtype = compute_dtype
+        self.accumulation_dtype = accumulation_dtype
+
+    @classmethod
+    def from_name(cls, name):
+        """ Return one of the predefined policies: 'float32', 'float64',
+        'bfloat16' (float32 accumulation), 'float16' (float32 accumulation)
+        or 'mixed' (float32 compute, float64 accumulation)."""
+        policies = {'float32': (torch.float32, torch.float32),
+                    'float64': (torch.float64, torch.float64),
+                    'bfloat16': (torch.bfloat16, torch.float32),
+                    'float16': (torch.float16, torch.float32),
+                    'mixed': (torch.float32, torch.float64)}
+        if name not in policies:
+            raise ValueError("Expecting a dtype policy name in {}, got "
+                             "{}".format(sorted(policies), name))
+        return cls(*policies[name])
+
+    def __eq__(self, other):
+        return isinstance(other, DTypePolicy) and \
+            self.compute_dtype == other.compute_dtype and \
+            self.accumulation_dtype == other.accumulation_dtype
+
+    def __repr__(self):
+        return 'DTypePolicy(compute_dtype={}, accumulation_dtype={})'.format(
+            self.compute_dtype, self.accumulation_dtype)
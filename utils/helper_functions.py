@@ -121,7 +121,8 @@ def get_invertible_random_matrix(rows, cols, threshold=0.4, max_iter=300):
 
     return m.to(device)
 
-def get_invertible_neighbourhood_matrix(matrix, distance, threshold=0.4):
+def get_invertible_neighbourhood_matrix(matrix, distance, threshold=0.4,
+                                        max_iter=300):
     cpu = torch.device('cpu')
     m = torch.randn(matrix.shape[0], matrix.shape[1])
     device = m.device
@@ -144,20 +145,95 @@ def get_invertible_neighbourhood_matrix(matrix, distance, threshold=0.4):
         s_max = S[0]
         s_min = S[-1]
         iter += 1
+        if iter >= max_iter:
+            raise RuntimeWarning('max iterations reached of '
+                                 'get_invertible_neighbourhood_matrix. '
+                                 'Use get_conditioned_neighbourhood_matrix '
+                                 'to project on the invertible matrices '
+                                 'instead of resampling')
 
     return matrix_n.to(device)
 
+
+def get_random_orthogonal_matrix(rows, cols=None, batch_size=None):
+    """
+    Sample a matrix with orthonormal columns (rows >= cols), uniformly
+    distributed (Haar measure), from the QR decomposition of a gaussian
+    matrix. If batch_size is given, a batch of batch_size independent
+    matrices is returned (tensor of size batch_size x rows x cols).
+    """
+    if cols is None:
+        cols = rows
+    if cols > rows:
+        raise ValueError('Expecting rows >= cols for a matrix with '
+                         'orthonormal columns, got {}x{}'.format(rows, cols))
+    shape = (rows, cols) if batch_size is None else (batch_size, rows, cols)
+    Q, R = torch.linalg.qr(torch.randn(shape))
+    # fix the signs of the columns, such that Q is not biased by the
+    # sign convention of the QR decomposition
+    signs = torch.sign(torch.diagonal(R, dim1=-2, dim2=-1))
+    signs[signs == 0] = 1.
+    return Q * signs.unsqueeze(-2)
+
+
+def get_conditioned_random_matrix(rows, cols, s_min, s_max,
+                                  batch_size=None):
+    """
+    Construct a random matrix U*S*V^T with singular values in
+    [s_min, s_max], without rejection sampling. U and V are random
+    orthogonal factors and the largest and smallest singular values are
+    exactly s_max and s_min, the others are uniformly distributed in between.
+    If batch_size is given, a batch of batch_size independent matrices is
+    returned (tensor of size batch_size x rows x cols).
+    """
+    if not 0. < s_min <= s_max:
+        raise ValueError('Expecting 0 < s_min <= s_max, got s_min={} and '
+                         's_max={}'.format(s_min, s_max))
+    rank = min(rows, cols)
+    U = get_random_orthogonal_matrix(rows, rank, batch_size)
+    V = get_random_orthogonal_matrix(cols, rank, batch_size)
+    shape = (rank,) if batch_size is None else (batch_size, rank)
+    S = s_min + (s_max - s_min) * torch.rand(shape)
+    S[..., 0] = s_max
+    if rank > 1:
+        S[..., -1] = s_min
+    return torch.matmul(U * S.unsqueeze(-2), torch.transpose(V, -1, -2))
+
+
+def project_singular_values(matrix, s_min=0., s_max=None):
+    """
+    Project a matrix (or a batch of matrices) on the matrices with singular
+    values in [s_min, s_max], by clamping its singular values. This is the
+    closest such matrix in Frobenius norm. Only one SVD is computed.
+    """
+    U, S, Vh = torch.linalg.svd(matrix, full_matrices=False)
+    S = torch.clamp(S, min=s_min, max=s_max)
+    return torch.matmul(U * S.unsqueeze(-2), Vh)
+
+
+def get_conditioned_neighbourhood_matrix(matrix, distance, s_min,
+                                         s_max=None):
+    """
+    Return a random matrix in the neighbourhood of matrix (or of each
+    matrix of a batch), at Frobenius distance distance, that is projected
+    on the matrices with singular values in [s_min, s_max] instead of
+    being resampled until it is invertible. The projection can change
+    the distance to matrix.
+    """
+    m = torch.randn(matrix.shape, dtype=matrix.dtype, device=matrix.device)
+    norm = torch.norm(m, dim=(-2, -1), keepdim=True)
+    return project_singular_values(matrix + distance / norm * m, s_min,
+                                   s_max)
+
 def get_angle(tensor1, tensor2):
     """
     returns angle between each sample of the two batches (tensors of size
     batch_size x vector dimension x 1
     """
 
-    tensor1_T = torch.transpose(tensor1,1,2)
-    tensor2_T = torch.transpose(tensor2, 1, 2)
-    inner_product = torch.bmm(tensor1_T,tensor2)
-    norm_1 = torch.sqrt(torch.bmm(tensor1_T, tensor1))
-    norm_2 = torch.sqrt(torch.bmm(tensor2_T, tensor2))
+    inner_product = torch.sum(tensor1*tensor2, 1)
+    norm_1 = torch.norm(tensor1, dim=1)
+    norm_2 = torch.norm(tensor2, dim=1)
     angles = inner_product/(norm_1*norm_2)
     return angles.squeeze()
 
@@ -179,108 +255,135 @@ def get_invertible_diagonal_matrix(size, threshold=0.1, max_iter=500):
         diag = torch.randn((size))
     return torch.diag(diag)
 
-def eye(rows, cols=None, batch_size=1):
+def eye(rows, cols=None, batch_size=1, dtype=None):
     if cols is None:
         cols = rows
-    output = torch.empty(batch_size, rows, cols)
+    output = torch.empty(batch_size, rows, cols, dtype=dtype)
     for i in range(batch_size):
         output[i,:,:] = torch.eye(rows, cols)
     return output
 
 def pinverse(tensor, rcond=1e-6):
-    output = torch.empty((tensor.shape[0], tensor.shape[2], tensor.shape[1]))
+    output = tensor.new_empty((tensor.shape[0], tensor.shape[2],
+                               tensor.shape[1]))
     for i in range(tensor.shape[0]):
         output[i,:,:] = torch.pinverse(tensor[i,:,:], rcond=rcond)
     return output
 
+def batch_matmul(weights, input):
+    """
+    Compute torch.matmul(weights, input) for a weight matrix and a batch of
+    column vectors (batch_size x in_dim x 1) as one GEMM on the row-major
+    batch_size x in_dim view of the input (input*weights^T), instead of a
+    batched matrix-vector product. Returns a tensor of size
+    batch_size x out_dim x 1.
+    """
+    if weights.dim() != 2 or input.dim() != 3 or input.shape[2] != 1:
+        return torch.matmul(weights, input)
+    return torch.matmul(input.reshape(input.shape[0], input.shape[1]),
+                        weights.t()).unsqueeze(2)
+
+def batch_outer_product_mean(u, v):
+    """
+    Compute torch.mean(torch.matmul(u, v^T), 0) for two batches of column
+    vectors (batch_size x dim x 1) as one GEMM, without materializing the
+    batch of outer products.
+    """
+    if u.dim() != 3 or v.dim() != 3 or u.shape[2] != 1 or v.shape[2] != 1:
+        return torch.mean(torch.matmul(u, torch.transpose(v, -1, -2)), 0)
+    batch_size = u.shape[0]
+    return torch.matmul(u.reshape(batch_size, u.shape[1]).t(),
+                        v.reshape(batch_size, v.shape[1])) / batch_size
+
+def solve_normal_equations(gram, cross, regularization=0.):
+    """
+    Solve W*(gram + regularization*I) = cross for W with a Cholesky
+    factorization. gram is the (symmetric) matrix sum_i x_i*x_i^T and cross
+    the matrix sum_i y_i*x_i^T of the least-squares problem
+    min_W sum_i ||W*x_i - y_i||^2 + regularization*||W||^2.
+    If gram is singular, the pseudo-inverse solution is returned.
+    """
+    A = gram + regularization * torch.eye(gram.shape[0], dtype=gram.dtype)
+    L, info = torch.linalg.cholesky_ex(A)
+    if info == 0:
+        return torch.transpose(
+            torch.cholesky_solve(torch.transpose(cross, 0, 1), L), 0, 1)
+    else:
+        return torch.matmul(cross, torch.pinverse(A))
+
 def get_stats_gridsearch(results, distances, learning_rates):
-    best_results = np.min(results, 2)
-    succesful_runs = best_results != 0
-    descending_runs = np.zeros(succesful_runs.shape,dtype=bool)
-    for i in range(len(distances)):
-        for j in range(len(learning_rates)):
-            if succesful_runs[i,j]:
-                if is_descending_run(results[i,j,:]):
-                    descending_runs[i,j] = True
-    best_results_distance = np.zeros(len(distances))
-    best_learning_rates = np.zeros(len(distances))
-    success_counts = np.zeros(len(distances))
-    descending_counts = np.zeros(len(distances))
-    for i in range(len(distances)):
-        valid_run = False
-        best_results_distance[i] = float('inf')
-        success_counts[i] = np.sum(succesful_runs[i,:])
-        descending_counts[i] = np.sum(descending_runs[i,:])
-        for j, learning_rate in enumerate(learning_rates):
-            if descending_runs[i,j]:
-                valid_run = True
-                best_result = best_results[i,j]
-                if best_result < best_results_distance[i]:
-                    best_results_distance[i] = best_result
-                    best_learning_rates[i] = learning_rate
-        if not valid_run:
-            best_results_distance[i] = np.nan
-            best_learning_rates[i] = np.nan
-    result_array = np.empty((len(distances), 4))
-    result_array[:,0] = success_counts
-    result_array[:,1] = descending_counts
-    result_array[:,2] = best_results_distance
-    result_array[:,3] = best_learning_rates
-    columns = ['success_count', 'descending_count', 'best_result', 'best_learning_rate']
-    result_frame = pd.DataFrame(result_array,index=distances,columns=columns)
-    pd.set_option('display.max_rows', None)
-    pd.set_option('display.max_columns', None)
-    print(result_frame)
+    result_frame = get_stats_gridsearch_nd(
+        results, [('distance', distances),
+                  ('learning_rate', learning_rates)]).astype(float)
+    result_frame.index = distances
+    print_frame(result_frame)
     return result_frame
 
 def get_stats_gridsearch2(results, distances, learning_rates, weight_decays):
-    best_results = np.min(results, 3)
-    succesful_runs = best_results != 0
-    descending_runs = np.zeros(succesful_runs.shape,dtype=bool)
-    for i in range(len(distances)):
-        for j in range(len(learning_rates)):
-            for k in range(len(weight_decays)):
-                if succesful_runs[i,j,k]:
-                    if is_descending_run(results[i,j,k,:]):
-                        descending_runs[i,j,k] = True
-    best_results_distance = np.zeros(len(distances))
-    best_learning_rates = np.zeros(len(distances))
-    best_weight_decays = np.zeros(len(distances))
-    success_counts = np.zeros(len(distances))
-    descending_counts = np.zeros(len(distances))
-    for i in range(len(distances)):
-        valid_run = False
-        best_results_distance[i] = float('inf')
-        success_counts[i] = np.sum(succesful_runs[i,:,:])
-        descending_counts[i] = np.sum(descending_runs[i,:,:])
-        for j, learning_rate in enumerate(learning_rates):
-            for k, weight_decay in enumerate(weight_decays):
-                if descending_runs[i,j,k]:
-                    valid_run = True
-                    best_result = best_results[i,j,k]
-                    if best_result < best_results_distance[i]:
-                        best_results_distance[i] = best_result
-                        best_learning_rates[i] = learning_rate
-                        best_weight_decays[i] = weight_decay
-        if not valid_run:
-            best_results_distance[i] = np.nan
-            best_learning_rates[i] = np.nan
-            best_weight_decays[i] = np.nan
-    result_array = np.empty((len(distances), 5))
-    result_array[:,0] = success_counts
-    result_array[:,1] = descending_counts
-    result_array[:,2] = best_results_distance
-    result_array[:,3] = best_learning_rates
-    result_array[:,4] = best_weight_decays
-    columns = ['success_count', 'descending_count', 'best_result',
-               'best_learning_rate', 'best_weight_decay']
-    result_frame = pd.DataFrame(result_array, index=distances, columns=columns)
-    pd.set_option('display.max_rows', None)
-    pd.set_option('display.max_columns', None)
-    print(result_frame)
+    result_frame = get_stats_gridsearch_nd(
+        results, [('distance', distances),
+                  ('learning_rate', learning_rates),
+                  ('weight_decay', weight_decays)]).astype(float)
+    result_frame.index = distances
+    print_frame(result_frame)
     return result_frame
 
+def get_stats_gridsearch_nd(results, axes, threshold=1.5):
+    """
+    Summarize a grid search over any number of hyperparameters with
+    vectorized reductions.
+    :param results: array of size len(values_1) x ... x len(values_N) x
+    nb_epochs with the loss curve of each run, 0 for failed runs
+    :param axes: list of (name, values) pairs, one for each hyperparameter
+    axis of results. The statistics are computed for each value of the
+    first axis, over all the other axes.
+    :param threshold: see is_descending_run
+    :return: frame indexed by the values of the first axis, with the
+    number of successful and descending runs, the best result over the
+    descending runs and the hyperparameters of the best run (NaN if no run
+    is descending)
+    """
+    results = np.asarray(results)
+    if not len(axes) == results.ndim - 1:
+        raise ValueError('Expecting one axis for each but the last '
+                         'dimension of results, got {} axes for results of '
+                         'shape {}'.format(len(axes), results.shape))
+    for (name, values), size in zip(axes, results.shape):
+        if not len(values) == size:
+            raise ValueError('Expecting {} values for axis {}, got '
+                             '{}'.format(size, name, len(values)))
+    best_results = np.min(results, -1)
+    succesful_runs = best_results != 0
+    descending_runs = succesful_runs & \
+                      (results[..., -1] < threshold*best_results)
+
+    nb_groups = results.shape[0]
+    grid_shape = results.shape[1:-1]
+    descending_results = np.where(descending_runs, best_results,
+                                  np.inf).reshape(nb_groups, -1)
+    best_cells = np.argmin(descending_results, 1)
+    valid_runs = descending_runs.reshape(nb_groups, -1).any(1)
+
+    name, values = axes[0]
+    result_frame = pd.DataFrame(
+        {'success_count': succesful_runs.reshape(nb_groups, -1).sum(1),
+         'descending_count': descending_runs.reshape(nb_groups, -1).sum(1),
+         'best_result': np.where(
+             valid_runs,
+             descending_results[np.arange(nb_groups), best_cells], np.nan)},
+        index=pd.Index(values, name=name))
+    if len(grid_shape) > 0:
+        best_indices = np.unravel_index(best_cells, grid_shape)
+        for (name, values), indices in zip(axes[1:], best_indices):
+            result_frame['best_' + name] = pd.Series(
+                np.asarray(values)[indices],
+                index=result_frame.index).where(valid_runs)
+    return result_frame
 
+def print_frame(frame):
+    pd.set_option('display.max_rows', None)
+    pd.set_option('display.max_columns', None)
+    print(frame)
 
 
 def is_descending_run(loss_array, threshold=1.5):
@@ -0,0 +1,204 @@
+"""
+Copyright 2019 Alexander Meulemans
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+"""
+
+import numpy as np
+
+
+class History(object):
+    """ History of a scalar diagnostic that is saved every training step,
+    e.g. the approx_errors of a TargetPropLayer. The policy determines
+    which values are kept:
+    - 'all': keep every value (the default). The buffer grows by doubling,
+    so appending has a constant amortized cost.
+    - 'decimate': keep every k-th value. k starts at 1 and is doubled when
+    the history is full, after which every other kept value is dropped.
+    - 'reservoir': keep a uniform random sample of capacity values
+    (reservoir sampling).
+    - 'buckets': keep the minimum, mean and maximum of buckets of k
+    consecutive values. When the history is full, adjacent buckets are
+    merged and k is doubled.
+    With a capacity, the memory and the cost per step are constant,
+    regardless of the number of steps.
+    """
+
+    policies = ['all', 'decimate', 'reservoir', 'buckets']
+
+    def __init__(self, policy='all', capacity=None, seed=0):
+        """
+        :param capacity: maximum number of kept values (resp. buckets). Must
+        be None for the policy 'all', and at least 2 for the other policies.
+        :param seed: seed of the random generator of the policy
+        'reservoir', which is independent of the global random generators
+        """
+        self.set_policy(policy, capacity)
+        self.seed = seed
+        self.reset()
+
+    def set_policy(self, policy, capacity):
+        if policy not in self.policies:
+            raise ValueError('Expecting one of {} as policy, got '
+                             '{}'.format(self.policies, policy))
+        if policy == 'all':
+            if capacity is not None:
+                raise ValueError("Expecting capacity None for the policy "
+                                 "'all', got {}".format(capacity))
+        else:
+            if not isinstance(capacity, int):
+                raise TypeError('Expecting an integer capacity for the '
+                                'policy {}, got {}'.format(policy,
+                                                           type(capacity)))
+            if capacity < 2:
+                raise ValueError('Expecting a capacity of at least 2, got '
+                                 '{}'.format(capacity))
+        self.policy = policy
+        self.capacity = capacity
+
+    def reset(self):
+        """ Remove all values."""
+        size = 16 if self.capacity is None else self.capacity
+        self.values = np.empty(size)
+        self.steps = np.empty(size, dtype=np.int64)
+        if self.policy == 'buckets':
+            self.minima = np.empty(size)
+            self.maxima = np.empty(size)
+            self.counts = np.empty(size, dtype=np.int64)
+        self.nb_kept = 0
+        self.nb_appended = 0
+        # number of steps per kept value (resp. bucket)
+        self.stride = 1
+        self.random_state = np.random.RandomState(self.seed)
+
+    def __len__(self):
+        return self.nb_kept
+
+    def append(self, value):
+        """ Save value (a float or a tensor with one element) as the value
+        of the next step."""
+        value = float(value)
+        step = self.nb_appended
+        self.nb_appended += 1
+        if self.policy == 'all':
+            self.append_all(step, value)
+        elif self.policy == 'decimate':
+            self.append_decimate(step, value)
+        elif self.policy == 'reservoir':
+            self.append_reservoir(step, value)
+        else:
+            self.append_buckets(step, value)
+
+    def append_all(self, step, value):
+        if self.nb_kept == len(self.values):
+            self.values = np.concatenate((self.values,
+                                          np.empty(len(self.values))))
+            self.steps = np.concatenate((self.steps,
+                                         np.empty(len(self.steps),
+                                                  dtype=np.int64)))
+        self.values[self.nb_kept] = value
+        self.steps[self.nb_kept] = step
+        self.nb_kept += 1
+
+    def append_decimate(self, step, value):
+        if step // self.stride >= self.capacity:
+            # the kept steps are the multiples of stride, keep the
+            # multiples of 2*stride
+            nb_kept = (self.nb_kept + 1) // 2
+            self.values[:nb_kept] = self.values[0:self.nb_kept:2]
+            self.steps[:nb_kept] = self.steps[0:self.nb_kept:2]
+            self.nb_kept = nb_kept
+            self.stride *= 2
+        if step % self.stride == 0:
+            self.values[self.nb_kept] = value
+            self.steps[self.nb_kept] = step
+            self.nb_kept += 1
+
+    def append_reservoir(self, step, value):
+        if self.nb_kept < self.capacity:
+            index = self.nb_kept
+            self.nb_kept += 1
+        else:
+            index = self.random_state.randint(0, step + 1)
+            if index >= self.capacity:
+                return
+        self.values[index] = value
+        self.steps[index] = step
+
+    def append_buckets(self, step, value):
+        if step // self.stride >= self.capacity:
+            self.merge_buckets()
+        index = step // self.stride
+        if index == self.nb_kept:
+            self.values[index] = value
+            self.minima[index] = value
+            self.maxima[index] = value
+            self.counts[index] = 1
+            self.steps[index] = step
+            self.nb_kept += 1
+        else:
+            count = self.counts[index]
+            self.values[index] += (value - self.values[index]) / (count + 1)
+            self.minima[index] = min(self.minima[index], value)
+            self.maxima[index] = max(self.maxima[index], value)
+            self.counts[index] = count + 1
+
+    def merge_buckets(self):
+        """ Merge the buckets 2i and 2i+1 and double the bucket size."""
+        n = self.nb_kept
+        nb_merged = (n + 1) // 2
+        counts = np.zeros(nb_merged, dtype=np.int64)
+        np.add.at(counts, np.arange(n) // 2, self.counts[:n])
+        sums = np.zeros(nb_merged)
+        np.add.at(sums, np.arange(n) // 2, self.values[:n] * self.counts[:n])
+        minima = np.minimum.reduceat(self.minima[:n], np.arange(0, n, 2))
+        maxima = np.maximum.reduceat(self.maxima[:n], np.arange(0, n, 2))
+        self.values[:nb_merged] = sums / counts
+        self.minima[:nb_merged] = minima
+        self.maxima[:nb_merged] = maxima
+        self.counts[:nb_merged] = counts
+        self.steps[:nb_merged] = self.steps[0:n:2]
+        self.nb_kept = nb_merged
+        self.stride *= 2
+
+    def get_order(self):
+        # the reservoir is not ordered by step
+        if self.policy == 'reservoir':
+            return np.argsort(self.steps[:self.nb_kept], kind='stable')
+        return slice(0, self.nb_kept)
+
+    def numpy(self):
+        """ Return the kept values ordered by step (the bucket means for the
+        policy 'buckets')."""
+        return self.values[:self.nb_kept][self.get_order()]
+
+    def get_steps(self):
+        """ Return the steps of the kept values (the first step of each
+        bucket for the policy 'buckets')."""
+        return self.steps[:self.nb_kept][self.get_order()]
+
+    def get_minima(self):
+        """ Return the minimum of each bucket (policy 'buckets')."""
+        if not self.policy == 'buckets':
+            raise ValueError("Expecting the policy 'buckets', got "
+                             "{}".format(self.policy))
+        return self.minima[:self.nb_kept]
+
+    def get_maxima(self):
+        """ Return the maximum of each bucket (policy 'buckets')."""
+        if not self.policy == 'buckets':
+            raise ValueError("Expecting the policy 'buckets', got "
+                             "{}".format(self.policy))
+        return self.maxima[:self.nb_kept]
+
+    def get_buffers(self):
+        """ Return the numpy arrays that hold the history (see
+        utils.memory)."""
+        buffers = [self.values, self.steps]
+        if self.policy == 'buckets':
+            buffers += [self.minima, self.maxima, self.counts]
+        return buffers
@@ -0,0 +1,168 @@
+"""
+Copyright 2019 Alexander Meulemans
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+"""
+
+import numbers
+import sys
+import warnings
+import numpy as np
+import pandas as pd
+import torch
+from utils.history import History
+
+
+def get_nbytes(value, storages):
+    """ Return the number of bytes held by value, which can be a tensor, a
+    numpy array or a list, tuple or dict of those. A tensor storage (or
+    numpy buffer) is only counted the first time it is seen, such that
+    views and tensors shared between layers are not counted twice.
+    :param storages: set with the addresses of the already counted storages,
+    updated in place
+    :return: number of bytes, or None if value holds no data, e.g. a layer
+    or a SummaryWriter
+    """
+    if isinstance(value, torch.Tensor):
+        storage = value.untyped_storage()
+        if storage.data_ptr() in storages:
+            return 0
+        storages.add(storage.data_ptr())
+        return storage.nbytes()
+    if isinstance(value, np.ndarray):
+        base = value if value.base is None else value.base
+        if not isinstance(base, np.ndarray):
+            return value.nbytes
+        if id(base) in storages:
+            return 0
+        storages.add(id(base))
+        return base.nbytes
+    if isinstance(value, History):
+        return sum(get_nbytes(buffer, storages)
+                   for buffer in value.get_buffers())
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, (list, tuple)):
+        nbytes = [get_nbytes(item, storages) for item in value]
+        if len(value) > 0 and all(item is None for item in nbytes):
+            if all(isinstance(item, numbers.Number) for item in value):
+                return sys.getsizeof(value) + sum(sys.getsizeof(item)
+                                                  for item in value)
+            # e.g. the list of layers of a network
+            return None
+        return sys.getsizeof(value) + sum(item for item in nbytes
+                                          if item is not None)
+    if isinstance(value, dict):
+        return get_nbytes(list(value.values()), storages)
+    return None
+
+
+def get_memory_rows(owner, obj, storages):
+    """ Return a row (owner, attribute, type, shape, number of bytes and
+    whether the attribute is a history, see history_state) for every
+    attribute of obj that holds data."""
+    history_state = getattr(obj, 'history_state', ())
+    rows = []
+    for attribute, value in vars(obj).items():
+        nbytes = get_nbytes(value, storages)
+        if nbytes is None:
+            continue
+        shape = tuple(value.shape) if hasattr(value, 'shape') else \
+            (len(value),)
+        rows.append({'owner': owner, 'attribute': attribute,
+                     'type': type(value).__name__, 'shape': shape,
+                     'nbytes': nbytes,
+                     'history': attribute in history_state})
+    return rows
+
+
+def memory_report(network, optimizers=None):
+    """ See Network.memory_report."""
+    if optimizers is None:
+        optimizers = []
+    storages = set()
+    rows = get_memory_rows('network', network, storages)
+    for i, layer in enumerate(network.layers):
+        rows += get_memory_rows('{}:{}'.format(i, layer.name), layer,
+                                storages)
+    for i, optimizer in enumerate(optimizers):
+        rows += get_memory_rows('optimizer{}:{}'.format(
+            i, type(optimizer).__name__), optimizer, storages)
+    columns = ['owner', 'attribute', 'type', 'shape', 'nbytes', 'history']
+    return pd.DataFrame(rows, columns=columns).set_index(
+        ['owner', 'attribute'])
+
+
+class MemoryMonitor(object):
+    """ Samples the memory report of a network and its optimizers during
+    training and warns once for every history (see history_state) that
+    grows past history_budget bytes. An optimizer samples the monitor after
+    each training step when it is set with Optimizer.set_memory_monitor.
+    """
+
+    def __init__(self, network, optimizers=None, interval=100,
+                 history_budget=2**20):
+        """
+        :param interval: sample every interval training steps
+        :param history_budget: maximum number of bytes of a history before a
+        warning is given
+        """
+        self.network = network
+        self.optimizers = optimizers
+        self.set_interval(interval)
+        self.set_history_budget(history_budget)
+        self.samples = []
+        self.warned = set()
+
+    def set_interval(self, interval):
+        if not isinstance(interval, int):
+            raise TypeError('Expecting an integer for interval, got '
+                            '{}'.format(type(interval)))
+        if interval <= 0:
+            raise ValueError('Expecting a strictly positive interval, got '
+                             '{}'.format(interval))
+        self.interval = interval
+
+    def set_history_budget(self, history_budget):
+        if not isinstance(history_budget, int):
+            raise TypeError('Expecting an integer for history_budget, got '
+                            '{}'.format(type(history_budget)))
+        if history_budget <= 0:
+            raise ValueError('Expecting a strictly positive history_budget, '
+                             'got {}'.format(history_budget))
+        self.history_budget = history_budget
+
+    def sample(self, global_step, force=False):
+        """ Save the number of bytes per owner (network, layers and
+        optimizers) and of all histories at global_step, if global_step is
+        a multiple of interval or force is True.
+        :return: the memory report, or None if no sample was taken
+        """
+        if not force and global_step % self.interval != 0:
+            return None
+        report = memory_report(self.network, self.optimizers)
+        sample = {'global_step': global_step,
+                  'total': int(report['nbytes'].sum())}
+        for owner, nbytes in report.groupby(level='owner')['nbytes'].sum(
+                ).items():
+            sample[owner] = int(nbytes)
+        histories = report[report['history']]
+        for (owner, attribute), nbytes in histories['nbytes'].items():
+            sample['{}/{}'.format(owner, attribute)] = int(nbytes)
+            if nbytes > self.history_budget and \
+                    (owner, attribute) not in self.warned:
+                self.warned.add((owner, attribute))
+                warnings.warn('History {} of {} holds {} bytes at step {}, '
+                              'more than the budget of {} bytes'.format(
+                                  attribute, owner, nbytes, global_step,
+                                  self.history_budget))
+        self.samples.append(sample)
+        return report
+
+    def get_samples(self):
+        """ Return the samples as a DataFrame indexed by global step."""
+        return pd.DataFrame(self.samples).set_index('global_step')
@@ -0,0 +1,109 @@
+"""
+Copyright 2019 Alexander Meulemans
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+"""
+
+import os
+import numpy as np
+import torch
+
+MNIST_MEAN = 0.1307
+MNIST_STD = 0.3081
+
+
+def save_mnist_arrays(images, labels, store_dir, split):
+    """ Save the uint8 images (nb_images x 28 x 28) and labels of one split
+    of MNIST as .npy files: the raw uint8 images, the normalized float32
+    images of size nb_images x 784 x 1 (same normalization as the
+    torchvision transforms used in the experiments) and the one-hot
+    encoded labels of size nb_images x 10 x 1."""
+    if not os.path.exists(store_dir):
+        os.makedirs(store_dir)
+    images = np.asarray(images, dtype=np.uint8).reshape(-1, 28 * 28, 1)
+    labels = np.asarray(labels, dtype=np.int64)
+    normalized = (images.astype(np.float32) / 255. - MNIST_MEAN) / MNIST_STD
+    one_hot = np.zeros((len(labels), 10, 1), dtype=np.float32)
+    one_hot[np.arange(len(labels)), labels, 0] = 1.
+    np.save(os.path.join(store_dir, split + '_images_uint8.npy'), images)
+    np.save(os.path.join(store_dir, split + '_images.npy'), normalized)
+    np.save(os.path.join(store_dir, split + '_targets.npy'), one_hot)
+    np.save(os.path.join(store_dir, split + '_labels.npy'), labels)
+
+
+def convert_mnist(root='./data', store_dir='./data/mnist_store'):
+    """ One-time conversion of the torchvision MNIST dataset (downloaded to
+    root if needed) to a store that can be read by MNISTStore. Splits that
+    are already converted are skipped."""
+    import torchvision
+    for split, train in (('train', True), ('test', False)):
+        if os.path.exists(os.path.join(store_dir, split + '_targets.npy')):
+            continue
+        dataset = torchvision.datasets.MNIST(root=root, train=train,
+                                             download=True)
+        save_mnist_arrays(dataset.data.numpy(), dataset.targets.numpy(),
+                          store_dir, split)
+
+
+class MNISTStore(object):
+    """ Batch iterator over a split of MNIST converted with convert_mnist.
+    The arrays are memory-mapped and each batch is sliced directly from
+    them, already reshaped to batch_size x 784 x 1 and with one-hot targets
+    of size batch_size x 10 x 1, so it can be given to run_mnist instead of
+    a DataLoader."""
+
+    def __init__(self, store_dir='./data/mnist_store', train=True,
+                 batch_size=64, shuffle=None, dtype=torch.float32):
+        """
+        :param shuffle: reshuffle the samples each epoch, True for the
+        training split and False for the test split if None
+        :param dtype: torch.uint8 to iterate over the raw pixel values
+        instead of the normalized images
+        """
+        split = 'train' if train else 'test'
+        if dtype == torch.uint8:
+            images_file = split + '_images_uint8.npy'
+        else:
+            images_file = split + '_images.npy'
+        self.images = np.load(os.path.join(store_dir, images_file),
+                              mmap_mode='r')
+        self.targets = np.load(os.path.join(store_dir, split +
+                                            '_targets.npy'), mmap_mode='r')
+        self.labels = np.load(os.path.join(store_dir, split + '_labels.npy'),
+                              mmap_mode='r')
+        self.set_batch_size(batch_size)
+        self.shuffle = train if shuffle is None else shuffle
+        self.dtype = dtype
+
+    def set_batch_size(self, batch_size):
+        if not isinstance(batch_size, int):
+            raise TypeError("Expecting an integer for batch_size, got "
+                            "{}".format(type(batch_size)))
+        if batch_size <= 0:
+            raise ValueError("Expecting a strictly positive batch_size, got "
+                             "{}".format(batch_size))
+        self.batch_size = batch_size
+
+    def __len__(self):
+        return (len(self.labels) + self.batch_size - 1) // self.batch_size
+
+    def __iter__(self):
+        nb_samples = len(self.labels)
+        if self.shuffle:
+            order = np.random.permutation(nb_samples)
+        for start in range(0, nb_samples, self.batch_size):
+            stop = min(start + self.batch_size, nb_samples)
+            if self.shuffle:
+                # sorted indices read the memory map sequentially
+                indices = np.sort(order[start:stop])
+                images = self.images[indices]
+                targets = self.targets[indices]
+            else:
+                images = np.array(self.images[start:stop])
+                targets = np.array(self.targets[start:stop])
+            yield torch.from_numpy(images).to(self.dtype), \
+                torch.from_numpy(targets)
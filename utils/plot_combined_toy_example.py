@@ -1,5 +1,8 @@
+import sys
+sys.path.append('.')
 import numpy as np
 import matplotlib.pyplot as plt
+from utils.result_store import ResultStore
 
 # log_dir_main = '../figure_data/final_combined_toy_example/'
 log_dir_main = '../logs/final_combined_toy_example_unequal_layers_save/'
@@ -10,47 +13,59 @@ indices = [0,1,2,4,5,6,7,8,9,10,11,13]
 
 # ====== load results =======
 # ====== Save results =======
-train_losses_TP = np.load(log_dir_main + 'train_losses_TP.npy')
-test_losses_TP=np.load(log_dir_main + 'test_losses_TP.npy')
-approx_error_angles_array_TP=np.load(log_dir_main + 'approx_error_angles_array_TP.npy')
-approx_errors_array_TP=np.load(log_dir_main + 'approx_errors_array_TP.npy')
-GN_errors_array_TP=np.load(log_dir_main + 'GN_errors_array_TP.npy')
-TP_errors_array_TP=np.load(log_dir_main + 'TP_errors_array_TP.npy')
-GN_angles_array_TP=np.load(log_dir_main + 'GN_angles_array_TP.npy')
-BP_angles_array_TP=np.load(log_dir_main + 'BP_angles_array_TP.npy')
+# results saved as separate .npy files by older runs of the experiment
+# are imported into the store the first time
+store = ResultStore(log_dir_main + 'result_store')
+if not store.contains():
+    store.import_npy_directory(log_dir_main,
+                               methods=['TP', 'DTP', 'originalTP',
+                                        'originalDTP', 'BP', 'BP_fixed'])
 
-train_losses_DTP=np.load(log_dir_main + 'train_losses_DTP.npy')
-test_losses_DTP=np.load(log_dir_main + 'test_losses_DTP.npy')
-approx_error_angles_array_DTP=np.load(log_dir_main + 'approx_error_angles_array_DTP.npy')
-approx_errors_array_DTP=np.load(log_dir_main + 'approx_errors_array_DTP.npy')
-GN_errors_array_DTP=np.load(log_dir_main + 'GN_errors_array_DTP.npy')
-TP_errors_array_DTP=np.load(log_dir_main + 'TP_errors_array_DTP.npy')
-GN_angles_array_DTP=np.load(log_dir_main + 'GN_angles_array_DTP.npy')
-BP_angles_array_DTP=np.load(log_dir_main + 'BP_angles_array_DTP.npy')
+train_losses_TP = store.load('TP', 'train_losses')
+test_losses_TP = store.load('TP', 'test_losses')
+approx_error_angles_array_TP = store.load('TP', 'approx_error_angles_array')
+approx_errors_array_TP = store.load('TP', 'approx_errors_array')
+GN_errors_array_TP = store.load('TP', 'GN_errors_array')
+TP_errors_array_TP = store.load('TP', 'TP_errors_array')
+GN_angles_array_TP = store.load('TP', 'GN_angles_array')
+BP_angles_array_TP = store.load('TP', 'BP_angles_array')
 
-train_losses_originalTP=np.load(log_dir_main + 'train_losses_originalTP.npy')
-test_losses_originalTP=np.load(log_dir_main + 'test_losses_originalTP.npy')
-approx_error_angles_array_originalTP=np.load(log_dir_main + 'approx_error_angles_array_originalTP.npy')
-approx_errors_array_originalTP=np.load(log_dir_main + 'approx_errors_array_originalTP.npy')
-GN_errors_array_originalTP=np.load(log_dir_main + 'GN_errors_array_originalTP.npy')
-TP_errors_array_originalTP=np.load(log_dir_main + 'TP_errors_array_originalTP.npy')
-GN_angles_array_originalTP=np.load(log_dir_main + 'GN_angles_array_originalTP.npy')
-BP_angles_array_originalTP=np.load(log_dir_main + 'BP_angles_array_originalTP.npy')
+train_losses_DTP = store.load('DTP', 'train_losses')
+test_losses_DTP = store.load('DTP', 'test_losses')
+approx_error_angles_array_DTP = store.load('DTP', 'approx_error_angles_array')
+approx_errors_array_DTP = store.load('DTP', 'approx_errors_array')
+GN_errors_array_DTP = store.load('DTP', 'GN_errors_array')
+TP_errors_array_DTP = store.load('DTP', 'TP_errors_array')
+GN_angles_array_DTP = store.load('DTP', 'GN_angles_array')
+BP_angles_array_DTP = store.load('DTP', 'BP_angles_array')
 
-train_losses_originalDTP=np.load(log_dir_main + 'train_losses_originalDTP.npy')
-test_losses_originalDTP=np.load(log_dir_main + 'test_losses_originalDTP.npy')
-approx_error_angles_array_originalDTP=np.load(log_dir_main + 'approx_error_angles_array_originalDTP.npy')
-approx_errors_array_originalDTP=np.load(log_dir_main + 'approx_errors_array_originalDTP.npy')
-GN_errors_array_originalDTP=np.load(log_dir_main + 'GN_errors_array_originalDTP.npy')
-TP_errors_array_originalDTP=np.load(log_dir_main + 'TP_errors_array_originalDTP.npy')
-GN_angles_array_originalDTP=np.load(log_dir_main + 'GN_angles_array_originalDTP.npy')
-BP_angles_array_originalDTP=np.load(log_dir_main + 'BP_angles_array_originalDTP.npy')
+train_losses_originalTP = store.load('originalTP', 'train_losses')
+test_losses_originalTP = store.load('originalTP', 'test_losses')
+approx_error_angles_array_originalTP = store.load('originalTP',
+                                                  'approx_error_angles_array')
+approx_errors_array_originalTP = store.load('originalTP',
+                                            'approx_errors_array')
+GN_errors_array_originalTP = store.load('originalTP', 'GN_errors_array')
+TP_errors_array_originalTP = store.load('originalTP', 'TP_errors_array')
+GN_angles_array_originalTP = store.load('originalTP', 'GN_angles_array')
+BP_angles_array_originalTP = store.load('originalTP', 'BP_angles_array')
 
-train_losses_BP=np.load(log_dir_main + 'train_losses_BP.npy')
-test_losses_BP=np.load(log_dir_main + 'test_losses_BP.npy')
+train_losses_originalDTP = store.load('originalDTP', 'train_losses')
+test_losses_originalDTP = store.load('originalDTP', 'test_losses')
+approx_error_angles_array_originalDTP = store.load('originalDTP',
+                                                   'approx_error_angles_array')
+approx_errors_array_originalDTP = store.load('originalDTP',
+                                             'approx_errors_array')
+GN_errors_array_originalDTP = store.load('originalDTP', 'GN_errors_array')
+TP_errors_array_originalDTP = store.load('originalDTP', 'TP_errors_array')
+GN_angles_array_originalDTP = store.load('originalDTP', 'GN_angles_array')
+BP_angles_array_originalDTP = store.load('originalDTP', 'BP_angles_array')
 
-train_losses_BP_fixed=np.load(log_dir_main + 'train_losses_BP_fixed.npy')
-test_losses_BP_fixed=np.load(log_dir_main + 'test_losses_BP_fixed.npy')
+train_losses_BP = store.load('BP', 'train_losses')
+test_losses_BP = store.load('BP', 'test_losses')
+
+train_losses_BP_fixed = store.load('BP_fixed', 'train_losses')
+test_losses_BP_fixed = store.load('BP_fixed', 'test_losses')
 
 # train_losses_TP = train_losses_TP[indices,:]
 # test_losses_TP=test_losses_TP[indices,:]
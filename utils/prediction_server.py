@@ -0,0 +1,311 @@
+"""
+Copyright 2019 Alexander Meulemans
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+"""
+
+import json
+import queue
+import threading
+import time
+import urllib.request
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+import torch
+
+
+def get_latency_statistics(latencies, elapsed_time):
+    """ Return the number of requests, the throughput (requests/sec) and
+    the mean and 50th, 90th and 99th percentile latency in milliseconds."""
+    latencies = 1e3 * np.array(latencies)
+    statistics = {'nb_requests': len(latencies),
+                  'requests_per_sec': len(latencies) / elapsed_time
+                  if elapsed_time > 0 else 0.}
+    if len(latencies) > 0:
+        statistics.update({
+            'latency_mean_ms': float(latencies.mean()),
+            'latency_p50_ms': float(np.percentile(latencies, 50)),
+            'latency_p90_ms': float(np.percentile(latencies, 90)),
+            'latency_p99_ms': float(np.percentile(latencies, 99))})
+    return statistics
+
+
+class MicroBatcher(object):
+    """ Coalesces concurrent single-sample requests into batches for a
+    predictor, e.g. a FrozenNetwork. A worker thread waits for the first
+    request, collects the requests that arrive within max_latency seconds
+    after it (or until max_batch_size requests are collected), predicts them
+    as one batch and sets the results of their futures."""
+
+    def __init__(self, predictor, in_dim, max_batch_size=64,
+                 max_latency=0.005):
+        """
+        :param predictor: function that maps a batch_size x in_dim tensor to
+        a batch_size x out_dim tensor, e.g. FrozenNetwork.predict
+        :param in_dim: input dimension of the predictor, samples of another
+        size are rejected before they are batched with other requests
+        :param max_latency: maximum time in seconds that a request waits for
+        other requests to fill its batch
+        """
+        if not isinstance(max_batch_size, int):
+            raise TypeError('Expecting an integer for max_batch_size, got '
+                            '{}'.format(type(max_batch_size)))
+        if max_batch_size <= 0:
+            raise ValueError('Expecting a strictly positive max_batch_size, '
+                             'got {}'.format(max_batch_size))
+        if max_latency < 0:
+            raise ValueError('Expecting a positive max_latency, got '
+                             '{}'.format(max_latency))
+        self.predictor = predictor
+        self.in_dim = in_dim
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        self.requests = queue.Queue()
+        self.lock = threading.Lock()
+        self.closed = False
+        self.reset_statistics()
+        self.worker = threading.Thread(target=self.run, daemon=True)
+        self.worker.start()
+
+    def reset_statistics(self):
+        with self.lock:
+            self.latencies = []
+            self.batch_sizes = []
+            self.start_time = time.perf_counter()
+
+    def submit(self, sample):
+        """ Queue a single sample (a tensor of size in_dim) for prediction.
+        :return: a Future with the output of the sample
+        """
+        if not isinstance(sample, torch.Tensor):
+            raise TypeError('Expecting a tensor for sample, got '
+                            '{}'.format(type(sample)))
+        if not tuple(sample.shape) == (self.in_dim,):
+            raise ValueError('Expecting a sample of size {}, got '
+                             '{}'.format(self.in_dim, tuple(sample.shape)))
+        future = Future()
+        with self.lock:
+            # after close, the worker thread doesn't serve the queue anymore
+            if self.closed:
+                raise RuntimeError('Can not submit samples to a closed '
+                                   'MicroBatcher')
+            self.requests.put((sample, future, time.perf_counter()))
+        return future
+
+    def predict(self, sample):
+        """ Return the output of the predictor for sample, predicted in a
+        batch with the concurrent requests."""
+        return self.submit(sample).result()
+
+    def close(self):
+        """ Stop the worker thread after the queued requests."""
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            self.requests.put(None)
+        self.worker.join()
+
+    def run(self):
+        while True:
+            request = self.requests.get()
+            if request is None:
+                return
+            batch = [request]
+            deadline = request[2] + self.max_latency
+            stop = False
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - time.perf_counter()
+                try:
+                    if timeout > 0:
+                        request = self.requests.get(timeout=timeout)
+                    else:
+                        request = self.requests.get_nowait()
+                except queue.Empty:
+                    break
+                if request is None:
+                    stop = True
+                    break
+                batch.append(request)
+            self.predict_batch(batch)
+            if stop:
+                return
+
+    def predict_batch(self, batch):
+        try:
+            outputs = self.predictor(torch.stack([sample for sample, _, _
+                                                  in batch]))
+        except Exception as e:
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+        end = time.perf_counter()
+        for (_, future, submit_time), output in zip(batch, outputs):
+            future.set_result(output)
+        with self.lock:
+            self.latencies += [end - submit_time for _, _, submit_time
+                               in batch]
+            self.batch_sizes.append(len(batch))
+
+    def get_statistics(self):
+        """ Return the throughput, the latency percentiles (from the
+        submission of a request until its output is computed) and the mean
+        batch size since the last reset_statistics."""
+        with self.lock:
+            statistics = get_latency_statistics(
+                self.latencies, time.perf_counter() - self.start_time)
+            statistics['nb_batches'] = len(self.batch_sizes)
+            statistics['batch_size_mean'] = float(np.mean(
+                self.batch_sizes)) if self.batch_sizes else 0.
+        return statistics
+
+
+class PredictionRequestHandler(BaseHTTPRequestHandler):
+    """ POST /predict with {"input": [...]} returns {"output": [...],
+    "class": ...}, GET /statistics returns MicroBatcher.get_statistics."""
+
+    def do_POST(self):
+        if not self.path == '/predict':
+            self.send_json({'error': 'unknown path {}'.format(self.path)},
+                           404)
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length))
+            sample = torch.tensor(request['input'],
+                                  dtype=torch.float32).reshape(-1)
+            # invalid samples are rejected by submit, before they are
+            # batched with (and fail) the requests of other clients
+            future = self.server.batcher.submit(sample)
+        except Exception as e:
+            self.send_json({'error': '{}: {}'.format(type(e).__name__, e)},
+                           400)
+            return
+        try:
+            output = future.result()
+        except Exception as e:
+            self.send_json({'error': '{}: {}'.format(type(e).__name__, e)},
+                           500)
+            return
+        self.send_json({'output': output.tolist(),
+                        'class': int(torch.argmax(output))})
+
+    def do_GET(self):
+        if self.path == '/statistics':
+            self.send_json(self.server.batcher.get_statistics())
+        else:
+            self.send_json({'error': 'unknown path {}'.format(self.path)},
+                           404)
+
+    def send_json(self, content, code=200):
+        body = json.dumps(content).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # don't print a line per request
+        pass
+
+
+class ThreadingPredictionHTTPServer(ThreadingHTTPServer):
+    # listen backlog, the default of 5 resets the connections of many
+    # concurrent clients
+    request_queue_size = 128
+    daemon_threads = True
+
+
+class PredictionServer(object):
+    """ Local HTTP prediction server for a predictor, e.g. a FrozenNetwork
+    (see Network.freeze), that batches the concurrent requests with a
+    MicroBatcher. Every request is handled in its own thread and waits for
+    the output of its batch.
+    """
+
+    def __init__(self, predictor, in_dim, host='127.0.0.1', port=0,
+                 max_batch_size=64, max_latency=0.005):
+        """
+        :param in_dim: input dimension of the predictor (see MicroBatcher)
+        :param host: address to listen on, by default only local processes
+        can connect
+        :param port: port to listen on, 0 to pick a free port (see url)
+        """
+        self.batcher = MicroBatcher(predictor, in_dim,
+                                    max_batch_size=max_batch_size,
+                                    max_latency=max_latency)
+        self.server = ThreadingPredictionHTTPServer((host, port),
+                                                    PredictionRequestHandler)
+        self.server.batcher = self.batcher
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return 'http://{}:{}'.format(host, port)
+
+    def start(self):
+        """ Serve the requests in a background thread."""
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       daemon=True)
+        self.thread.start()
+        return self
+
+    def serve_forever(self):
+        self.server.serve_forever()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.batcher.close()
+        if self.thread is not None:
+            self.thread.join()
+
+
+def request_prediction(url, sample, timeout=10.):
+    """ Return the response ({"output": ..., "class": ...}) of the
+    prediction server at url for sample."""
+    body = json.dumps({'input': [float(x) for x in
+                                 np.asarray(sample).reshape(-1)]}).encode()
+    request = urllib.request.Request(
+        url + '/predict', data=body,
+        headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+def get_server_statistics(url, timeout=10.):
+    with urllib.request.urlopen(url + '/statistics',
+                                timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+def generate_load(url, samples, nb_clients=8):
+    """ Send a prediction request for every sample to the server at url from
+    nb_clients concurrent clients, each sending its next request when it
+    got the response of the previous one.
+    :return: the responses (in the order of samples) and the client side
+    throughput and latency statistics (see get_latency_statistics)
+    """
+    latencies = [None] * len(samples)
+    responses = [None] * len(samples)
+
+    def client(index):
+        for i in range(index, len(samples), nb_clients):
+            start = time.perf_counter()
+            responses[i] = request_prediction(url, samples[i])
+            latencies[i] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=nb_clients) as executor:
+        for future in [executor.submit(client, i)
+                       for i in range(nb_clients)]:
+            future.result()
+    return responses, get_latency_statistics(latencies,
+                                             time.perf_counter() - start)
@@ -0,0 +1,111 @@
+"""
+Copyright 2019 Alexander Meulemans
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+"""
+
+import queue
+import threading
+import time
+import torch
+
+
+class BatchPrefetcher(object):
+    """ Iterates over batches that are prepared by a background thread.
+    The thread takes the batches from the given iterable, applies transform
+    to them (e.g. reshaping, one-hot encoding, dtype or device conversion)
+    and keeps up to nb_prefetch prepared batches in a bounded queue, while
+    the main thread does the training step on the current batch. The time
+    the main thread spends waiting for data is accumulated in wait_time.
+    With nb_prefetch=0, the batches are prepared synchronously.
+    """
+
+    def __init__(self, batches, transform=None, nb_prefetch=2,
+                 pin_memory=False):
+        """
+        :param batches: iterable of batches
+        :param transform: function applied to each batch, the identity if
+        None
+        :param pin_memory: copy the prepared tensors to page-locked memory,
+        such that the copies to the GPU can be asynchronous
+        """
+        if not isinstance(nb_prefetch, int) or nb_prefetch < 0:
+            raise ValueError("Expecting a positive integer for nb_prefetch, "
+                             "got {}".format(nb_prefetch))
+        self.batches = batches
+        self.transform = transform
+        self.nb_prefetch = nb_prefetch
+        self.pin_memory = pin_memory and torch.cuda.is_available()
+        self.wait_time = 0.
+
+    def prepare(self, batch):
+        if self.transform is not None:
+            batch = self.transform(*batch) if isinstance(batch, tuple) \
+                else self.transform(batch)
+        if self.pin_memory:
+            batch = tuple(tensor.pin_memory() for tensor in batch) \
+                if isinstance(batch, tuple) else batch.pin_memory()
+        return batch
+
+    def __len__(self):
+        return len(self.batches)
+
+    def __iter__(self):
+        if self.nb_prefetch == 0:
+            iterator = iter(self.batches)
+            while True:
+                start = time.perf_counter()
+                try:
+                    batch = self.prepare(next(iterator))
+                except StopIteration:
+                    return
+                finally:
+                    self.wait_time += time.perf_counter() - start
+                yield batch
+
+        prepared = queue.Queue(maxsize=self.nb_prefetch)
+        stop = threading.Event()
+        end_of_data = object()
+
+        def producer():
+            try:
+                for batch in self.batches:
+                    item = self.prepare(batch)
+                    while not stop.is_set():
+                        try:
+                            prepared.put(item, timeout=0.1)
+                            break
+                        except queue.Full:
+                            pass
+                    if stop.is_set():
+                        return
+                item = end_of_data
+            except Exception as exception:
+                item = exception
+            while not stop.is_set():
+                try:
+                    prepared.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    pass
+
+        thread = threading.Thread(target=producer, daemon=True)
+        thread.start()
+        try:
+            while True:
+                start = time.perf_counter()
+                item = prepared.get()
+                self.wait_time += time.perf_counter() - start
+                if item is end_of_data:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            # also stops the thread if the consumer breaks out of the loop
+            stop.set()
+            thread.join()
@@ -0,0 +1,333 @@
+"""
+Copyright 2019 Alexander Meulemans
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+"""
+
+import json
+import math
+import os
+import threading
+import time
+from functools import wraps
+import numpy as np
+import pandas as pd
+from utils.benchmark import AllocationCounter
+
+
+class CallStatistics(object):
+    """ Streaming statistics of the calls of a profiled method: the number
+    of calls, the sums, minimum and maximum of the durations, the sums of
+    the allocations, and the counts of the durations in fixed logarithmic
+    bins. The memory is constant, regardless of the number of calls. The
+    percentiles and histograms are computed from the bins, the percentiles
+    having a relative error of at most 10**(1/bins_per_decade) - 1 (5%).
+    """
+
+    # the bins cover 100ns to 1000s, shorter (resp. longer) durations are
+    # counted in the first (resp. last) bin
+    min_time = 1e-7
+    max_time = 1e3
+    bins_per_decade = 50
+    nb_bins = int(round(math.log10(max_time / min_time))) * bins_per_decade
+
+    def __init__(self):
+        self.nb_calls = 0
+        self.total_time = 0.
+        self.total_squared_time = 0.
+        self.min = math.inf
+        self.max = -math.inf
+        self.nb_allocations = 0
+        self.allocated_bytes = 0
+        self.counts = np.zeros(self.nb_bins, dtype=np.int64)
+
+    def get_edges(self, start, stop, step=1):
+        """ Return the edges of the bins start:stop:step."""
+        return self.min_time * 10. ** (np.arange(start, stop + 1, step) /
+                                       self.bins_per_decade)
+
+    def add(self, duration, nb_allocations=0, allocated_bytes=0):
+        self.nb_calls += 1
+        self.total_time += duration
+        self.total_squared_time += duration ** 2
+        self.min = min(self.min, duration)
+        self.max = max(self.max, duration)
+        self.nb_allocations += nb_allocations
+        self.allocated_bytes += allocated_bytes
+        index = int(math.floor(math.log10(max(duration, self.min_time) /
+                                          self.min_time) *
+                               self.bins_per_decade))
+        self.counts[min(index, self.nb_bins - 1)] += 1
+
+    def merge(self, other):
+        """ Add the calls of the CallStatistics other."""
+        self.nb_calls += other.nb_calls
+        self.total_time += other.total_time
+        self.total_squared_time += other.total_squared_time
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.nb_allocations += other.nb_allocations
+        self.allocated_bytes += other.allocated_bytes
+        self.counts += other.counts
+
+    def mean(self):
+        return self.total_time / self.nb_calls
+
+    def percentile(self, q):
+        """ Return the q-th percentile of the durations, interpolated
+        geometrically in the bin that contains it."""
+        if self.nb_calls == 0:
+            raise ValueError('No calls recorded')
+        rank = q / 100. * self.nb_calls
+        cumulative_counts = np.cumsum(self.counts)
+        index = min(int(np.searchsorted(cumulative_counts, rank)),
+                    self.nb_bins - 1)
+        if self.counts[index] == 0:
+            # rank 0 is below the first call
+            return self.min
+        fraction = (rank - cumulative_counts[index] + self.counts[index]) / \
+            self.counts[index]
+        lower, upper = self.get_edges(index, index + 1)
+        value = lower * (upper / lower) ** fraction
+        return min(max(value, self.min), self.max)
+
+    def histogram(self, bins=20):
+        """ Return the counts and the edges (in seconds) of at most bins
+        logarithmically spaced bins between the minimum and the maximum
+        duration, merging adjacent bins of the fixed binning."""
+        if self.nb_calls == 0:
+            raise ValueError('No calls recorded')
+        nonzero = np.flatnonzero(self.counts)
+        start, stop = nonzero[0], nonzero[-1] + 1
+        step = -(-(stop - start) // bins)
+        nb_merged_bins = -(-(stop - start) // step)
+        counts = np.zeros(nb_merged_bins * step, dtype=np.int64)
+        counts[:stop - start] = self.counts[start:stop]
+        counts = counts.reshape(nb_merged_bins, step).sum(1)
+        edges = self.get_edges(start, start + nb_merged_bins * step, step)
+        # the extreme durations lie in the first and last bin
+        edges[0], edges[-1] = self.min, self.max
+        return counts, edges
+
+
+class NetworkProfiler(object):
+    """ Records the wall-clock time (and optionally the tensor allocations,
+    see utils.benchmark.AllocationCounter) of every layer method call of a
+    network, grouped by the network phase in which the call happened, e.g.
+    the calls of TargetPropLeakyReluLayer.propagate_backward during
+    Network.propagate_backward. Use Network.enable_profiling to install the
+    profiler on a network: the profiled methods are then wrapped on the
+    instances, and Network.disable_profiling removes the wrappers again, so
+    a network without profiler has no overhead.
+    The times are inclusive: a profiled method that calls another profiled
+    method also counts the time of that call.
+    """
+
+    # network methods that define the phases
+    network_methods = ['propagate_forward', 'propagate_backward',
+                       'compute_forward_gradients', 'update_parameters',
+                       'update_parameters_with_velocity', 'save_state']
+    layer_methods = ['propagate_forward', 'compute_backward_output',
+                     'compute_GN_error', 'propagate_backward',
+                     'propagate_GN_error', 'propagate_real_GN_error',
+                     'propagate_BP_error', 'compute_forward_gradients',
+                     'compute_forward_gradient_velocities',
+                     'update_forward_parameters',
+                     'update_forward_parameters_with_velocity',
+                     'update_backward_parameters', 'save_state']
+
+    def __init__(self, count_allocations=False, max_trace_events=100000):
+        """
+        :param count_allocations: also count the tensors allocated by each
+        call. This slows down the profiled calls considerably, so the times
+        are not representative when it is on.
+        :param max_trace_events: maximum number of calls that are kept for
+        the Chrome trace (see save_chrome_trace). The statistics of the
+        table and the histograms include all calls, they are kept as
+        streaming CallStatistics.
+        """
+        self.count_allocations = count_allocations
+        self.max_trace_events = max_trace_events
+        self.network = None
+        self.phase = None
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """ Forget all recorded calls."""
+        self.records = {}
+        self.trace_events = []
+        self.start_time = time.perf_counter()
+
+    def install(self, network):
+        """ Wrap the phase methods of network and the profiled methods of
+        its layers (see Network.enable_profiling)."""
+        self.network = network
+        for method in self.network_methods:
+            if hasattr(network, method):
+                setattr(network, method, self.wrap_phase(network, method))
+        for index, layer in enumerate(network.layers):
+            for method in self.layer_methods:
+                if hasattr(layer, method):
+                    setattr(layer, method,
+                            self.wrap_layer_method(layer, index, method))
+
+    def uninstall(self):
+        """ Remove the wrappers installed by install."""
+        network = self.network
+        for obj in [network] + network.layers:
+            for method in self.network_methods + self.layer_methods:
+                # the wrappers are instance attributes that shadow the
+                # methods of the class
+                if method in obj.__dict__:
+                    delattr(obj, method)
+        self.network = None
+
+    def wrap_phase(self, network, method):
+        function = getattr(network, method)
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            # network methods can call each other, the outermost call is
+            # the phase
+            if self.phase is not None:
+                return function(*args, **kwargs)
+            self.phase = method
+            try:
+                return self.record(method, -1, 'network', method, function,
+                                   args, kwargs)
+            finally:
+                self.phase = None
+        return wrapper
+
+    def wrap_layer_method(self, layer, index, method):
+        function = getattr(layer, method)
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            return self.record(self.phase, index, layer.name, method,
+                               function, args, kwargs)
+        return wrapper
+
+    def record(self, phase, index, name, method, function, args, kwargs):
+        if self.count_allocations:
+            counter = AllocationCounter()
+            start = time.perf_counter()
+            with counter:
+                output = function(*args, **kwargs)
+            end = time.perf_counter()
+            allocations = (counter.nb_allocations, counter.allocated_bytes)
+        else:
+            start = time.perf_counter()
+            output = function(*args, **kwargs)
+            end = time.perf_counter()
+            allocations = (0, 0)
+        key = (phase, index, name, method)
+        with self.lock:
+            if key not in self.records:
+                self.records[key] = CallStatistics()
+            self.records[key].add(end - start, *allocations)
+            if len(self.trace_events) < self.max_trace_events:
+                self.trace_events.append(
+                    (phase, name, method, start, end,
+                     threading.get_ident()) + allocations)
+        return output
+
+    def get_statistics(self, phase, name, method):
+        """ Return the CallStatistics of all recorded calls of method of the
+        layer with the given name in phase."""
+        statistics = CallStatistics()
+        for key, record in self.records.items():
+            if key[0] == phase and key[2] == name and key[3] == method:
+                statistics.merge(record)
+        return statistics
+
+    def table(self):
+        """ Return a DataFrame with the number of calls, the total, mean,
+        median and 95th percentile time (in milliseconds) and the mean
+        number of allocated tensors and bytes per call of every profiled
+        method, ordered by phase and layer. The percentiles are approximated
+        from the bins of the CallStatistics."""
+        rows = []
+        for (phase, index, name, method), record in self.records.items():
+            rows.append({'phase': phase, 'layer_index': index,
+                         'layer': name, 'method': method,
+                         'nb_calls': record.nb_calls,
+                         'total_ms': 1e3 * record.total_time,
+                         'mean_ms': 1e3 * record.mean(),
+                         'median_ms': 1e3 * record.percentile(50),
+                         'p95_ms': 1e3 * record.percentile(95),
+                         'nb_allocations': record.nb_allocations /
+                         record.nb_calls,
+                         'allocated_bytes': record.allocated_bytes /
+                         record.nb_calls})
+        columns = ['phase', 'layer_index', 'layer', 'method', 'nb_calls',
+                   'total_ms', 'mean_ms', 'median_ms', 'p95_ms',
+                   'nb_allocations', 'allocated_bytes']
+        frame = pd.DataFrame(rows, columns=columns)
+        frame['phase'] = frame['phase'].fillna('none')
+        return frame.sort_values(['phase', 'layer_index']).set_index(
+            ['phase', 'layer_index', 'layer', 'method'])
+
+    def histogram(self, phase, name, method, bins=20):
+        """ Return a histogram (counts and bin edges in seconds, as
+        np.histogram) of the durations of the calls of method of the layer
+        with the given name in phase, with at most bins logarithmically
+        spaced bins (see CallStatistics.histogram)."""
+        statistics = self.get_statistics(phase, name, method)
+        if statistics.nb_calls == 0:
+            raise ValueError('No calls recorded for {} of {} in phase '
+                             '{}'.format(method, name, phase))
+        return statistics.histogram(bins)
+
+    def save_tensorboard(self, writer, global_step):
+        """ Save the mean time per call (in milliseconds) of every profiled
+        method as a scalar and the durations of its calls as a histogram
+        in writer, under profiling/<phase>/<layer>/<method>."""
+        for (phase, index, name, method), record in self.records.items():
+            tag = 'profiling/{}/{}/{}'.format(phase, name, method)
+            writer.add_scalar(tag=tag + '_ms',
+                              scalar_value=1e3 * record.mean(),
+                              global_step=global_step)
+            counts, edges = record.histogram(bins=30)
+            writer.add_histogram_raw(
+                tag=tag + '_hist_ms', min=1e3 * record.min,
+                max=1e3 * record.max, num=record.nb_calls,
+                sum=1e3 * record.total_time,
+                sum_squares=1e6 * record.total_squared_time,
+                bucket_limits=1e3 * edges[1:], bucket_counts=counts,
+                global_step=global_step)
+            if self.count_allocations:
+                writer.add_scalar(tag=tag + '_allocations',
+                                  scalar_value=record.nb_allocations /
+                                  record.nb_calls,
+                                  global_step=global_step)
+
+    def save_chrome_trace(self, path):
+        """ Save the recorded calls in the Chrome trace event format, which
+        can be opened as a timeline in chrome://tracing or Perfetto. Each
+        thread that computed layers is a separate row."""
+        thread_ids = {}
+        events = []
+        for phase, name, method, start, end, thread, nb_allocations, \
+                allocated_bytes in self.trace_events:
+            event = {'name': '{}.{}'.format(name, method) if
+                     name != 'network' else method,
+                     'cat': phase if phase is not None else 'none',
+                     'ph': 'X', 'pid': 0,
+                     'tid': thread_ids.setdefault(thread, len(thread_ids)),
+                     'ts': 1e6 * (start - self.start_time),
+                     'dur': 1e6 * (end - start)}
+            if self.count_allocations:
+                event['args'] = {'nb_allocations': nb_allocations,
+                                 'allocated_bytes': allocated_bytes}
+            events.append(event)
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
@@ -0,0 +1,188 @@
+"""
+Copyright 2019 Alexander Meulemans
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import numpy as np
+
+INDEX_FILE = 'index.json'
+CONFIG_FILE = 'config.json'
+
+
+def get_config_hash(config):
+    """ Return a hash of a run configuration, a dictionary of JSON
+    serializable values (e.g. the user variables of an experiment
+    script)."""
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode()) \
+        .hexdigest()[:16]
+
+
+class ResultStore(object):
+    """ Store of the results of one experiment: a directory with one .npy
+    file per (method, metric) and a JSON index. The first axis of each
+    array runs over the seeds (random iterations) of the experiment, such
+    that results can be queried by (method, metric, seed). The arrays are
+    loaded lazily as read-only memory maps and cached, so figure scripts
+    can be regenerated from the store without retraining. The run
+    configuration of the stored results is kept with them (see set_config),
+    such that scripts sharing a store only reuse results of the same
+    configuration (see matches_config).
+    """
+
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        self.arrays = {}
+        index_path = os.path.join(store_dir, INDEX_FILE)
+        if os.path.exists(index_path):
+            with open(index_path) as f:
+                self.index = json.load(f)
+        else:
+            self.index = {}
+        config_path = os.path.join(store_dir, CONFIG_FILE)
+        if os.path.exists(config_path):
+            with open(config_path) as f:
+                self.config_hash = json.load(f)['hash']
+        else:
+            self.config_hash = None
+
+    @staticmethod
+    def get_key(method, metric):
+        return method + '/' + metric
+
+    def save(self, method, metric, array, seeds=None):
+        """ Save the results of method for metric.
+        :param array: array with one row per seed
+        :param seeds: labels of the rows of array, range(len(array)) if None
+        """
+        array = np.atleast_1d(np.asarray(array))
+        if seeds is None:
+            seeds = list(range(array.shape[0]))
+        if not len(seeds) == array.shape[0]:
+            raise ValueError('Expecting one seed for each row of the array, '
+                             'got {} seeds for an array of shape '
+                             '{}'.format(len(seeds), array.shape))
+        if not os.path.exists(self.store_dir):
+            os.makedirs(self.store_dir)
+        key = self.get_key(method, metric)
+        file_name = '{}__{}.npy'.format(method, metric)
+        # write to a temporary file and move it in place, such that readers
+        # never see a partially written array
+        fd, tmp_path = tempfile.mkstemp(suffix='.npy', dir=self.store_dir)
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, array)
+        os.replace(tmp_path, os.path.join(self.store_dir, file_name))
+        self.index[key] = {'method': method, 'metric': metric,
+                           'file': file_name, 'shape': list(array.shape),
+                           'dtype': str(array.dtype),
+                           'seeds': [seed.item() if isinstance(seed,
+                                                               np.generic)
+                                     else seed for seed in seeds]}
+        self.arrays.pop(key, None)
+        self.write_index()
+
+    def save_all(self, results):
+        """ Save a dictionary {(method, metric): array} of results."""
+        for (method, metric), array in results.items():
+            self.save(method, metric, array)
+
+    def write_index(self):
+        self.write_json(self.index, INDEX_FILE)
+
+    def write_json(self, content, file_name):
+        if not os.path.exists(self.store_dir):
+            os.makedirs(self.store_dir)
+        fd, tmp_path = tempfile.mkstemp(suffix='.json', dir=self.store_dir)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(content, f, indent=1)
+        os.replace(tmp_path, os.path.join(self.store_dir, file_name))
+
+    def matches_config(self, config):
+        """ Return True if the store contains results of the run
+        configuration config (see set_config)."""
+        return self.contains() and \
+            self.config_hash == get_config_hash(config)
+
+    def set_config(self, config):
+        """ Set the run configuration of the results that are saved next.
+        The results of another configuration are removed from the store.
+        :param config: dictionary of JSON serializable values
+        """
+        config_hash = get_config_hash(config)
+        if config_hash == self.config_hash:
+            return
+        self.clear()
+        self.config_hash = config_hash
+        self.write_json({'hash': config_hash, 'config': config}, CONFIG_FILE)
+
+    def clear(self):
+        """ Remove all results from the store."""
+        for entry in self.index.values():
+            path = os.path.join(self.store_dir, entry['file'])
+            if os.path.exists(path):
+                os.remove(path)
+        self.index = {}
+        self.arrays = {}
+        if os.path.exists(self.store_dir):
+            self.write_index()
+
+    def load(self, method, metric, seed=None):
+        """ Return the (memory-mapped) results of method for metric, or only
+        the row of the given seed."""
+        key = self.get_key(method, metric)
+        if key not in self.index:
+            raise KeyError('No results stored for method {} and metric {} in '
+                           '{}'.format(method, metric, self.store_dir))
+        if key not in self.arrays:
+            self.arrays[key] = np.load(
+                os.path.join(self.store_dir, self.index[key]['file']),
+                mmap_mode='r')
+        array = self.arrays[key]
+        if seed is None:
+            return array
+        seeds = self.index[key]['seeds']
+        if seed not in seeds:
+            raise KeyError('No results stored for seed {} of method {} and '
+                           'metric {}'.format(seed, method, metric))
+        return array[seeds.index(seed)]
+
+    def query(self, method=None, metric=None):
+        """ Return the (method, metric) pairs in the store, optionally
+        restricted to the given method and/or metric."""
+        return [(entry['method'], entry['metric'])
+                for entry in self.index.values()
+                if (method is None or entry['method'] == method) and
+                (metric is None or entry['metric'] == metric)]
+
+    def contains(self, method=None, metric=None):
+        return len(self.query(method, metric)) > 0
+
+    def import_npy_directory(self, directory, methods):
+        """ Import the results saved by the experiment scripts as separate
+        <metric>_<method>.npy files in directory.
+        :param methods: names of the methods, used to split the file names
+        :return: the imported (method, metric) pairs
+        """
+        # longest names first, such that e.g. BP_fixed is not matched as BP
+        methods = sorted(methods, key=len, reverse=True)
+        imported = []
+        for file_name in sorted(os.listdir(directory)):
+            if not file_name.endswith('.npy'):
+                continue
+            name = file_name[:-len('.npy')]
+            for method in methods:
+                if name.endswith('_' + method):
+                    metric = name[:-len(method) - 1]
+                    self.save(method, metric,
+                              np.load(os.path.join(directory, file_name)))
+                    imported.append((method, metric))
+                    break
+        return imported